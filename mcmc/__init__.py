@@ -1 +1,2 @@
 from .mcmc import MCMC, get_adsorption_coords, get_random_idx
+from .replica import ReplicaExchange
@@ -1,11 +1,20 @@
 import copy
+import functools
+import hashlib
 import json
 import logging
 import os
-from collections import Counter
+from collections import OrderedDict
 
 import ase
+import ase.geometry
 import numpy as np
+import torch
+from ase.calculators.calculator import Calculator, all_changes
+from ase.calculators.lammps import Prism
+from ase.constraints import FixAtoms
+from ase.data import atomic_numbers, chemical_symbols
+from ase.neighborlist import primitive_neighbor_list
 from ase.optimize import BFGS, FIRE
 from ase.optimize.bfgslinesearch import BFGSLineSearch
 from ase.optimize.sciopt import SciPyFminCG
@@ -16,12 +25,20 @@ from lammps import (
     LMP_TYPE_VECTOR,
     lammps,
 )
-from nff.io.ase import AtomsBatch
+from nff.io.ase import AtomsBatch, EnsembleNFF
 from nff.utils.constants import EV_TO_KCAL_MOL, HARTREE_TO_KCAL_MOL
+from nff.utils.cuda import batch_to
 
 from .utils import get_atoms_batch
 
 HARTREE_TO_EV = HARTREE_TO_KCAL_MOL / EV_TO_KCAL_MOL
+# size of the energy units of NFF models in kcal/mol
+UNITS_IN_KCAL_MOL = {
+    "kcal/mol": 1.0,
+    "eV": EV_TO_KCAL_MOL,
+    "atomic": HARTREE_TO_KCAL_MOL,
+    "Hartree": HARTREE_TO_KCAL_MOL,
+}
 # threshold for unrelaxed energy
 ENERGY_THRESHOLD = 200  # eV
 MAX_FORCE_THRESHOLD = 1000  # eV/Angstrom
@@ -32,16 +49,126 @@ OPT_TEMPLATE = f"{curr_dir}/lammps_opt_template.txt"
 ENERGY_TEMPLATE = f"{curr_dir}/lammps_energy_template.txt"
 
 
+def load_lammps_config(config_dir=None):
+    """Load the LAMMPS config file, assumed to be stored in the folder you run lammps."""
+    if not config_dir:
+        config_dir = os.getcwd()
+    with open(f"{config_dir}/lammps_config.json") as f:
+        config = json.load(f)
+    return config
+
+
+def format_lammps_template(
+    lammps_template, config, lammps_data_file, lammps_out_file, steps=100, **kwargs
+):
+    """Fill in the placeholders of a LAMMPS input template.
+
+    Parameters
+    ----------
+    lammps_template : str
+        Contents of the LAMMPS input template
+    config : dict
+        LAMMPS config with `potential_file`, `atoms` and `bulk_index`
+    lammps_data_file : str
+        Path of the data file read by LAMMPS
+    lammps_out_file : str
+        Path of the data file written by LAMMPS
+    steps : int, optional
+        Maximum number of minimization steps, by default 100
+
+    Returns
+    -------
+    str
+        LAMMPS input commands
+    """
+    # if using KIM potential
+    if kwargs.get("kim_potential", False):
+        return lammps_template.format(
+            lammps_data_file, config["bulk_index"], steps, lammps_out_file
+        )
+    return lammps_template.format(
+        lammps_data_file,
+        config["bulk_index"],
+        config["potential_file"],
+        *config["atoms"],
+        steps,
+        lammps_out_file,
+    )
+
+
+def get_active_region_mask(slab, centers, radius: float):
+    """Get the atoms within `radius` of any of the centers, using minimum image distances.
+
+    Parameters
+    ----------
+    slab : ase.Atoms
+        Surface slab
+    centers : np.ndarray
+        Centers of the region, e.g. the changed adsorption sites
+    radius : float
+        Radius (Angstrom) of the region around each center
+
+    Returns
+    -------
+    np.ndarray
+        Mask of the atoms in the region
+    """
+    _, dists = ase.geometry.get_distances(
+        np.reshape(centers, (-1, 3)), slab.positions, cell=slab.cell, pbc=slab.pbc
+    )
+    return np.any(dists <= radius, axis=0)
+
+
+def get_active_region_commands(active_mask):
+    """Get LAMMPS commands that freeze the atoms outside the active region with a group of their ids.
+
+    Parameters
+    ----------
+    active_mask : np.ndarray
+        Mask of the atoms that may relax, in the order of the LAMMPS atom ids
+
+    Returns
+    -------
+    list
+        Commands that define the frozen group and zero its forces, and commands that undo them
+    """
+    frozen_ids = np.flatnonzero(~np.asarray(active_mask)) + 1
+    if len(frozen_ids) == 0:
+        return [], []
+
+    # write consecutive ids as ranges to keep the command short
+    breaks = np.flatnonzero(np.diff(frozen_ids) > 1)
+    starts = np.concatenate([frozen_ids[:1], frozen_ids[breaks + 1]])
+    ends = np.concatenate([frozen_ids[breaks], frozen_ids[-1:]])
+    id_ranges = " ".join(
+        str(start) if start == end else f"{start}:{end}"
+        for start, end in zip(starts, ends)
+    )
+    commands = [
+        f"group mc_frozen id {id_ranges}",
+        "fix mc_frozen mc_frozen setforce 0.0 0.0 0.0",
+    ]
+    undo_commands = ["unfix mc_frozen", "group mc_frozen delete"]
+    return commands, undo_commands
+
+
+def insert_before_run(commands, new_commands):
+    """Insert commands before the first run or minimize command of a LAMMPS input."""
+    for i, command in enumerate(commands):
+        words = command.split()
+        if words and words[0] in LammpsSession.RUN_COMMANDS:
+            return commands[:i] + new_commands + commands[i:]
+    return commands + new_commands
+
+
 def run_lammps_calc(slab, main_dir=os.getcwd(), lammps_template=OPT_TEMPLATE, **kwargs):
-    lammps_template = open(lammps_template, "r").read()
+    if kwargs.get("persistent_lammps", False):
+        session = get_lammps_session(lammps_template, main_dir=main_dir, **kwargs)
+        return session.run(slab, **kwargs)
 
-    curr_dir = os.getcwd()
+    lammps_template = open(lammps_template, "r").read()
 
-    # config file is assumed to be stored in the folder you run lammps
-    config = json.load(open(f"{curr_dir}/lammps_config.json"))
-    potential_file = config["potential_file"]
-    atoms = config["atoms"]
-    bulk_index = config["bulk_index"]
+    config = load_lammps_config()
 
     # define necessary file locations
     lammps_data_file = f"{main_dir}/lammps.data"
@@ -55,26 +182,21 @@ def run_lammps_calc(slab, main_dir=os.getcwd(), lammps_template=OPT_TEMPLATE, **
     )
     steps = kwargs.get("relax_steps", 100)
 
+    commands = format_lammps_template(
+        lammps_template,
+        config,
+        lammps_data_file,
+        lammps_out_file,
+        steps=steps,
+        **kwargs,
+    )
+    if kwargs.get("active_mask", None) is not None:
+        active_commands, _ = get_active_region_commands(kwargs["active_mask"])
+        commands = "\n".join(insert_before_run(commands.splitlines(), active_commands))
+
     # write lammps.in file
     with open(lammps_in_file, "w") as f:
-        # if using KIM potential
-        if kwargs.get("kim_potential", False):
-            f.writelines(
-                lammps_template.format(
-                    lammps_data_file, bulk_index, steps, lammps_out_file
-                )
-            )
-        else:
-            f.writelines(
-                lammps_template.format(
-                    lammps_data_file,
-                    bulk_index,
-                    potential_file,
-                    *atoms,
-                    steps,
-                    lammps_out_file,
-                )
-            )
+        f.writelines(commands)
 
     # run LAMMPS without too much output
     lmp = lammps(cmdargs=["-log", "none", "-screen", "none", "-nocite"])
@@ -88,25 +210,218 @@ def run_lammps_calc(slab, main_dir=os.getcwd(), lammps_template=OPT_TEMPLATE, **
         pe_per_atom = lmp.extract_compute(
             "pe_per_atom", LMP_STYLE_ATOM, LMP_TYPE_VECTOR
         )
-        pe_per_atom = np.ctypeslib.as_array(
-            pe_per_atom, shape=(len(slab),)
-        )  # convert to numpy array
+        # copy to a numpy array, the LAMMPS memory is freed when it is closed
+        pe_per_atom = np.array(np.ctypeslib.as_array(pe_per_atom, shape=(len(slab),)))
     lmp.close()
 
-    # Read from LAMMPS out
-    new_slab = ase.io.read(lammps_out_file, format="lammps-data", style="atomic")
-
-    atomic_numbers_dict = config["atomic_numbers_dict"]
-    actual_atomic_numbers = [
-        atomic_numbers_dict[str(x)] for x in new_slab.get_atomic_numbers()
-    ]
-
-    new_slab.set_atomic_numbers(actual_atomic_numbers)
+    # Read from LAMMPS out, with the atomic numbers of the LAMMPS atom types
+    new_slab = ase.io.read(
+        lammps_out_file,
+        format="lammps-data",
+        style="atomic",
+        Z_of_type={
+            int(atom_type): num
+            for atom_type, num in config["atomic_numbers_dict"].items()
+        },
+    )
     new_slab.calc = slab.calc
 
     return energy, pe_per_atom, new_slab
 
 
+class LammpsSession:
+    """Persistent in-process LAMMPS instance that is reused across MC proposals.
+
+    The potential, groups, fixes and computes of the template are set up once. For
+    every subsequent calculation the atoms are replaced in memory through the LAMMPS
+    library API and the energy, per-atom energies and relaxed coordinates are read back
+    as NumPy arrays, so no files are written or read after the first call.
+    """
+
+    # template commands that perform the calculation or write output
+    RUN_COMMANDS = ("run", "minimize")
+    OUTPUT_COMMANDS = ("write_data", "log", "print")
+
+    def __init__(
+        self, lammps_template=OPT_TEMPLATE, main_dir=None, config=None, **kwargs
+    ):
+        with open(lammps_template, "r") as f:
+            self.lammps_template = f.read()
+        self.main_dir = main_dir if main_dir else os.getcwd()
+        self.kwargs = kwargs
+
+        self.config = config if config is not None else load_lammps_config()
+        # map atomic numbers to LAMMPS atom types and back
+        self.atom_types = {
+            int(num): int(atom_type)
+            for atom_type, num in self.config["atomic_numbers_dict"].items()
+        }
+        # as in run_lammps_calc, relaxations don't return per atom energies
+        self.has_pe_per_atom = "opt" not in self.lammps_template
+
+        self.lmp = None
+        self.prism = None
+        self.cell = None
+        self.steps = None
+        self.run_commands = []
+        self.group_commands = []
+
+    def setup(self, slab, steps=100):
+        """Start LAMMPS and run the setup part of the template for the given slab."""
+        self.close()
+
+        lammps_data_file = f"{self.main_dir}/lammps.data"
+        lammps_out_file = f"{self.main_dir}/lammps.out"
+        slab.write(
+            lammps_data_file,
+            format="lammps-data",
+            units="real",
+            atom_style="atomic",
+            specorder=self.config["atoms"],
+        )
+        commands = format_lammps_template(
+            self.lammps_template,
+            self.config,
+            lammps_data_file,
+            lammps_out_file,
+            steps=steps,
+            **self.kwargs,
+        ).splitlines()
+
+        setup_commands = []
+        self.run_commands = []
+        self.group_commands = []
+        for command in commands:
+            words = command.split()
+            if not words or words[0].startswith("#"):
+                continue
+            if words[0] in self.RUN_COMMANDS:
+                self.run_commands.append(command)
+            elif words[0] not in self.OUTPUT_COMMANDS:
+                setup_commands.append(command)
+                if words[0] == "group":
+                    self.group_commands.append(command)
+
+        # run LAMMPS without too much output
+        self.lmp = lammps(cmdargs=["-log", "none", "-screen", "none", "-nocite"])
+        self.lmp.commands_list(setup_commands)
+
+        self.cell = slab.get_cell().copy()
+        self.prism = Prism(self.cell, pbc=slab.pbc)
+        self.steps = steps
+
+    def update_atoms(self, slab):
+        """Replace the atoms in LAMMPS with those of `slab` without any file I/O."""
+        positions = self.prism.vector_to_lammps(slab.get_positions(), wrap=True)
+        types = [self.atom_types[int(num)] for num in slab.get_atomic_numbers()]
+        ids = list(range(1, len(slab) + 1))
+
+        self.lmp.command("delete_atoms group all")
+        self.lmp.create_atoms(len(slab), ids, types, positions.flatten().tolist())
+
+        # group membership is by atom, so groups are redefined for the new atoms
+        for command in self.group_commands:
+            self.lmp.command(f"group {command.split()[1]} clear")
+            self.lmp.command(command)
+
+    def run(self, slab, **kwargs):
+        """Calculate the energy of `slab`, relaxing it if the template minimizes.
+
+        Parameters
+        ----------
+        slab : ase.Atoms
+            Surface slab
+
+        Returns
+        -------
+        float
+            Potential energy
+        np.ndarray or list
+            Per-atom potential energies if the template computes them
+        ase.Atoms
+            Slab with coordinates from LAMMPS
+        """
+        steps = kwargs.get("relax_steps", 100)
+        if (
+            self.lmp is None
+            or steps != self.steps
+            or not np.allclose(slab.get_cell(), self.cell)
+        ):
+            self.setup(slab, steps=steps)
+        self.update_atoms(slab)
+
+        active_commands, undo_commands = [], []
+        if kwargs.get("active_mask", None) is not None:
+            active_commands, undo_commands = get_active_region_commands(
+                kwargs["active_mask"]
+            )
+        self.lmp.commands_list(active_commands + self.run_commands + undo_commands)
+
+        energy = self.lmp.extract_compute(
+            "thermo_pe", LMP_STYLE_GLOBAL, LMP_TYPE_SCALAR
+        )
+
+        # LAMMPS may reorder atoms, sort them back by id
+        nlocal = self.lmp.extract_global("nlocal")
+        order = np.argsort(self.lmp.numpy.extract_atom("id")[:nlocal])
+        positions = np.array(self.lmp.numpy.extract_atom("x")[:nlocal][order])
+        if self.has_pe_per_atom:
+            pe_per_atom = np.array(
+                self.lmp.numpy.extract_compute(
+                    "pe_per_atom", LMP_STYLE_ATOM, LMP_TYPE_VECTOR
+                )[:nlocal][order]
+            )
+        else:
+            pe_per_atom = []
+
+        new_slab = ase.Atoms(
+            numbers=slab.get_atomic_numbers(),
+            positions=self.prism.vector_to_ase(positions, wrap=True),
+            cell=slab.get_cell(),
+            pbc=slab.pbc,
+        )
+        new_slab.calc = slab.calc
+
+        return energy, pe_per_atom, new_slab
+
+    def close(self):
+        if self.lmp is not None:
+            self.lmp.close()
+            self.lmp = None
+
+
+_lammps_sessions = {}
+
+
+def get_lammps_session(lammps_template=OPT_TEMPLATE, main_dir=None, **kwargs):
+    """Get the persistent LAMMPS session for a template, creating it on first use.
+
+    Sessions are keyed on everything that goes into their setup commands: the template, the folder,
+    the LAMMPS config (potential, elements and atom types) and the kwargs used to format the
+    template. A run with another potential in the same process gets its own session.
+    """
+    config = load_lammps_config()
+    key = (
+        lammps_template,
+        main_dir,
+        json.dumps(config, sort_keys=True),
+        bool(kwargs.get("kim_potential", False)),
+    )
+    if key not in _lammps_sessions:
+        logger.info(f"starting persistent LAMMPS session for {lammps_template}")
+        _lammps_sessions[key] = LammpsSession(
+            lammps_template, main_dir, config=config, **kwargs
+        )
+    return _lammps_sessions[key]
+
+
+def close_lammps_sessions():
+    """Close all persistent LAMMPS sessions."""
+    for session in _lammps_sessions.values():
+        session.close()
+    _lammps_sessions.clear()
+
+
 def run_lammps_opt(slab, main_dir=os.getcwd(), **kwargs):
     energy, pe_per_atom, opt_slab = run_lammps_calc(
         slab, main_dir=main_dir, lammps_template=OPT_TEMPLATE, **kwargs
@@ -123,6 +438,339 @@ def run_lammps_energy(slab, main_dir=os.getcwd(), **kwargs):
     return energy, pe_per_atom
 
 
+class SkinNeighborList:
+    """Neighbor list of an AtomsBatch slab that is kept across MC steps. The list has the pairs within
+    the cutoff of the slab plus a skin, so it stays valid until an atom has moved more than half the
+    skin. Atoms that were added, removed or moved too far by a proposal are patched into the list
+    instead of rebuilding it. Builds use the binned (cell list) neighbor search of ASE, which scales
+    linearly with the number of atoms.
+    """
+
+    def __init__(self, skin: float = 1.0, max_patched_atoms: int = 8):
+        """
+        Parameters
+        ----------
+        skin : float, optional
+            Distance (Angstrom) added to the cutoff of the slab, by default 1.0
+        max_patched_atoms : int, optional
+            The list is rebuilt instead of patched if more atoms changed, by default 8
+        """
+        self.skin = skin
+        self.max_patched_atoms = max_patched_atoms
+        self.cutoff = None
+        self.cell = None
+        self.pbc = None
+        self.numbers = None
+        # positions at which each atom was last added to the list
+        self.positions = None
+        self.pairs = None
+        self.shifts = None
+        self.nbr_list = None
+        self.offsets = None
+        self.num_builds = 0
+        self.num_patches = 0
+
+    def build(self, slab, cutoff: float):
+        """Find all pairs within `cutoff` plus the skin."""
+        i, j, shifts = primitive_neighbor_list(
+            "ijS",
+            slab.pbc,
+            slab.cell,
+            slab.positions,
+            cutoff + self.skin,
+            self_interaction=False,
+        )
+        self.cutoff = cutoff
+        self.cell = np.array(slab.cell)
+        self.pbc = slab.pbc.copy()
+        self.numbers = slab.numbers.copy()
+        self.positions = slab.positions.copy()
+        self.pairs = np.stack([i, j], axis=1)
+        self.shifts = shifts
+        self.num_builds += 1
+
+    def get_atom_pairs(self, slab, idx: int):
+        """Find the pairs of one atom with all atoms, in all periodic images within range."""
+        radius = self.cutoff + self.skin
+        cell = np.array(slab.cell)
+        delta = slab.positions - slab.positions[idx]
+        # start from the closest image of every atom
+        closest = -np.round(np.linalg.solve(cell.T, delta.T).T) * slab.pbc
+
+        # more images are needed where the lattice planes are closer than the radius
+        volume = abs(np.linalg.det(cell))
+        num_images = [
+            (
+                int(
+                    np.ceil(
+                        radius
+                        * np.linalg.norm(np.cross(cell[k - 2], cell[k - 1]))
+                        / volume
+                        + 0.5
+                    )
+                )
+                if slab.pbc[k]
+                else 0
+            )
+            for k in range(3)
+        ]
+        images = (
+            np.array(
+                np.meshgrid(*[np.arange(-n, n + 1) for n in num_images], indexing="ij")
+            )
+            .reshape(3, -1)
+            .T
+        )
+
+        shifts = closest[None, :, :] + images[:, None, :]
+        within = np.linalg.norm(delta + shifts @ cell, axis=-1) < radius
+        # no pair of the atom with itself in the same image
+        within[np.all(images == 0, axis=1), idx] = False
+        image_idx, j = np.nonzero(within)
+        return j, shifts[image_idx, j].astype(int)
+
+    def match(self, slab):
+        """Map the atoms of the list to the atoms of the slab, allowing one added or removed atom.
+
+        Returns
+        -------
+        np.ndarray or None
+            Slab index of every atom of the list, or -1 if it was removed. None if the atoms can't be
+            matched.
+        np.ndarray
+            Slab indices of the atoms that were added or moved more than half the skin
+        """
+        num_old, num_new = len(self.numbers), len(slab)
+        if abs(num_new - num_old) > 1:
+            return None, None
+
+        num_common = min(num_old, num_new)
+        moved = (
+            np.linalg.norm(
+                slab.positions[:num_common] - self.positions[:num_common], axis=1
+            )
+            > self.skin / 2
+        )
+        same = (slab.numbers[:num_common] == self.numbers[:num_common]) & ~moved
+        if num_new == num_old:
+            mapping = np.arange(num_old)
+            return mapping, np.nonzero(~same)[0]
+
+        # the first atom that doesn't match is where an atom was added or removed
+        first = int(np.argmin(same)) if not np.all(same) else num_common
+        if num_new > num_old:
+            rest_new, rest_old = slice(first + 1, None), slice(first, None)
+        else:
+            rest_new, rest_old = slice(first, None), slice(first + 1, None)
+        rest_moved = (
+            np.linalg.norm(slab.positions[rest_new] - self.positions[rest_old], axis=1)
+            > self.skin / 2
+        )
+        if np.any(slab.numbers[rest_new] != self.numbers[rest_old]) or np.any(
+            rest_moved
+        ):
+            return None, None
+
+        mapping = np.arange(num_old)
+        if num_new > num_old:
+            mapping[first:] += 1
+            changed = [first]
+        else:
+            mapping[first] = -1
+            mapping[first + 1 :] -= 1
+            changed = []
+        return mapping, np.array(changed, dtype=int)
+
+    def patch(self, slab, mapping: np.ndarray, changed: np.ndarray):
+        """Renumber the pairs of the list and find the pairs of the changed atoms again."""
+        pairs = mapping[self.pairs]
+        keep = np.all(pairs >= 0, axis=1) & ~np.any(np.isin(pairs, changed), axis=1)
+        new_pairs, new_shifts = [pairs[keep]], [self.shifts[keep]]
+        for idx in changed:
+            j, shifts = self.get_atom_pairs(slab, idx)
+            new_pairs.append(np.stack([np.full(len(j), idx), j], axis=1))
+            new_shifts.append(shifts)
+            # the reverse pairs of changed atoms are found from the other side
+            reverse = ~np.isin(j, changed)
+            new_pairs.append(
+                np.stack([j[reverse], np.full(reverse.sum(), idx)], axis=1)
+            )
+            new_shifts.append(-shifts[reverse])
+
+        positions = np.empty_like(slab.positions)
+        kept = mapping >= 0
+        positions[mapping[kept]] = self.positions[kept]
+        positions[changed] = slab.positions[changed]
+
+        self.pairs = np.concatenate(new_pairs)
+        self.shifts = np.concatenate(new_shifts)
+        self.numbers = slab.numbers.copy()
+        self.positions = positions
+        self.num_patches += 1
+
+    def update(self, slab):
+        """Bring the list up to date with the slab and set it as the neighbor list of the slab.
+
+        Parameters
+        ----------
+        slab : AtomsBatch
+            Surface slab with a `cutoff`
+        """
+        cutoff = slab.cutoff
+        changed = None
+        if (
+            self.pairs is not None
+            and cutoff == self.cutoff
+            and np.allclose(slab.cell, self.cell)
+            and np.array_equal(slab.pbc, self.pbc)
+        ):
+            mapping, changed = self.match(slab)
+
+        if changed is None or len(changed) > self.max_patched_atoms:
+            self.build(slab, cutoff)
+            self.nbr_list = None
+        elif len(changed) > 0 or len(self.numbers) != len(slab):
+            self.patch(slab, mapping, changed)
+            self.nbr_list = None
+
+        if self.nbr_list is None:
+            pairs, shifts = self.pairs, self.shifts
+            if not getattr(slab, "directed", True):
+                # undirected lists have every pair once
+                first_shift = shifts[
+                    np.arange(len(shifts)), np.argmax(shifts != 0, axis=1)
+                ]
+                keep = (pairs[:, 0] < pairs[:, 1]) | (
+                    (pairs[:, 0] == pairs[:, 1]) & (first_shift > 0)
+                )
+                pairs, shifts = pairs[keep], shifts[keep]
+            self.nbr_list = torch.LongTensor(pairs)
+            self.offsets = torch.Tensor(shifts @ self.cell)
+        slab.nbr_list = self.nbr_list
+        slab.offsets = self.offsets
+
+
+class RelaxationWorkspace:
+    """Slabs and optimizers that are reused by the relaxations of a chain. The slab to relax is copied
+    into a persistent slab with the same number of atoms, so a relaxation only copies the per-atom
+    arrays instead of deep copying an AtomsBatch with its neighbor list and props. Optimizers are
+    reset in place.
+
+    The relaxed slab returned by `optimize_slab` is the persistent slab, which the next relaxation
+    overwrites. Use `detach` to keep it.
+    """
+
+    # optimizers whose state is reset by `initialize` and their scalar attributes
+    REUSABLE_OPTIMIZERS = (BFGS, BFGSLineSearch, FIRE)
+
+    def __init__(self, max_slabs: int = 3):
+        """
+        Parameters
+        ----------
+        max_slabs : int, optional
+            Number of slab sizes to keep, by default 3 for the current number of atoms and one more
+            or less
+        """
+        self.max_slabs = max_slabs
+        self.slabs = OrderedDict()
+        self.optimizers = {}
+        self.num_allocations = 0
+
+    def get_slab(self, slab):
+        """Copy a slab into the persistent slab with the same number of atoms.
+
+        Parameters
+        ----------
+        slab : ase.Atoms or AtomsBatch
+            Slab to relax
+
+        Returns
+        -------
+        ase.Atoms or AtomsBatch
+            The persistent slab with the arrays, constraints, calculator and neighbor list of `slab`
+        """
+        num_atoms = len(slab)
+        calc_slab = self.slabs.get(num_atoms, None)
+        if (
+            calc_slab is None
+            or type(calc_slab) is not type(slab)
+            or not np.allclose(calc_slab.cell, slab.cell)
+        ):
+            calc = slab.calc
+            slab.calc = None
+            calc_slab = copy.deepcopy(slab) if type(slab) is AtomsBatch else slab.copy()
+            slab.calc = calc
+            self.num_allocations += 1
+        else:
+            for name, array in slab.arrays.items():
+                if (
+                    name in calc_slab.arrays
+                    and calc_slab.arrays[name].shape == array.shape
+                ):
+                    calc_slab.arrays[name][...] = array
+                else:
+                    calc_slab.arrays[name] = array.copy()
+            for name in set(calc_slab.arrays) - set(slab.arrays):
+                del calc_slab.arrays[name]
+            calc_slab.set_constraint([c.copy() for c in slab.constraints])
+            if type(slab) is AtomsBatch:
+                calc_slab.nbr_list = slab.nbr_list
+                calc_slab.offsets = slab.offsets
+                calc_slab.results = dict(getattr(slab, "results", {}))
+
+        self.slabs[num_atoms] = calc_slab
+        self.slabs.move_to_end(num_atoms)
+        while len(self.slabs) > self.max_slabs:
+            self.slabs.popitem(last=False)
+        calc_slab.calc = slab.calc
+        return calc_slab
+
+    def get_optimizer(self, Optimizer, slab):
+        """Get an optimizer for a persistent slab, reset in place if it was used before."""
+        if Optimizer not in self.REUSABLE_OPTIMIZERS:
+            return Optimizer(slab)
+
+        dyn, initial_state, optimized_slab = self.optimizers.get(
+            Optimizer, (None, None, None)
+        )
+        if dyn is None or optimized_slab is not slab:
+            dyn = Optimizer(slab)
+            initial_state = {
+                name: value
+                for name, value in vars(dyn).items()
+                if value is None or isinstance(value, (bool, int, float))
+            }
+            self.optimizers[Optimizer] = (dyn, initial_state, slab)
+        else:
+            # restore step counts, step sizes and such before clearing the history
+            vars(dyn).update(initial_state)
+            dyn.initialize()
+        return dyn
+
+    def owns(self, slab) -> bool:
+        """Whether a slab is one of the persistent slabs."""
+        return any(slab is calc_slab for calc_slab in self.slabs.values())
+
+    def detach(self, slab):
+        """Copy a persistent slab so that later relaxations don't change it."""
+        if slab is None or not self.owns(slab):
+            return slab
+        calc = slab.calc
+        slab.calc = None
+        detached_slab = copy.deepcopy(slab)
+        slab.calc = calc
+        detached_slab.calc = calc
+        return detached_slab
+
+
+def update_neighbor_list(slab, neighbor_list: SkinNeighborList = None):
+    """Update the neighbor list of an AtomsBatch slab, incrementally if a `SkinNeighborList` is given."""
+    if neighbor_list is not None:
+        neighbor_list.update(slab)
+    else:
+        slab.update_nbr_list(update_atoms=True)
+
+
 def optimize_slab(slab, optimizer="BFGS", **kwargs):
     """Run relaxation for slab
 
@@ -132,12 +780,33 @@ def optimize_slab(slab, optimizer="BFGS", **kwargs):
         Surface slab
     optimizer : str, optional
         Either  BFGS or LAMMPS, by default 'BFGS'
+    active_centers : np.ndarray, optional
+        If given with `active_region_radius`, only the atoms within `active_region_radius` of these
+        points (e.g. the changed sites) are relaxed and all other atoms are frozen
+    energy_ceiling : float, optional
+        Stop the relaxation as soon as the estimated lower bound E - |F|^2 / (2 k) - m on the relaxed
+        energy exceeds this energy, where k is `early_rejection_stiffness` (eV/Angstrom^2, by default
+        0.1) and m is `early_rejection_margin` (eV, by default 0.1). Smaller k and larger m are more
+        conservative. Not used with LAMMPS or CG
+    workspace : RelaxationWorkspace, optional
+        Relax in the persistent slab of this workspace instead of a new copy of the slab. The relaxed
+        slab is then overwritten by the next relaxation in the workspace
 
     Returns
     -------
     ase.Atoms
         Relaxed slab
     """
+    active_mask = None
+    if kwargs.get("active_centers", None) is not None and kwargs.get(
+        "active_region_radius", None
+    ):
+        active_mask = get_active_region_mask(
+            slab, kwargs["active_centers"], kwargs["active_region_radius"]
+        )
+        logger.debug(f"relaxing {np.count_nonzero(active_mask)} atoms")
+    kwargs["active_mask"] = active_mask
+
     if "LAMMPS" in optimizer:
         if "folder_name" in kwargs:
             folder_name = kwargs["folder_name"]
@@ -145,7 +814,17 @@ def optimize_slab(slab, optimizer="BFGS", **kwargs):
         else:
             calc_slab, energy = run_lammps_opt(slab, **kwargs)
 
-        if isinstance(slab, AtomsBatch):
+        workspace = kwargs.get("workspace", None)
+        if (
+            isinstance(slab, AtomsBatch)
+            and workspace is not None
+            and len(calc_slab) == len(slab)
+        ):
+            relaxed_positions = calc_slab.get_positions()
+            calc_slab = workspace.get_slab(slab)
+            calc_slab.set_positions(relaxed_positions, apply_constraint=False)
+            update_neighbor_list(calc_slab)
+        elif isinstance(slab, AtomsBatch):
             calc_slab = get_atoms_batch(
                 calc_slab,
                 neighbor_cutoff=slab.cutoff,
@@ -163,12 +842,22 @@ def optimize_slab(slab, optimizer="BFGS", **kwargs):
             Optimizer = SciPyFminCG
         else:
             Optimizer = BFGS
+        workspace = kwargs.get("workspace", None)
         if type(slab) is AtomsBatch:
-            slab.update_nbr_list(update_atoms=True)
+            update_neighbor_list(slab, kwargs.get("neighbor_list", None))
+        if workspace is not None:
+            calc_slab = workspace.get_slab(slab)
+        elif type(slab) is AtomsBatch:
             calc_slab = copy.deepcopy(slab)
         else:
             calc_slab = slab.copy()
         calc_slab.calc = slab.calc
+        if active_mask is not None:
+            # freeze everything outside the active region, the relaxed slab keeps this
+            # constraint so that its max force is taken over the relaxed atoms
+            calc_slab.set_constraint(
+                calc_slab.constraints + [FixAtoms(mask=~active_mask)]
+            )
         if (
             kwargs.get("folder_name", None)
             and kwargs.get("iter", None)
@@ -186,13 +875,35 @@ def optimize_slab(slab, optimizer="BFGS", **kwargs):
                     f"final_slab_traj_{iter:04}.traj",
                 ),
             )
+        elif workspace is not None:
+            dyn = workspace.get_optimizer(Optimizer, calc_slab)
         else:
             dyn = Optimizer(calc_slab)
 
         # default steps is 20 and max forces are 0.01
         # TODO set up a config file to change this
         steps = kwargs.get("relax_steps", 20)
-        dyn.run(steps=steps, fmax=0.01)
+        energy_ceiling = kwargs.get("energy_ceiling", None)
+        if energy_ceiling is None or Optimizer is SciPyFminCG:
+            dyn.run(steps=steps, fmax=0.01)
+        else:
+            # the relaxed energy is at least the energy minus the largest possible decrease
+            # of a quadratic model with the lowest expected curvature, up to a margin for
+            # shallow parts of the energy surface
+            stiffness = kwargs.get("early_rejection_stiffness", 0.1)
+            margin = kwargs.get("early_rejection_margin", 0.1)
+            for _ in dyn.irun(steps=steps, fmax=0.01):
+                forces = calc_slab.get_forces()
+                lower_bound = (
+                    calc_slab.get_potential_energy()
+                    - np.sum(forces**2) / (2 * stiffness)
+                    - margin
+                )
+                if lower_bound > energy_ceiling:
+                    logger.debug(
+                        f"stopping relaxation after {dyn.nsteps} steps, energy is at least {lower_bound:.3f}"
+                    )
+                    break
 
     if (
         kwargs.get("folder_name", None)
@@ -208,18 +919,189 @@ def optimize_slab(slab, optimizer="BFGS", **kwargs):
     return calc_slab, energy
 
 
-def slab_energy(slab, relax=False, update_neighbors=True, **kwargs):
-    """Calculate slab energy."""
+class ReferenceEnergies:
+    """Reference data of an offset_data.json file, used for NFF models trained on offset-corrected
+    energies and for chemical potentials relative to a reference element.
+
+    Compositions are vectors with the number of atoms of each element in `elements`, so that the
+    offsets and chemical potential energies are small dot products. Like lookups in the offset data,
+    they raise a KeyError for elements in the slab without an entry.
+    """
+
+    def __init__(self, offset_data: dict):
+        """
+        Parameters
+        ----------
+        offset_data : dict
+            Contents of the offset_data.json file
+        """
+        stoidict = offset_data["stoidict"]
+        stoics = offset_data["stoics"]
+        bulk_energies = offset_data["bulk_energies"]
+        ref_element = offset_data["ref_element"]
+
+        self.elements = sorted((set(stoidict) - {"offset"}) | set(stoics))
+        self.element_idx = {ele: i for i, ele in enumerate(self.elements)}
+        self.numbers = np.array([atomic_numbers[ele] for ele in self.elements])
+        self.ref_idx = self.element_idx[ref_element]
+
+        # missing entries are nan, they raise a KeyError once the element is in a slab
+        self.stoidict = np.array([stoidict.get(ele, np.nan) for ele in self.elements])
+        self.stoidict_offset = stoidict["offset"]
+        # number of atoms of each element per reference element atom
+        self.ratios = np.array(
+            [stoics.get(ele, np.nan) / stoics[ref_element] for ele in self.elements]
+        )
+        self.bulk_energies = np.array(
+            [bulk_energies.get(ele, np.nan) for ele in self.elements]
+        )
+        self.bulk_energies[self.ref_idx] = 0.0
+        self.ref_bulk_energy = bulk_energies[offset_data["ref_formula"]]
+
+    def get_composition(self, slab):
+        """Get the composition vector of a slab."""
+        counts = np.bincount(slab.numbers, minlength=self.numbers.max() + 1)
+        unknown = counts.astype(bool)
+        # ghost atoms of empty slots have atomic number 0
+        unknown[0] = False
+        unknown[self.numbers] = False
+        if np.any(unknown):
+            raise KeyError(
+                f"elements {[chemical_symbols[z] for z in np.flatnonzero(unknown)]} are not in the offset data"
+            )
+        return counts[self.numbers]
+
+    def check_entries(self, values, needed, name: str):
+        """Raise a KeyError if any of the `needed` elements has no entry in `values`."""
+        missing = needed & np.isnan(values)
+        if np.any(missing):
+            raise KeyError(
+                f"elements {[self.elements[i] for i in np.flatnonzero(missing)]} are not in {name}"
+            )
+
+    def update_composition(self, composition, start_ads: str, end_ads: str):
+        """Update a composition vector in place after replacing `start_ads` with `end_ads`, where
+        "None" is an empty site."""
+        if start_ads and start_ads != "None":
+            composition[self.element_idx[start_ads]] -= 1
+        if end_ads and end_ads != "None":
+            composition[self.element_idx[end_ads]] += 1
+        return composition
+
+    def get_excess(self, composition, present=None):
+        """Get the number of atoms of each element in excess of the stoichiometry of the reference
+        element. Only the `present` elements are counted, by default the ones in the composition."""
+        if present is None:
+            present = composition > 0
+        present = present.copy()
+        present[self.ref_idx] = False
+        self.check_entries(self.ratios, present, "stoics")
+        excess = np.where(
+            present, composition - self.ratios * composition[self.ref_idx], 0.0
+        )
+        return excess
+
+    def get_pot_energy(self, composition, ads_pot_dict: dict, present=None):
+        """Get the chemical potential energy of a composition relative to the reference element."""
+        if present is None:
+            present = composition > 0
+        excess = self.get_excess(composition, present=present)
+        pots = np.array([ads_pot_dict.get(ele, np.nan) for ele in self.elements])
+        pots[self.ref_idx] = 0.0
+        self.check_entries(pots, present, "the chemical potentials")
+        return float(np.dot(excess, np.nan_to_num(pots)))
+
+    def get_offset_energy(self, composition):
+        """Get the energy (eV) to add to the model energy of a composition."""
+        present = composition > 0
+        self.check_entries(self.stoidict, present, "stoidict")
+        self.check_entries(self.bulk_energies, present, "bulk_energies")
+        excess = self.get_excess(composition, present=present)
+        # 1: add the linear regression coeffs back in
+        ref_en = (
+            np.dot(composition, np.nan_to_num(self.stoidict)) + self.stoidict_offset
+        )
+        # 2: subtract the bulk energies
+        bulk_ref_en = composition[self.ref_idx] * self.ref_bulk_energy + np.dot(
+            excess, np.nan_to_num(self.bulk_energies)
+        )
+        return float((ref_en - bulk_ref_en) * HARTREE_TO_EV)
+
+
+@functools.lru_cache(maxsize=None)
+def load_reference_energies(offset_data_path: str):
+    """Load the offset_data.json file once per process.
+
+    Parameters
+    ----------
+    offset_data_path : str
+        Path to the offset_data.json file
+
+    Returns
+    -------
+    ReferenceEnergies
+        Reference energies of the file
+    """
+    if not offset_data_path:
+        raise Exception(f"No offset_data.json file specified!")
+    with open(offset_data_path) as f:
+        offset_data = json.load(f)
+    return ReferenceEnergies(offset_data)
+
+
+def get_offset_energy(slab, offset_data_path, composition=None):
+    """Get the reference energy offset of a slab for NFF models trained on
+    offset-corrected energies.
+
+    Parameters
+    ----------
+    slab : ase.Atoms
+        Surface slab
+    offset_data_path : str
+        Path to the offset_data.json file
+    composition : np.ndarray, optional
+        Composition vector of the slab, e.g. the one updated by `change_site`. Computed from the
+        slab if not given
+
+    Returns
+    -------
+    float
+        Energy (eV) to add to the model energy
+    """
+    reference_energies = load_reference_energies(offset_data_path)
+    if composition is None:
+        composition = reference_energies.get_composition(slab)
+    return reference_energies.get_offset_energy(composition)
+
+
+def evaluate_slab(slab, relax=False, update_neighbors=True, **kwargs):
+    """Calculate slab energy and return the slab it was calculated for.
+
+    Parameters
+    ----------
+    slab : ase.Atoms or AtomsBatch
+        Surface slab
+    relax : bool, optional
+        Relax the slab with `optimize_slab` first, by default False
+
+    Returns
+    -------
+    tuple
+        The energy, energy std, max force, force std and per-atom energies
+    ase.Atoms or AtomsBatch
+        The relaxed slab if `relax` is set, otherwise `slab`
+    """
     energy = 0.0
 
     pe_per_atom = []
 
     if relax:
         if type(slab) is AtomsBatch:
-            # calculate without relax first for NFF energies, which might be too high
+            # calculate without relax first for NFF energies, which might be too high. The
+            # calculator keeps these results, so they are reused for the first optimizer step
             logger.debug(f"\ncalculating energy without relax")
             energy, energy_std, max_force, force_std, _ = slab_energy(
-                slab, relax=False, **kwargs
+                slab, relax=False, **{**kwargs, "require_per_atom_energies": False}
             )
 
             if energy > ENERGY_THRESHOLD or max_force > MAX_FORCE_THRESHOLD:
@@ -239,7 +1121,19 @@ def slab_energy(slab, relax=False, update_neighbors=True, **kwargs):
                 energy = ENERGY_THRESHOLD
                 # energy = np.sign(energy) * UNRELAXED_ENERGY_THRESHOLD
 
-                return energy, energy_std, max_force, force_std, 0.0
+                return (energy, energy_std, max_force, force_std, 0.0), slab
+
+        if (
+            kwargs.get("energy_ceiling", None) is not None
+            and type(slab) is AtomsBatch
+            and kwargs.get("offset", None)
+        ):
+            # the relaxation energies don't include the offset that is added below
+            kwargs["energy_ceiling"] -= get_offset_energy(
+                slab,
+                kwargs.get("offset_data", None),
+                composition=kwargs.get("composition", None),
+            )
 
         logger.debug(f"performing relaxation")
         slab, energy = optimize_slab(slab, **kwargs)
@@ -250,9 +1144,16 @@ def slab_energy(slab, relax=False, update_neighbors=True, **kwargs):
         )
 
     if type(slab) is AtomsBatch and kwargs.get("optimizer", None) != "LAMMPS":
-        if update_neighbors:
-            slab.update_nbr_list(update_atoms=True)
-        slab.calc.calculate(slab)
+        if relax and not slab.calc.calculation_required(slab, ["energy", "forces"]):
+            # the last optimizer step already calculated the relaxed slab
+            logger.debug("using the results of the last relaxation step")
+        else:
+            if update_neighbors and not relax:
+                update_neighbor_list(slab, kwargs.get("neighbor_list", None))
+            elif update_neighbors:
+                # the neighbor list follows the MC slab, not its relaxed copies
+                slab.update_nbr_list(update_atoms=True)
+            slab.calc.calculate(slab)
         energy = float(slab.results["energy"])
         max_force = float(np.abs(slab.results["forces"]).max())
 
@@ -265,37 +1166,11 @@ def slab_energy(slab, relax=False, update_neighbors=True, **kwargs):
             energy = ENERGY_THRESHOLD
 
         if kwargs.get("offset", None):
-            if not kwargs.get("offset_data", None):
-                raise Exception(f"No offset_data.json file specified!")
-            else:
-                with open(kwargs["offset_data"]) as f:
-                    offset_data = json.load(f)
-                bulk_energies = offset_data["bulk_energies"]
-                stoidict = offset_data["stoidict"]
-                stoics = offset_data["stoics"]
-                ref_formula = offset_data["ref_formula"]
-                ref_element = offset_data["ref_element"]
-
-            ad = Counter(slab.get_chemical_symbols())
-
-            # procedure is
-            # 1: to add the linear regression coeffs back in
-            ref_en = 0
-            for ele, num in ad.items():
-                ref_en += num * stoidict[ele]
-            ref_en += stoidict["offset"]
-
-            energy += ref_en * HARTREE_TO_EV
-
-            # 2: subtract the bulk energies
-            bulk_ref_en = ad[ref_element] * bulk_energies[ref_formula]
-            for ele, _ in ad.items():
-                if ele != ref_element:
-                    bulk_ref_en += (
-                        ad[ele] - stoics[ele] / stoics[ref_element] * ad[ref_element]
-                    ) * bulk_energies[ele]
-
-            energy -= bulk_ref_en * HARTREE_TO_EV
+            energy += get_offset_energy(
+                slab,
+                kwargs.get("offset_data", None),
+                composition=kwargs.get("composition", None),
+            )
 
         energy_std = float(slab.results["energy_std"])
         max_force = float(np.abs(slab.results["forces"]).max())
@@ -314,4 +1189,593 @@ def slab_energy(slab, relax=False, update_neighbors=True, **kwargs):
         energy_std = 0.0
         max_force = float(np.abs(slab.get_forces()).max())
         force_std = 0.0
-    return energy, energy_std, max_force, force_std, pe_per_atom
+    return (energy, energy_std, max_force, force_std, pe_per_atom), slab
+
+
+def slab_energy(slab, relax=False, update_neighbors=True, **kwargs):
+    """Calculate slab energy."""
+    results, _ = evaluate_slab(
+        slab, relax=relax, update_neighbors=update_neighbors, **kwargs
+    )
+    return results
+
+
+def get_local_region(slab, center, radius: float, buffer: float = 0.0, vacuum=10.0):
+    """Cut out the atoms within `radius + buffer` of a point as a cluster. The atoms farther than
+    `radius` are a buffer that is kept fixed.
+
+    Parameters
+    ----------
+    slab : ase.Atoms
+        Surface slab
+    center : np.ndarray
+        Center of the region, e.g. an adsorption site
+    radius : float
+        Radius (Angstrom) of the region that may relax. It should be smaller than half the cell lengths.
+    buffer : float, optional
+        Thickness (Angstrom) of the fixed buffer around the region, at least the cutoff of the calculator
+    vacuum : float, optional
+        Vacuum (Angstrom) around the cluster
+
+    Returns
+    -------
+    ase.Atoms
+        Cluster with the minimum image positions of the atoms around the center
+    np.ndarray
+        Mask of the slab atoms in the cluster
+    """
+    vectors, dists = ase.geometry.get_distances(
+        [center], slab.positions, cell=slab.cell, pbc=slab.pbc
+    )
+    vectors, dists = vectors[0], dists[0]
+    in_region = dists <= radius + buffer
+
+    box_length = 2 * (radius + buffer + vacuum)
+    region = ase.Atoms(
+        numbers=slab.numbers[in_region],
+        positions=vectors[in_region] + box_length / 2,
+        cell=[box_length] * 3,
+        pbc=False,
+    )
+    # the buffer and the atoms fixed in the slab, e.g. the bulk, are fixed
+    fixed = dists > radius
+    for constraint in slab.constraints:
+        if isinstance(constraint, FixAtoms):
+            fixed[constraint.index] = True
+    region.set_constraint(FixAtoms(mask=fixed[in_region]))
+    return region, in_region
+
+
+def local_slab_energy(slab, center, radius: float, buffer: float = 4.0, **kwargs):
+    """Calculate the energy of the region of a slab around a point with `slab_energy`. The difference
+    of this energy before and after a move at the point approximates the energy difference of the whole
+    slab if the buffer is at least the cutoff of the calculator.
+
+    Parameters
+    ----------
+    slab : ase.Atoms or AtomsBatch
+        Surface slab
+    center : np.ndarray
+        Center of the region, e.g. an adsorption site
+    radius : float
+        Radius (Angstrom) of the region that may relax
+    buffer : float, optional
+        Thickness (Angstrom) of the fixed buffer around the region, by default 4.0
+    kwargs
+        Other parameters passed to `slab_energy`
+
+    Returns
+    -------
+        the results of `slab_energy` for the region, where the maximum force is taken over the atoms
+    that are not in the buffer.
+    """
+    region, _ = get_local_region(slab, center, radius, buffer=buffer)
+    if type(slab) is AtomsBatch:
+        constraints = region.constraints
+        region = get_atoms_batch(
+            region,
+            neighbor_cutoff=slab.cutoff,
+            nff_calc=slab.calc,
+            device=slab.device,
+        )
+        region.set_constraint(constraints)
+    else:
+        region.calc = slab.calc
+
+    results = list(slab_energy(region, **kwargs))
+
+    # the cut at the buffer edge gives large forces on buffer atoms
+    forces = getattr(region.calc, "results", {}).get("forces", None)
+    if forces is not None and len(forces) == len(region):
+        free = np.ones(len(region), dtype=bool)
+        free[region.constraints[0].index] = False
+        results[2] = float(np.abs(forces[free]).max()) if np.any(free) else 0.0
+    return tuple(results)
+
+
+def collate_slabs(slabs):
+    """Collate several AtomsBatch slabs into a single NFF batch.
+
+    Parameters
+    ----------
+    slabs : list of AtomsBatch
+        Surface slabs with up-to-date neighbor lists
+
+    Returns
+    -------
+    dict
+        NFF batch with `nxyz`, `nbr_list`, `offsets` and `num_atoms`
+    """
+    nxyz, nbr_list, offsets, num_atoms = [], [], [], []
+    num_prev_atoms = 0
+    for slab in slabs:
+        props = slab.get_batch()
+        nxyz.append(torch.as_tensor(props["nxyz"]))
+        # shift the neighbor indices by the atoms of the preceding slabs
+        nbr_list.append(torch.as_tensor(props["nbr_list"]) + num_prev_atoms)
+        offsets.append(props["offsets"])
+        num_atoms.append(len(slab))
+        num_prev_atoms += len(slab)
+
+    return {
+        "nxyz": torch.cat(nxyz),
+        "nbr_list": torch.cat(nbr_list),
+        "offsets": torch.cat(offsets),
+        "num_atoms": torch.LongTensor(num_atoms),
+    }
+
+
+def predict_batch(slabs, calc=None, update_neighbors=True):
+    """Predict the energies and forces of several AtomsBatch slabs with one forward pass per model.
+
+    Parameters
+    ----------
+    slabs : list of AtomsBatch
+        Surface slabs
+    calc : NeuralFF or EnsembleNFF, optional
+        NFF calculator, defaults to the calculator of the first slab. Its `model_kwargs`,
+        `en_key` and units are used as in `NeuralFF.calculate`
+    update_neighbors : bool, optional
+        Update the neighbor lists before evaluation, by default True
+
+    Returns
+    -------
+    np.ndarray
+        Energies of every model and structure in eV, with shape (num_models, num_slabs)
+    list of np.ndarray
+        Forces of every model on the atoms of each structure in eV/Angstrom, with shape
+        (num_models, num_atoms, 3)
+    """
+    if calc is None:
+        calc = slabs[0].calc
+    if update_neighbors:
+        for slab in slabs:
+            slab.update_nbr_list(update_atoms=True)
+
+    batch = batch_to(collate_slabs(slabs), calc.device)
+    models = calc.models if isinstance(calc, EnsembleNFF) else [calc.model]
+
+    # as in NeuralFF.calculate, add the keys so that the readout calculates them
+    en_key = getattr(calc, "en_key", "energy")
+    grad_key = en_key + "_grad"
+    batch[en_key] = []
+    batch[grad_key] = []
+    model_kwargs = getattr(calc, "model_kwargs", None) or {}
+    conversion_factor = (
+        UNITS_IN_KCAL_MOL[getattr(calc, "model_units", "kcal/mol")]
+        / UNITS_IN_KCAL_MOL[getattr(calc, "prediction_units", "eV")]
+    )
+
+    energies = []
+    gradients = []
+    for model in models:
+        prediction = model(batch, **model_kwargs)
+        energies.append(prediction[en_key].detach().cpu().numpy().reshape(-1))
+        gradients.append(prediction[grad_key].detach().cpu().numpy())
+    # convert from the model units to the units of the calculator, eV by default
+    energies = np.stack(energies).astype(float) * conversion_factor
+    gradients = np.stack(gradients).astype(float) * conversion_factor
+
+    # split per-atom quantities by structure
+    split_idx = np.cumsum([len(slab) for slab in slabs])[:-1]
+    forces = np.split(-gradients.reshape(len(models), -1, 3), split_idx, axis=1)
+    return energies, forces
+
+
+def get_energies_and_forces(slabs):
+    """Get the energies and forces of several slabs, in one NFF forward pass for AtomsBatch slabs and
+    one calculation per slab for other calculators.
+
+    Parameters
+    ----------
+    slabs : list of ase.Atoms or AtomsBatch
+        Surface slabs with a calculator
+
+    Returns
+    -------
+    np.ndarray
+        Energy of each slab
+    list of np.ndarray
+        Forces on the atoms of each slab, without constraints
+    """
+    if type(slabs[0]) is AtomsBatch:
+        energies, forces = predict_batch(slabs)
+        return energies.mean(0), [f.mean(0) for f in forces]
+
+    energies = np.array([slab.get_potential_energy() for slab in slabs])
+    forces = [slab.get_forces(apply_constraint=False) for slab in slabs]
+    return energies, forces
+
+
+class BatchedFIRE:
+    """FIRE relaxation of several slabs at once. The positions, velocities and forces of all slabs are
+    stacked into single arrays and the FIRE parameters are kept per slab, so every step is one
+    vectorized update and one call of the energy and force function for all slabs that have not
+    converged yet. The update is the same as the one of `ase.optimize.FIRE`.
+
+    The slabs are relaxed in place. Atoms fixed by a `FixAtoms` constraint or by `frozen_masks` are
+    not moved.
+    """
+
+    def __init__(
+        self,
+        slabs,
+        energy_forces=get_energies_and_forces,
+        frozen_masks=None,
+        dt: float = 0.1,
+        maxstep: float = 0.2,
+        dtmax: float = 1.0,
+        Nmin: int = 5,
+        finc: float = 1.1,
+        fdec: float = 0.5,
+        astart: float = 0.1,
+        fa: float = 0.99,
+    ):
+        """
+        Parameters
+        ----------
+        slabs : list of ase.Atoms or AtomsBatch
+            Surface slabs with a calculator
+        energy_forces : callable, optional
+            Function that takes a list of slabs and returns their energies and forces, by default
+            `get_energies_and_forces`
+        frozen_masks : list of np.ndarray, optional
+            Boolean mask of the atoms of each slab that are not moved, in addition to `FixAtoms`
+        dt, maxstep, dtmax, Nmin, finc, fdec, astart, fa
+            FIRE parameters as in `ase.optimize.FIRE`
+        """
+        self.slabs = list(slabs)
+        self.energy_forces = energy_forces
+        self.maxstep = maxstep
+        self.dtmax = dtmax
+        self.Nmin = Nmin
+        self.finc = finc
+        self.fdec = fdec
+        self.astart = astart
+        self.fa = fa
+
+        num_slabs = len(self.slabs)
+        num_atoms = [len(slab) for slab in self.slabs]
+        self.atom_offsets = np.concatenate([[0], np.cumsum(num_atoms)])
+        # index of the slab of every atom in the stacked arrays
+        self.slab_idx = np.repeat(np.arange(num_slabs), num_atoms)
+
+        self.positions = np.concatenate([slab.get_positions() for slab in self.slabs])
+        self.free = np.ones(len(self.positions), dtype=bool)
+        for i, slab in enumerate(self.slabs):
+            free = self.free[self.atom_offsets[i] : self.atom_offsets[i + 1]]
+            for constraint in slab.constraints:
+                if isinstance(constraint, FixAtoms):
+                    free[constraint.index] = False
+            if frozen_masks is not None and frozen_masks[i] is not None:
+                free &= ~np.asarray(frozen_masks[i], dtype=bool)
+
+        self.velocities = np.zeros_like(self.positions)
+        self.forces = np.zeros_like(self.positions)
+        self.energies = np.full(num_slabs, np.nan)
+        self.dt = np.full(num_slabs, dt)
+        self.a = np.full(num_slabs, astart)
+        self.Nsteps = np.zeros(num_slabs, dtype=int)
+        self.converged = np.zeros(num_slabs, dtype=bool)
+        self.nsteps = 0
+
+    def sum_per_slab(self, values: np.ndarray) -> np.ndarray:
+        """Sum per-atom values over the atoms of each slab."""
+        return np.bincount(self.slab_idx, weights=values, minlength=len(self.slabs))
+
+    def evaluate(self):
+        """Calculate the energies and forces of the slabs that have not converged."""
+        active = np.nonzero(~self.converged)[0]
+        for i in active:
+            start, end = self.atom_offsets[i], self.atom_offsets[i + 1]
+            self.slabs[i].set_positions(
+                self.positions[start:end], apply_constraint=False
+            )
+
+        energies, forces = self.energy_forces([self.slabs[i] for i in active])
+        for i, energy, slab_forces in zip(active, energies, forces):
+            start, end = self.atom_offsets[i], self.atom_offsets[i + 1]
+            self.energies[i] = energy
+            self.forces[start:end] = slab_forces
+        self.forces[~self.free] = 0.0
+
+    def get_max_forces(self) -> np.ndarray:
+        """Get the largest force on an atom of each slab."""
+        force_norms = np.sum(self.forces**2, axis=1)
+        max_forces = np.zeros(len(self.slabs))
+        np.maximum.at(max_forces, self.slab_idx, force_norms)
+        return np.sqrt(max_forces)
+
+    def step(self):
+        """Move the slabs that have not converged by one FIRE step."""
+        f = self.forces
+        v = self.velocities
+        if self.nsteps > 0:
+            vf = self.sum_per_slab(np.sum(f * v, axis=1))
+            ff = self.sum_per_slab(np.sum(f * f, axis=1))
+            vv = self.sum_per_slab(np.sum(v * v, axis=1))
+
+            downhill = vf > 0.0
+            # mix the velocity towards the force direction
+            mixing = np.where(downhill, self.a, 0.0)
+            scale = np.sqrt(vv) / np.sqrt(np.where(ff > 0.0, ff, 1.0))
+            v *= (1.0 - mixing)[self.slab_idx, None]
+            v += (mixing * scale)[self.slab_idx, None] * f
+
+            accelerate = downhill & (self.Nsteps > self.Nmin)
+            self.dt[accelerate] = np.minimum(
+                self.dt[accelerate] * self.finc, self.dtmax
+            )
+            self.a[accelerate] *= self.fa
+            self.Nsteps[downhill] += 1
+
+            # stop and slow down after going uphill
+            v[~downhill[self.slab_idx]] = 0.0
+            self.a[~downhill] = self.astart
+            self.dt[~downhill] *= self.fdec
+            self.Nsteps[~downhill] = 0
+
+        dt = self.dt[self.slab_idx, None]
+        v += dt * f
+        dr = dt * v
+        step_norms = np.sqrt(self.sum_per_slab(np.sum(dr**2, axis=1)))
+        step_scale = np.where(
+            step_norms > self.maxstep,
+            self.maxstep / np.where(step_norms > 0.0, step_norms, 1.0),
+            1.0,
+        )
+        dr *= step_scale[self.slab_idx, None]
+        dr[self.converged[self.slab_idx]] = 0.0
+        self.positions += dr
+        self.nsteps += 1
+
+    def run(self, fmax: float = 0.01, steps: int = 20) -> bool:
+        """Relax the slabs until the largest force on an atom of every slab is below `fmax` or for
+        at most `steps` steps.
+
+        Returns
+        -------
+        bool
+            Whether all slabs converged
+        """
+        self.evaluate()
+        for _ in range(steps):
+            self.converged |= self.get_max_forces() < fmax
+            if np.all(self.converged):
+                break
+            self.step()
+            self.evaluate()
+        self.converged |= self.get_max_forces() < fmax
+        return bool(np.all(self.converged))
+
+
+def optimize_slab_batch(slabs, **kwargs):
+    """Relax several slabs at once with `BatchedFIRE`, e.g. the proposals of multiple-try moves or the
+    replicas of a replica exchange run.
+
+    Parameters
+    ----------
+    slabs : list of ase.Atoms or AtomsBatch
+        Surface slabs with a calculator, which are not changed
+    relax_steps : int, optional
+        Maximum number of steps, by default 20
+    frozen_masks : list of np.ndarray, optional
+        Boolean mask of the atoms of each slab that are not relaxed
+
+    Returns
+    -------
+    list of ase.Atoms or AtomsBatch
+        Relaxed slabs
+    np.ndarray
+        Energies of the relaxed slabs
+    """
+    calc_slabs = []
+    for slab in slabs:
+        if type(slab) is AtomsBatch:
+            calc = slab.calc
+            slab.calc = None
+            calc_slab = copy.deepcopy(slab)
+            slab.calc = calc
+        else:
+            calc_slab = slab.copy()
+        calc_slab.calc = slab.calc
+        calc_slabs.append(calc_slab)
+
+    dyn = BatchedFIRE(calc_slabs, frozen_masks=kwargs.get("frozen_masks", None))
+    converged = dyn.run(fmax=0.01, steps=kwargs.get("relax_steps", 20))
+    if not converged:
+        logger.debug(
+            f"{np.count_nonzero(~dyn.converged)} of {len(slabs)} slabs did not converge"
+        )
+    return calc_slabs, dyn.energies.copy()
+
+
+def slab_energy_batch(slabs, calc=None, update_neighbors=True, **kwargs):
+    """Calculate the energies of several AtomsBatch slabs in one forward pass.
+
+    Parameters
+    ----------
+    slabs : list of AtomsBatch
+        Surface slabs, e.g. all proposals for the next few MC steps or all replicas
+    calc : NeuralFF or EnsembleNFF, optional
+        NFF calculator, defaults to the calculator of the first slab
+    update_neighbors : bool, optional
+        Update the neighbor lists before evaluation, by default True
+
+    Returns
+    -------
+    tuple of np.ndarray
+        Per-structure energy, energy_std, max_force and force_std
+    """
+    compositions = kwargs.get("compositions", None)
+    energies, forces = predict_batch(slabs, calc, update_neighbors)
+    energy = energies.mean(0)
+    energy_std = energies.std(0)
+    forces_std = [f.std(0) for f in forces]
+    forces = [f.mean(0) for f in forces]
+    max_force = np.array([np.abs(f).max() for f in forces])
+    force_std = np.array([f.mean() for f in forces_std])
+
+    for i, slab in enumerate(slabs):
+        if np.abs(energy[i]) > ENERGY_THRESHOLD or max_force[i] > MAX_FORCE_THRESHOLD:
+            logger.info("encountered energy or force out of bounds")
+            logger.info(f"energy {energy[i]:.3f}")
+            logger.info(f"max force {max_force[i]:.3f}")
+
+            # we set a high energy for mcmc to reject
+            energy[i] = ENERGY_THRESHOLD
+
+        if kwargs.get("offset", None):
+            energy[i] += get_offset_energy(
+                slab,
+                kwargs.get("offset_data", None),
+                composition=compositions[i] if compositions is not None else None,
+            )
+
+    return energy, energy_std, max_force, force_std
+
+
+class EnergyCache:
+    """Bounded LRU cache of `slab_energy` results keyed on the site occupancy.
+
+    The key is a compact hash of the species at each adsorption site, so it does not depend on
+    the atom indices, which change after `remove_from_slab`. If site permutations of the surface
+    symmetry operations are given, the occupancy is canonicalized first so that symmetrically
+    equivalent configurations share an entry.
+    """
+
+    def __init__(self, maxsize: int = 10000, site_permutations: np.ndarray = None):
+        """
+        Parameters
+        ----------
+        maxsize : int, optional
+            Maximum number of cached entries, by default 10000
+        site_permutations : np.ndarray, optional
+            Array of shape (num_ops, num_sites), where row k maps each site to its image under
+            symmetry operation k, as returned by `get_site_permutations`
+        """
+        self.maxsize = maxsize
+        self.site_permutations = site_permutations
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, occupancy: np.ndarray):
+        """Get the cache key of a site occupancy vector.
+
+        Parameters
+        ----------
+        occupancy : np.ndarray
+            Atomic number of the adsorbate at each site, 0 for empty sites
+
+        Returns
+        -------
+        bytes
+            Hash of the (canonicalized) occupancy
+        """
+        occupancy = np.asarray(occupancy, dtype=np.uint8)
+        if self.site_permutations is not None:
+            # the lexicographically smallest of all symmetry-equivalent occupancies
+            images = np.empty_like(self.site_permutations, dtype=np.uint8)
+            ops = np.arange(len(self.site_permutations))[:, None]
+            images[ops, self.site_permutations] = occupancy
+            occupancy = images[np.lexsort(images.T[::-1])[0]]
+        return hashlib.blake2b(occupancy.tobytes(), digest_size=16).digest()
+
+    def get(self, key: bytes):
+        """Get the cached results for a key, or None if not cached."""
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: bytes, results: tuple):
+        """Cache the results for a key, evicting the least recently used entry if full."""
+        self.cache[key] = results
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+
+    def __len__(self):
+        return len(self.cache)
+
+    def __str__(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        return f"{self.hits} hits and {self.misses} misses (hit rate {hit_rate:.1%}), {len(self)} entries"
+
+
+class GhostSlotCalculator(Calculator):
+    """Calculator wrapper for fixed capacity slabs, see `add_ghost_slots`.
+
+    The wrapped calculator only sees the occupied atoms. Their positions are gathered into an
+    `ase.Atoms` object that is kept as long as the occupancy does not change, so that the wrapped
+    calculator can reuse its neighbor lists and buffers. Forces on empty slots are zero.
+    """
+
+    implemented_properties = ["energy", "free_energy", "forces"]
+
+    def __init__(self, calc, **kwargs):
+        """
+        Parameters
+        ----------
+        calc : ase.calculators.calculator.Calculator
+            Calculator for the occupied atoms
+        """
+        super().__init__(**kwargs)
+        self.calc = calc
+        self.occupied = None
+        self.occupied_atoms = None
+
+    def get_occupied_atoms(self, atoms):
+        """Get the occupied atoms of a fixed capacity slab, reusing the previous ones if the
+        occupancy did not change."""
+        occupied = atoms.numbers > 0
+        if self.occupied is None or not np.array_equal(occupied, self.occupied):
+            self.occupied = occupied
+            self.occupied_atoms = ase.Atoms(
+                numbers=atoms.numbers[occupied],
+                positions=atoms.positions[occupied],
+                cell=atoms.cell,
+                pbc=atoms.pbc,
+            )
+            self.occupied_atoms.calc = self.calc
+        else:
+            # an occupied slot can change its element
+            self.occupied_atoms.numbers[:] = atoms.numbers[occupied]
+            self.occupied_atoms.positions[:] = atoms.positions[occupied]
+            self.occupied_atoms.cell = atoms.cell
+        return self.occupied_atoms
+
+    def calculate(self, atoms=None, properties=["energy"], system_changes=all_changes):
+        super().calculate(atoms, properties, system_changes)
+        occupied_atoms = self.get_occupied_atoms(self.atoms)
+
+        energy = occupied_atoms.get_potential_energy()
+        self.results = {"energy": energy, "free_energy": energy}
+        if "forces" in properties:
+            forces = np.zeros((len(self.atoms), 3))
+            forces[self.occupied] = occupied_atoms.get_forces()
+            self.results["forces"] = forces
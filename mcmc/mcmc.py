@@ -1,44 +1,72 @@
 """Performs sampling of surface reconstructions using an MCMC-based algorithm"""
 
 import copy
-import json
 import logging
 import os
 import pickle as pkl
+import random
+import time
 from collections import Counter, defaultdict
 from datetime import datetime
 
 import ase
 import catkit
 import numpy as np
+from ase.calculators.calculator import Calculator
 from ase.calculators.eam import EAM
 from ase.constraints import FixAtoms
 from ase.io import write
-from catkit.gen.adsorption import get_adsorption_sites
 from nff.io.ase import AtomsBatch, EnsembleNFF, NeuralFF
 from nff.utils.cuda import batch_to
 from scipy.spatial import distance
 from scipy.spatial.distance import cdist
 from scipy.special import softmax
 
-from .energy import optimize_slab, slab_energy
+from .energy import (
+    EnergyCache,
+    GhostSlotCalculator,
+    RelaxationWorkspace,
+    SkinNeighborList,
+    close_lammps_sessions,
+    evaluate_slab,
+    load_reference_energies,
+    local_slab_energy,
+    optimize_slab,
+    slab_energy,
+    slab_energy_batch,
+)
 from .plot import plot_summary_stats
 from .slab import (
+    SiteCache,
+    SiteSampler,
+    add_ghost_slots,
     change_site,
     count_adsorption_sites,
+    generate_adsorption_sites,
     get_adsorption_coords,
+    get_array_hash,
     get_complementary_idx,
     get_random_idx,
+    get_site_occupancy,
+    get_site_permutations,
+    get_slab_snapshot,
     initialize_slab,
+    remove_ghost_slots,
+    restore_slab_snapshot,
 )
+from .store import CompactHistory, TrajectoryStore
 from .utils import (
+    AsyncWriter,
     compute_distance_weight_matrix,
-    filter_distances,
+    compute_sparse_distance_weights,
+    filter_site_distances,
     find_closest_points_indices,
     get_cluster_centers,
+    get_site_conflicts,
     plot_clustering_results,
     plot_decay_curve,
     plot_distance_weight_matrix,
+    write_output,
 )
 
 logger = logging.getLogger(__name__)
@@ -46,6 +74,34 @@ file_dir = os.path.dirname(__file__)
 
 ENERGY_DIFF_LIMIT = 1e3  # in eV
 MAX_FORCE_LIMIT = 1 # in eV/AA
+CHECKPOINT_FILE = "checkpoint.pkl"
+TRAJECTORY_FILE = "trajectory.h5"
+
+
+def load_checkpoint(path: str) -> dict:
+    """Load a checkpoint written by `MCMC.save_checkpoint`.
+
+    Parameters
+    ----------
+    path : str
+        Path of the checkpoint file or of the run folder that contains it
+
+    Returns
+    -------
+    dict
+        The checkpoint
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, CHECKPOINT_FILE)
+    with open(path, "rb") as f:
+        return pkl.load(f)
+
+
+def write_slab_files(slab, path: str):
+    """Write a slab as cif and pkl files, with the given path without extension."""
+    write(f"{path}.cif", slab)
+    with open(f"{path}.pkl", "wb") as f:
+        pkl.dump(slab, f)
 
 
 class MCMC:
@@ -112,6 +168,71 @@ class MCMC:
         self.device = kwargs.get("device", "cpu")
         self.rmsd_criterion = kwargs.get("rmsd_criterion", False)
 
+        # preallocate an atom slot for every site so that moves don't change the number of atoms
+        self.fixed_capacity = kwargs.get("fixed_capacity", False)
+        self.slots = None
+
+        self.site_conflicts = None
+        self.substrate_blocked = None
+
+        # evaluate energy differences of site moves on the region around the site
+        self.local_energy_radius = kwargs.get("local_energy_radius", None)
+        self.num_local_accepts = 0
+
+        # relax only the atoms around the changed sites, before and after a move
+        self.active_region_radius = kwargs.get("active_region_radius", None)
+
+        # start relaxations from the relaxed positions of the accepted state
+        self.warm_start = kwargs.get("warm_start", False)
+        self.proposed_positions = None
+
+        # screen proposals with a cheap energy before the expensive one (delayed acceptance)
+        self.screening = kwargs.get("screening", None)
+        self.screening_calc = None
+        self.screening_energy = None
+        self.num_screened_out = 0
+
+        # store structures and statistics in one file instead of one file per structure
+        self.trajectory_store = None
+
+        # keep the history as compact arrays instead of a copy of the slab per sweep
+        self.compact_history = kwargs.get("compact_history", False)
+        self.last_relaxed_slab = None
+
+        # results and relaxed slab of the accepted state, reused at the end of a sweep
+        self.proposed_results = None
+        self.accepted_results = None
+
+        # write files and plots in a background thread instead of in the sampling loop
+        self.writer = None
+
+        # patch the neighbor list of AtomsBatch slabs between moves instead of rebuilding it
+        self.neighbor_list = None
+
+        # relax in persistent slabs instead of a new copy of the slab per relaxation
+        self.workspace = None
+
+        # keep the adsorption sites and the tables derived from them on disk across runs
+        self.site_cache = None
+
+        # chemical potentials relative to the reference element of offset_data
+        self.reference_energies = None
+        self.composition = None
+
+        # sample sites from samplers that are updated after accepted moves
+        self.site_sampler = None
+
+        # evaluate the proposals of the next steps together in one NFF forward pass
+        self.batch_proposals = kwargs.get("batch_proposals", 0)
+        self.pending_proposals = []
+        self.prefetched_results = {}
+
+        # cache energies of already visited site occupancies
+        if kwargs.get("energy_cache_size", 0) > 0:
+            self.energy_cache = EnergyCache(maxsize=kwargs["energy_cache_size"])
+        else:
+            self.energy_cache = None
+
         if self.canonical:
             # perform canonical runs
             # adsorb num_ads_atoms
@@ -142,13 +263,44 @@ class MCMC:
         )
         return curr_similarity
 
+    def get_site_table(self, name: str, compute, **settings):
+        """This function computes a table derived from the adsorption sites, or loads it from the site
+        cache if one is used.
+
+        Parameters
+        ----------
+        name : str
+            The name of the table in the cache.
+        compute : callable
+            Function without arguments that returns the table as a tuple.
+        settings
+            Everything besides the slab and the sites that the table depends on.
+
+        Returns
+        -------
+            the table as a tuple of arrays or sparse matrices.
+
+        """
+        if self.site_cache is None:
+            return tuple(compute())
+        return self.site_cache.get(
+            name, compute, sites=get_array_hash(self.ads_coords), **settings
+        )
+
     def get_adsorption_coords(self):
         """If not already set, this function sets the absolute adsorption coordinates for a given slab and element
-        using the catkit `get_adsorption_sites` method.
+        with `generate_adsorption_sites`, which builds the catkit adsorption site network once.
+
+        If `site_cache` is given, the sites and the tables derived from them are stored in and loaded from
+        that folder, keyed by the pristine slab, the adsorbate and the settings of each table.
 
         """
         # get absolute adsorption coords
         elem = catkit.gratoms.Gratoms(self.element)
+        if self.kwargs.get("site_cache", None):
+            self.site_cache = SiteCache(
+                self.kwargs["site_cache"], self.slab, self.element
+            )
 
         if not (
             (
@@ -157,14 +309,16 @@ class MCMC:
             )
             and (len(self.ads_coords) > 0)
         ):
-            # get ALL the adsorption sites
-            # top should have connectivity 1, bridge should be 2 and hollow more like 4
-            _, self.connectivity, _ = get_adsorption_sites(
-                self.slab, symmetry_reduced=False
-            )
-            self.ads_coords = get_adsorption_coords(
-                self.slab, elem, self.connectivity, debug=True
-            )
+            if self.site_cache is not None:
+                self.ads_coords, self.connectivity = self.site_cache.get(
+                    "sites", lambda: generate_adsorption_sites(self.slab, elem)
+                )
+            else:
+                # get ALL the adsorption sites
+                # top should have connectivity 1, bridge should be 2 and hollow more like 4
+                self.ads_coords, self.connectivity = generate_adsorption_sites(
+                    self.slab, elem
+                )
         else:
             # fake connectivity for user defined adsorption sites
             self.connectivity = np.ones(len(self.ads_coords), dtype=int)
@@ -172,10 +326,44 @@ class MCMC:
         # if require distance decay
         distance_decay_factor = self.kwargs.get("distance_decay_factor", 1.0)
         if self.kwargs.get("require_distance_decay", False):
-            if self.distance_weight_matrix is None:
+            if self.distance_weight_matrix is None and self.kwargs.get(
+                "sparse_distance_decay", False
+            ):
+                logger.info("computing sparse distance weights")
+                settings = {
+                    "distance_decay_factor": distance_decay_factor,
+                    "cutoff": self.kwargs.get("distance_decay_cutoff", None),
+                    "dtype": self.kwargs.get("distance_weights_dtype", np.float64),
+                }
+                memmap_folder = self.kwargs.get("distance_weights_memmap", None)
+
+                def compute_weights():
+                    return (
+                        compute_sparse_distance_weights(
+                            self.slab,
+                            self.ads_coords,
+                            memmap_folder=memmap_folder,
+                            **settings,
+                        ),
+                    )
+
+                if memmap_folder:
+                    # memory-mapped weights are already kept on disk
+                    (self.distance_weight_matrix,) = compute_weights()
+                else:
+                    (self.distance_weight_matrix,) = self.get_site_table(
+                        "sparse_distance_weights", compute_weights, **settings
+                    )
+            elif self.distance_weight_matrix is None:
                 logger.info("computing distance weight matrix")
-                self.distance_weight_matrix = compute_distance_weight_matrix(
-                    self.ads_coords, distance_decay_factor
+                (self.distance_weight_matrix,) = self.get_site_table(
+                    "distance_weights",
+                    lambda: (
+                        compute_distance_weight_matrix(
+                            self.ads_coords, distance_decay_factor
+                        ),
+                    ),
+                    distance_decay_factor=distance_decay_factor,
                 )
             else:
                 logger.info("using provided distance weight matrix")
@@ -186,6 +374,31 @@ class MCMC:
 
         self.site_types = set(self.connectivity)
 
+        if self.kwargs.get("filter_distance", None):
+            # sites too close to each other can't be occupied at the same time
+            self.site_conflicts, self.substrate_blocked = self.get_site_table(
+                "site_conflicts",
+                lambda: get_site_conflicts(
+                    self.slab,
+                    self.ads_coords,
+                    ads=self.adsorbates,
+                    cutoff_distance=self.kwargs["filter_distance"],
+                    num_substrate_atoms=self.num_pristine_atoms,
+                ),
+                ads=self.adsorbates,
+                cutoff_distance=self.kwargs["filter_distance"],
+                num_substrate_atoms=self.num_pristine_atoms,
+            )
+
+        if self.energy_cache is not None and self.kwargs.get(
+            "energy_cache_symmetry", False
+        ):
+            # equivalent configurations share an entry
+            (self.energy_cache.site_permutations,) = self.get_site_table(
+                "site_permutations",
+                lambda: (get_site_permutations(self.slab, self.ads_coords),),
+            )
+
         logger.info(
             f"In pristine slab, there are a total of {len(self.ads_coords)} sites"
         )
@@ -252,10 +465,50 @@ class MCMC:
             Cu_alat = 3.6147
             self.slab = initialize_slab(Cu_alat)
 
+        if self.fixed_capacity and not isinstance(self.calc, GhostSlotCalculator):
+            if (
+                type(self.slab) is AtomsBatch
+                or self.kwargs.get("optimizer", None) == "LAMMPS"
+            ):
+                raise ValueError(
+                    "fixed_capacity is only supported for ASE calculators and optimizers"
+                )
+            # hide the empty slots from the calculator
+            self.calc = GhostSlotCalculator(self.calc)
+
         # attach slab calculator
         self.slab.calc = self.calc
         logger.info(f"using slab calc {self.slab.calc}")
 
+        if type(self.slab) is AtomsBatch and self.kwargs.get("neighbor_skin", None):
+            self.neighbor_list = SkinNeighborList(skin=self.kwargs["neighbor_skin"])
+        if self.relax and self.kwargs.get("relaxation_workspace", False):
+            self.workspace = RelaxationWorkspace()
+
+        if self.screening == "eam":
+            self.screening_calc = EAM(
+                potential=self.kwargs.get(
+                    "screening_potential",
+                    os.path.join(
+                        os.path.dirname(os.path.realpath(__file__)),
+                        "potentials",
+                        "Cu2.eam.fs",
+                    ),
+                )
+            )
+        elif self.screening == "ensemble_member":
+            if not isinstance(self.calc, EnsembleNFF):
+                raise ValueError("ensemble_member screening requires an EnsembleNFF")
+            self.screening_calc = EnsembleNFF(
+                self.calc.models[:1], device=self.calc.device
+            )
+        elif isinstance(self.screening, Calculator):
+            self.screening_calc = self.screening
+        elif self.screening not in (None, "unrelaxed"):
+            raise ValueError(f"unknown screening {self.screening}")
+        if self.screening:
+            logger.info(f"screening proposals with {self.screening} energies")
+
         self.slab.write(os.path.join(self.run_folder, "starting_slab.cif"))
         # with open(os.path.join(self.run_folder, "starting_slab.pkl")) as f:
         #     pkl.dump(self.slab, f)
@@ -301,6 +554,385 @@ class MCMC:
             f"Running with num_sweeps = {self.total_sweeps}, temp = {self.start_temp}, pot = {self.pot}, alpha = {self.alpha}"
         )
 
+    def compute_energy(self, **kwargs):
+        """This function calculates the energy of the current slab with `slab_energy`. If the energy cache
+        is enabled, energies of already visited site occupancies are taken from the cache instead.
+
+        The results and relaxed slab of an evaluation of the whole slab are kept in `proposed_results`,
+        so that they can be reused at the end of the sweep if the proposal is accepted.
+
+        Returns
+        -------
+            the results of `slab_energy`.
+
+        """
+        # per atom energies depend on the atom ordering and active region energies on the
+        # region, so they are not cached
+        use_cache = (
+            self.energy_cache is not None
+            and not self.kwargs.get("require_per_atom_energies", False)
+            and kwargs.get("active_centers", None) is None
+        )
+        if use_cache:
+            key = self.energy_cache.get_key(get_site_occupancy(self.slab, self.state))
+            results = self.energy_cache.get(key)
+            if results is not None:
+                logger.debug("using cached energy")
+                self.proposed_positions = None
+                self.proposed_results = (results, None)
+                return results
+
+        if self.prefetched_results:
+            results = self.prefetched_results.get(
+                get_site_occupancy(self.slab, self.state).tobytes(), None
+            )
+            if results is not None:
+                logger.debug("using prefetched energy")
+                self.proposed_results = (results, None)
+                return results
+
+        if self.warm_start and self.relax:
+            results, relaxed_slab = self.evaluate_warm_start(**kwargs)
+            self.proposed_positions = relaxed_slab.get_positions()
+        else:
+            results, relaxed_slab = evaluate_slab(
+                self.slab,
+                relax=self.relax,
+                folder_name=self.run_folder,
+                neighbor_list=self.neighbor_list,
+                workspace=self.workspace,
+                composition=self.composition,
+                **kwargs,
+                **self.kwargs,
+            )
+        if kwargs.get("active_centers", None) is None:
+            self.proposed_results = (results, relaxed_slab if self.relax else None)
+        # relaxations stopped early by the energy ceiling don't give the relaxed energy
+        if use_cache and results[0] <= kwargs.get("energy_ceiling", np.inf):
+            self.energy_cache.put(key, results)
+        return results
+
+    def use_batch_proposals(self):
+        """This function checks whether the proposals are evaluated in batches of `batch_proposals`. This
+        needs an NFF calculator and the plain unrelaxed energy of the whole slab as acceptance criterion.
+        """
+        return (
+            self.batch_proposals > 1
+            and type(self.slab) is AtomsBatch
+            and self.kwargs.get("optimizer", None) != "LAMMPS"
+            and not self.relax
+            and not self.testing
+            and not self.rmsd_criterion
+            and not self.screening
+            and not self.local_energy_radius
+            and not self.kwargs.get("filter_distance", None)
+            and not self.kwargs.get("require_per_atom_energies", False)
+        )
+
+    def prefetch_proposals(self, iter: int, canonical: bool = False):
+        """This function draws the proposals of the next `batch_proposals` steps of the sweep from the
+        current state and calculates their energies with `slab_energy_batch` in one forward pass.
+
+        The state only changes when a proposal is accepted, so the proposals are used in order until one
+        is accepted and the others are discarded then. Each proposal is drawn the same way as without
+        batching, so the chain samples the same distribution.
+
+        Parameters
+        ----------
+        iter : int
+            The iteration number of the first proposal.
+        canonical : bool, optional
+            Draw canonical swaps of two sites instead of semi-grand canonical site changes.
+
+        """
+        # the temperature and the site weights may change at the end of the sweep
+        num_proposals = min(
+            self.batch_proposals, self.sweep_size - (iter - 1) % self.sweep_size
+        )
+        proposal_slabs = []
+        compositions = []
+        keys = []
+        calc = self.slab.calc
+        for run_iter in range(iter, iter + num_proposals):
+            snapshot = self.get_snapshot()
+            if canonical:
+                proposal = self.get_canonical_sites(run_iter)
+                self.swap_sites(*proposal)
+            else:
+                site_idx = get_random_idx(self.connectivity)
+                self.slab, self.state, _, _, end_ads = change_site(
+                    self.slab,
+                    self.state,
+                    self.pot,
+                    self.adsorbates,
+                    self.ads_coords,
+                    site_idx,
+                    slots=self.slots,
+                    reference_energies=self.reference_energies,
+                    composition=self.composition,
+                    **self.kwargs,
+                )
+                proposal = (site_idx, end_ads)
+            self.pending_proposals.append(proposal)
+            keys.append(get_site_occupancy(self.slab, self.state).tobytes())
+            if self.composition is not None:
+                compositions.append(self.composition.copy())
+            self.slab.calc = None
+            proposal_slabs.append(copy.deepcopy(self.slab))
+            self.slab.calc = calc
+            self.restore_snapshot(snapshot)
+
+        energy, energy_std, max_force, force_std = slab_energy_batch(
+            proposal_slabs,
+            calc=calc,
+            offset=self.kwargs.get("offset", None),
+            offset_data=self.kwargs.get("offset_data", None),
+            compositions=compositions or None,
+        )
+        self.prefetched_results = {
+            key: (
+                float(energy[k]),
+                float(energy_std[k]),
+                float(max_force[k]),
+                float(force_std[k]),
+                [],
+            )
+            for k, key in enumerate(keys)
+        }
+        logger.debug(f"prefetched the energies of {num_proposals} proposals")
+
+    def discard_proposals(self):
+        """This function discards the proposals drawn from a state that is no longer the current one."""
+        self.pending_proposals = []
+        self.prefetched_results = {}
+
+    def compute_screening_energy(self):
+        """This function calculates the cheap energy of the current slab that screens proposals in the
+        first stage of delayed acceptance. Depending on `screening`, it is the unrelaxed energy, the
+        energy of an EAM potential or ASE calculator, or the energy of a single NFF ensemble member.
+
+        Returns
+        -------
+            the screening energy.
+
+        """
+        if self.screening_calc is None or isinstance(self.screening_calc, EnsembleNFF):
+            calc = self.slab.calc
+            if self.screening_calc is not None:
+                self.slab.calc = self.screening_calc
+            try:
+                return slab_energy(
+                    self.slab,
+                    relax=False,
+                    neighbor_list=self.neighbor_list,
+                    optimizer=self.kwargs.get("optimizer", None),
+                    offset=self.kwargs.get("offset", None),
+                    offset_data=self.kwargs.get("offset_data", None),
+                    composition=self.composition,
+                )[0]
+            finally:
+                self.slab.calc = calc
+
+        # other calculators get the plain atoms, without the empty slots of fixed capacity slabs
+        occupied = self.slab.numbers > 0
+        atoms = ase.Atoms(
+            numbers=self.slab.numbers[occupied],
+            positions=self.slab.positions[occupied],
+            cell=self.slab.cell,
+            pbc=self.slab.pbc,
+        )
+        atoms.calc = self.screening_calc
+        return float(atoms.get_potential_energy())
+
+    def screen_proposal(self, delta_pot: float = 0.0):
+        """This function performs the first stage of delayed acceptance with the screening energy.
+
+        Parameters
+        ----------
+        delta_pot : float, optional
+            The chemical potential energy change of the move.
+
+        Returns
+        -------
+            whether the proposal passed the first stage, its screening energy and the screening energy
+        difference.
+
+        """
+        screening_energy = self.compute_screening_energy()
+        screening_diff = screening_energy - self.screening_energy
+        logger.debug(f"screening energy diff is {screening_diff}")
+        with np.errstate(over="ignore"):
+            screening_prob = np.exp(-(screening_diff - delta_pot) / self.temp)
+        passed = np.random.rand() < screening_prob
+        if not passed:
+            self.num_screened_out += 1
+        return passed, screening_energy, screening_diff
+
+    def get_energy_ceiling(self, reference_energy: float, delta_pot: float = 0.0):
+        """This function draws the uniform random number of the Metropolis test before the energy is
+        calculated and converts it into the highest energy that can still be accepted. With
+        `early_rejection`, relaxations are stopped as soon as their energy can't get below it.
+
+        Parameters
+        ----------
+        reference_energy : float
+            The energy before the move, calculated the same way as the energy after the move.
+        delta_pot : float, optional
+            The chemical potential energy change of the move, or the screening energy difference in the
+        second stage of delayed acceptance.
+
+        Returns
+        -------
+            the random number and the energy ceiling.
+
+        """
+        u = np.random.rand()
+        with np.errstate(divide="ignore"):
+            energy_ceiling = reference_energy + delta_pot - self.temp * np.log(u)
+        return u, energy_ceiling
+
+    def evaluate_warm_start(self, **kwargs):
+        """This function relaxes the current slab starting from the relaxed positions of the accepted
+        state, which are kept in the `relaxed_positions` array of the slab. The slab itself keeps the
+        ideal site positions.
+
+        Returns
+        -------
+            the results of `slab_energy` and the relaxed slab.
+
+        """
+        ideal_positions = self.slab.get_positions()
+        self.slab.set_positions(
+            self.slab.arrays["relaxed_positions"], apply_constraint=False
+        )
+        try:
+            return evaluate_slab(
+                self.slab,
+                relax=True,
+                folder_name=self.run_folder,
+                neighbor_list=self.neighbor_list,
+                workspace=self.workspace,
+                composition=self.composition,
+                **kwargs,
+                **self.kwargs,
+            )
+        finally:
+            self.slab.set_positions(ideal_positions, apply_constraint=False)
+
+    def reset_relaxed_positions(self, site_indices: list):
+        """This function places the adsorbates on the given sites at their ideal positions in the
+        relaxation starting positions, e.g. after they were moved.
+
+        Parameters
+        ----------
+        site_indices : list
+            The sites that were changed.
+
+        """
+        # replace the array so that snapshots taken before the move keep the old one
+        relaxed_positions = self.slab.arrays["relaxed_positions"].copy()
+        for site_idx in site_indices:
+            ads_idx = self.state[site_idx]
+            if ads_idx:
+                relaxed_positions[ads_idx] = self.slab.positions[ads_idx]
+        self.slab.arrays["relaxed_positions"] = relaxed_positions
+        self.proposed_positions = None
+
+    def accept_relaxed_positions(self):
+        """This function keeps the relaxed positions of the accepted proposal as the starting positions
+        of the next relaxations."""
+        if self.proposed_positions is not None:
+            self.slab.arrays["relaxed_positions"] = self.proposed_positions
+            self.proposed_positions = None
+
+    def compute_local_energy(self, site_idx: int, **kwargs):
+        """This function calculates the energy of the region of the slab around a site with
+        `local_slab_energy`. The region has a radius of `local_energy_radius` and a fixed buffer of
+        `local_energy_buffer` around it.
+
+        Returns
+        -------
+            the results of `local_slab_energy`.
+
+        """
+        return local_slab_energy(
+            self.slab,
+            self.ads_coords[site_idx],
+            self.local_energy_radius,
+            buffer=self.kwargs.get("local_energy_buffer", 4.0),
+            relax=self.relax,
+            folder_name=self.run_folder,
+            **kwargs,
+            **self.kwargs,
+        )
+
+    def compute_active_energy(self, site_indices: list, **kwargs):
+        """This function calculates the energy of the current slab where only the atoms within
+        `active_region_radius` of the given sites are relaxed.
+
+        Returns
+        -------
+            the results of `slab_energy`.
+
+        """
+        return self.compute_energy(
+            active_centers=np.asarray(self.ads_coords)[site_indices], **kwargs
+        )
+
+    def check_local_energy_drift(self, energy: float):
+        """This function compares the energy accumulated from local or active region energy differences
+        with the energy of the whole slab every `local_energy_check_every` accepted moves.
+
+        Parameters
+        ----------
+        energy : float
+            The energy accumulated from local energy differences.
+
+        Returns
+        -------
+            the energy of the whole slab if it was calculated, otherwise `energy`.
+
+        """
+        self.num_local_accepts += 1
+        if self.num_local_accepts % self.kwargs.get("local_energy_check_every", 100):
+            return energy
+
+        full_energy = self.compute_energy()[0]
+        drift = energy - full_energy
+        logger.info(f"local energy drift is {drift:.4f} eV")
+        if np.abs(drift) > self.kwargs.get("local_energy_tolerance", 0.1):
+            logger.warning(
+                f"local energy drift of {drift:.4f} eV, consider increasing local_energy_radius or active_region_radius"
+            )
+        return full_energy
+
+    def detach_relaxed_slab(self, relaxed_slab):
+        """This function copies a relaxed slab out of the relaxation workspace, so that it is not
+        overwritten by the next relaxation.
+
+        Parameters
+        ----------
+        relaxed_slab : ase.Atoms
+            The relaxed slab returned by `evaluate_slab`, or None.
+
+        Returns
+        -------
+            the relaxed slab, copied if it is one of the persistent slabs of the workspace.
+
+        """
+        if self.workspace is None:
+            return relaxed_slab
+        return self.workspace.detach(relaxed_slab)
+
+    def accept_results(self):
+        """This function keeps the results and relaxed slab of the accepted proposal so that they can be
+        reused at the end of the sweep.
+        """
+        if self.proposed_results is not None:
+            results, relaxed_slab = self.proposed_results
+            self.proposed_results = (results, self.detach_relaxed_slab(relaxed_slab))
+        self.accepted_results = self.proposed_results
+
     def get_initial_energy(self):
         """This function returns the initial energy of a slab, which is calculated using the slab_energy
         function if the slab does not exists.
@@ -313,11 +945,12 @@ class MCMC:
         """
         # sometimes slab.calc does not exist
         if self.slab.calc:
-            results = slab_energy(
-                self.slab, relax=self.relax, folder_name=self.run_folder, **self.kwargs
-            )
+            results = self.compute_energy()
             energy = results[0]
             self.per_atom_energies = results[-1]
+            self.accept_results()
+            if self.warm_start:
+                self.accept_relaxed_positions()
         else:
             energy = 0
 
@@ -411,17 +1044,84 @@ class MCMC:
             else:
                 logger.info("randomly adsorbing sites")
                 # perform semi-grand canonical until num_ads_atoms are obtained
-                while len(self.slab) < self.num_pristine_atoms + self.num_ads_atoms:
+                while np.count_nonzero(self.state) < self.num_ads_atoms:
                     self.curr_energy, _ = self.change_site(prev_energy=self.curr_energy)
                     # site_idx = next(site_iterator)
                     # self.curr_energy, _ = self.change_site(
                     #     prev_energy=self.curr_energy, site_idx=site_idx
                     # )
 
-            self.slab.write(
+            self.get_saved_slab().write(
                 os.path.join(self.run_folder, f"{self.surface_name}_canonical_init.cif")
             )
 
+    def save_proposal(self, iter: int):
+        """This function saves the proposed slab of an iteration to the trajectory store, or as a cif
+        file if there is no store.
+
+        Parameters
+        ----------
+        iter : int
+            The iteration number.
+
+        """
+        saved_slab = self.get_saved_slab().copy()
+        if self.trajectory_store is not None:
+            self.write_output(
+                self.trajectory_store.append,
+                "proposals",
+                saved_slab,
+                state=np.array(self.state),
+                iteration=iter,
+            )
+            return
+
+        if not os.path.exists(self.run_folder):
+            os.makedirs(self.run_folder)
+        self.write_output(
+            write, f"{self.run_folder}/proposed_slab_iter_{iter:03}.cif", saved_slab
+        )
+
+    def store_sweep(
+        self,
+        i: int,
+        energy: float,
+        energy_std: float,
+        force_std: float,
+        relaxed_slab=None,
+    ):
+        """This function appends the slab at the end of a sweep and its relaxed structure to the
+        trajectory store.
+
+        Parameters
+        ----------
+        i : int
+            The sweep number.
+        energy, energy_std, force_std : float
+            The energy of the slab and the uncertainties of the energy and forces.
+        relaxed_slab : ase.Atoms, optional
+            The relaxed slab.
+
+        """
+        self.write_output(
+            self.trajectory_store.append,
+            "sweeps",
+            self.get_saved_slab().copy(),
+            state=np.array(self.state),
+            sweep=i + 1,
+            energy=energy,
+            energy_std=energy_std,
+            force_std=force_std,
+            temp=self.temp,
+            frac_accept=self.frac_accept_hist[i],
+        )
+        if self.relax and relaxed_slab is not None:
+            if self.fixed_capacity:
+                relaxed_slab = remove_ghost_slots(relaxed_slab)
+            self.write_output(
+                self.trajectory_store.append, "relaxed", relaxed_slab, sweep=i + 1
+            )
+
     def save_structures(self, i: int = 0, **kwargs):
         """This function saves the optimized structure of a slab and calculates its energy and force error.
 
@@ -437,22 +1137,42 @@ class MCMC:
 
         """
         testing = kwargs.get("testing", False)
+        # the relaxation trajectory files are replaced by the store
+        save = self.trajectory_store is None
         if testing:
             energy = 0
             energy_std = 0
             force_std = 0
+            relaxed_slab = None
         else:
-            results = slab_energy(
-                self.slab,
-                relax=self.relax,
-                folder_name=self.run_folder,
-                iter=i + 1,
-                save=True,
-                **self.kwargs,
-            )
+            if self.accepted_results is not None and (
+                not self.relax or self.accepted_results[1] is not None
+            ):
+                # the slab was already evaluated when its state was accepted
+                logger.debug("reusing the results of the accepted state")
+                results, relaxed_slab = self.accepted_results
+            elif self.warm_start and self.relax:
+                results, relaxed_slab = self.evaluate_warm_start(iter=i + 1, save=save)
+                relaxed_slab = self.detach_relaxed_slab(relaxed_slab)
+                self.accepted_results = (results, relaxed_slab)
+            else:
+                results, relaxed_slab = evaluate_slab(
+                    self.slab,
+                    relax=self.relax,
+                    folder_name=self.run_folder,
+                    iter=i + 1,
+                    save=save,
+                    neighbor_list=self.neighbor_list,
+                    workspace=self.workspace,
+                    composition=self.composition,
+                    **self.kwargs,
+                )
+                relaxed_slab = self.detach_relaxed_slab(relaxed_slab)
+                self.accepted_results = (results, relaxed_slab if self.relax else None)
             energy = results[0]
             energy_std = results[1]
             force_std = results[3]
+        self.last_relaxed_slab = relaxed_slab if self.relax else None
 
         if type(self.slab) is AtomsBatch:
             logger.info(
@@ -465,20 +1185,9 @@ class MCMC:
 
             if kwargs.get("offset_data", None):
                 ads_pot_dict = dict(zip(self.adsorbates, self.pot))
-                ads_count = Counter(self.slab.get_chemical_symbols())
-
-                with open(kwargs["offset_data"]) as f:
-                    offset_data = json.load(f)
-                stoics = offset_data["stoics"]
-                ref_element = offset_data["ref_element"]
-
-                pot = 0
-                for ele, _ in ads_count.items():
-                    if ele != ref_element:
-                        pot += (
-                            ads_count[ele]
-                            - stoics[ele] / stoics[ref_element] * ads_count[ref_element]
-                        ) * ads_pot_dict[ele]
+                pot = self.reference_energies.get_pot_energy(
+                    self.composition, ads_pot_dict
+                )
 
                 energy -= pot
                 logger.info(
@@ -493,72 +1202,53 @@ class MCMC:
 
             logger.info(f"average force error = {force_std:.3f}")
 
+            if self.trajectory_store is not None:
+                self.store_sweep(i, energy, energy_std, force_std, relaxed_slab)
+                return energy
+
             # save cif and pkl file
-            write(
-                f"{self.run_folder}/final_slab_run_{i+1:03}_{energy:.3f}err{force_std:.3f}_{self.slab.get_chemical_formula()}.cif",
-                self.slab,
-            )
-            save_slab = self.slab.copy()
+            save_slab = self.get_saved_slab().copy()
             save_slab.calc = None
-            with open(
-                f"{self.run_folder}/final_slab_run_{i+1:03}_{energy:.3f}err{force_std:.3f}_{self.slab.get_chemical_formula()}.pkl",
-                "wb",
-            ) as f:
-                pkl.dump(save_slab, f)
+            self.write_output(
+                write_slab_files,
+                save_slab,
+                f"{self.run_folder}/final_slab_run_{i+1:03}_{energy:.3f}err{force_std:.3f}_{save_slab.get_chemical_formula()}",
+            )
 
         else:
             energy = self.curr_energy
             logger.info(f"optim structure has Energy = {energy}")
 
+            if self.trajectory_store is not None:
+                self.store_sweep(i, energy, energy_std, force_std, relaxed_slab)
+                return energy
+
             # save cif file
-            write(
-                f"{self.run_folder}/final_slab_run_{i+1:03}_{energy:.3f}_{self.slab.get_chemical_formula()}.cif",
-                self.slab,
-            )
-            save_slab = self.slab.copy()
+            save_slab = self.get_saved_slab().copy()
             save_slab.calc = None
-            with open(
-                f"{self.run_folder}/final_slab_run_{i+1:03}_{energy:.3f}_{self.slab.get_chemical_formula()}.pkl",
-                "wb",
-            ) as f:
-                pkl.dump(save_slab, f)
+            self.write_output(
+                write_slab_files,
+                save_slab,
+                f"{self.run_folder}/final_slab_run_{i+1:03}_{energy:.3f}_{save_slab.get_chemical_formula()}",
+            )
 
         return energy
 
-    def change_site_canonical(self, prev_energy: float = 0, iter: int = 1):
-        """This function performs a canonical sampling step. It switches the adsorption sites of two
-        adsorbates and checks if the change is energetically favorable.
+    def get_canonical_sites(self, iter: int):
+        """This function chooses 2 sites of different adsorbates (empty counts too) to switch with
+        `get_complementary_idx`.
 
         Parameters
         ----------
-        prev_energy : float, optional
-            The energy of the current state before attempting to change it. If it is not provided and the
-        `testing` flag is not set, it will be calculated using the `slab_energy` function.
-        iter : int, optional
-            An integer representing the current iteration number of the function.
+        iter : int
+            The iteration number of the move, the site weights are plotted at the end of a sweep.
 
         Returns
         -------
-            the energy of the new slab and a boolean value indicating whether the proposed change was
-        accepted or not.
+            the indices and adsorbates of both sites.
 
         """
-        if iter % self.sweep_size == 0:
-            logger.info(f"At iter {iter}")
-            plot_specific_distance_weights = True
-        else:
-            plot_specific_distance_weights = False
-
-        if not prev_energy and not self.testing:
-            # calculate energy of current state
-            results = slab_energy(
-                self.slab, relax=self.relax, folder_name=self.run_folder, **self.kwargs
-            )
-            prev_energy = results[0]
-            self.per_atom_energies = results[-1]
-
-        # choose 2 sites of different ads (empty counts too) to switch
-        site1_idx, site2_idx, site1_ads, site2_ads = get_complementary_idx(
+        return get_complementary_idx(
             self.state,
             slab=self.slab,
             require_per_atom_energies=self.kwargs.get(
@@ -566,31 +1256,18 @@ class MCMC:
             ),
             require_distance_decay=self.kwargs.get("require_distance_decay", False),
             per_atom_energies=self.per_atom_energies,
+            site_sampler=self.site_sampler,
             distance_weight_matrix=self.distance_weight_matrix,
             temp=self.temp,
             ads_coords=self.ads_coords,
             run_folder=self.run_folder,
-            plot_weights=plot_specific_distance_weights,
+            plot_weights=iter % self.sweep_size == 0,
             run_iter=iter,
+            writer=self.writer,
         )
 
-        site1_coords = self.ads_coords[site1_idx]
-        site2_coords = self.ads_coords[site2_idx]
-
-        logger.debug(f"\n we are at iter {iter}")
-        logger.debug(
-            f"idx is {site1_idx} with connectivity {self.connectivity[site1_idx]} at {site1_coords}"
-        )
-        logger.debug(
-            f"idx is {site2_idx} with connectivity {self.connectivity[site2_idx]} at {site2_coords}"
-        )
-
-        logger.debug(f"before proposed state is")
-        logger.debug(self.state)
-
-        logger.debug(f"current slab has {len(self.slab)} atoms")
-
-        # effectively switch ads at both sites
+    def swap_sites(self, site1_idx: int, site2_idx: int, site1_ads, site2_ads):
+        """This function switches the adsorbates of two sites of the current slab."""
         self.slab, self.state, _, _, _ = change_site(
             self.slab,
             self.state,
@@ -600,6 +1277,9 @@ class MCMC:
             site1_idx,
             start_ads=site1_ads,
             end_ads=site2_ads,
+            slots=self.slots,
+            reference_energies=self.reference_energies,
+            composition=self.composition,
             **self.kwargs,
         )
         self.slab, self.state, _, _, _ = change_site(
@@ -611,9 +1291,84 @@ class MCMC:
             site2_idx,
             start_ads=site2_ads,
             end_ads=site1_ads,
+            slots=self.slots,
+            reference_energies=self.reference_energies,
+            composition=self.composition,
             **self.kwargs,
         )
 
+    def change_site_canonical(self, prev_energy: float = 0, iter: int = 1):
+        """This function performs a canonical sampling step. It switches the adsorption sites of two
+        adsorbates and checks if the change is energetically favorable.
+
+        Parameters
+        ----------
+        prev_energy : float, optional
+            The energy of the current state before attempting to change it. If it is not provided and the
+        `testing` flag is not set, it will be calculated using the `slab_energy` function.
+        iter : int, optional
+            An integer representing the current iteration number of the function.
+
+        Returns
+        -------
+            the energy of the new slab and a boolean value indicating whether the proposed change was
+        accepted or not.
+
+        """
+        if iter % self.sweep_size == 0:
+            logger.info(f"At iter {iter}")
+
+        if not prev_energy and not self.testing:
+            # calculate energy of current state
+            results = self.compute_energy()
+            prev_energy = results[0]
+            self.per_atom_energies = results[-1]
+
+        if self.use_batch_proposals():
+            if not self.pending_proposals:
+                self.prefetch_proposals(iter, canonical=True)
+            site1_idx, site2_idx, site1_ads, site2_ads = self.pending_proposals.pop(0)
+        else:
+            site1_idx, site2_idx, site1_ads, site2_ads = self.get_canonical_sites(iter)
+
+        site1_coords = self.ads_coords[site1_idx]
+        site2_coords = self.ads_coords[site2_idx]
+
+        logger.debug(f"\n we are at iter {iter}")
+        logger.debug(
+            f"idx is {site1_idx} with connectivity {self.connectivity[site1_idx]} at {site1_coords}"
+        )
+        logger.debug(
+            f"idx is {site2_idx} with connectivity {self.connectivity[site2_idx]} at {site2_coords}"
+        )
+
+        logger.debug(f"before proposed state is")
+        logger.debug(self.state)
+
+        logger.debug(f"current slab has {len(self.slab)} atoms")
+
+        # only relax the atoms around the two sites
+        use_active_region = (
+            self.active_region_radius
+            and self.relax
+            and not self.testing
+            and not self.rmsd_criterion
+            and not self.kwargs.get("filter_distance", None)
+        )
+        if use_active_region:
+            # the previous energy is relaxed with the same frozen atoms to be consistent
+            prev_active_energy = self.compute_active_energy([site1_idx, site2_idx])[0]
+
+        # record the current slab so that a rejected move can be undone
+        snapshot = self.get_snapshot()
+        self.proposed_results = None
+
+        # effectively switch ads at both sites
+        self.swap_sites(site1_idx, site2_idx, site1_ads, site2_ads)
+
+        if self.warm_start:
+            self.reset_relaxed_positions([site1_idx, site2_idx])
+
         # make sure num atoms is conserved
         logger.debug(f"proposed slab has {len(self.slab)} atoms")
 
@@ -621,47 +1376,37 @@ class MCMC:
         logger.debug(self.state)
 
         if self.kwargs.get("save_cif", False):
-            if not os.path.exists(self.run_folder):
-                os.makedirs(self.run_folder)
-            write(f"{self.run_folder}/proposed_slab_iter_{iter:03}.cif", self.slab)
+            self.save_proposal(iter)
+
+        # first stage of delayed acceptance with the cheap screening energy
+        use_screening = (
+            self.screening
+            and not self.testing
+            and not self.rmsd_criterion
+            and not self.kwargs.get("filter_distance", None)
+        )
+        passed_screening = True
+        if use_screening:
+            passed_screening, screening_energy, screening_diff = self.screen_proposal()
 
         # to test, always accept
         accept = False
 
         if self.kwargs.get("filter_distance", None):
-            filter_distance = self.kwargs["filter_distance"]
             energy = 0
 
-            if filter_distances(
-                self.slab, ads=self.adsorbates, cutoff_distance=filter_distance
+            if filter_site_distances(
+                self.state,
+                self.site_conflicts,
+                [site1_idx, site2_idx],
+                substrate_blocked=self.substrate_blocked,
             ):
                 # succeeds! keep already changed slab
                 logger.debug("state changed with filtering!")
                 accept = True
             else:
                 # failed, keep current state and revert slab back to original
-                self.slab, self.state, _, _, _ = change_site(
-                    self.slab,
-                    self.state,
-                    self.pot,
-                    self.adsorbates,
-                    self.ads_coords,
-                    site1_idx,
-                    start_ads=site2_ads,
-                    end_ads=site1_ads,
-                    **self.kwargs,
-                )
-                self.slab, self.state, _, _, _ = change_site(
-                    self.slab,
-                    self.state,
-                    self.pot,
-                    self.adsorbates,
-                    self.ads_coords,
-                    site2_idx,
-                    start_ads=site1_ads,
-                    end_ads=site2_ads,
-                    **self.kwargs,
-                )
+                self.restore_snapshot(snapshot)
 
                 logger.debug("state kept the same with filtering")
         elif self.rmsd_criterion:
@@ -688,53 +1433,50 @@ class MCMC:
                 # state = state.copy()
                 logger.debug("state changed!")
                 # still give the relaxed energy
-                results = slab_energy(
-                    self.slab,
-                    relax=self.relax,
-                    folder_name=self.run_folder,
-                    **self.kwargs,
-                )
+                results = self.compute_energy()
                 curr_energy = results[0]
                 energy = curr_energy
                 accept = True
                 self.curr_similarity = curr_similarity  # update current similarity
             else:
                 # failed, keep current state and revert slab back to original
-                self.slab, self.state, _, _, _ = change_site(
-                    self.slab,
-                    self.state,
-                    self.pot,
-                    self.adsorbates,
-                    self.ads_coords,
-                    site1_idx,
-                    start_ads=site2_ads,
-                    end_ads=site1_ads,
-                    **self.kwargs,
-                )
-                self.slab, self.state, _, _, _ = change_site(
-                    self.slab,
-                    self.state,
-                    self.pot,
-                    self.adsorbates,
-                    self.ads_coords,
-                    site2_idx,
-                    start_ads=site1_ads,
-                    end_ads=site2_ads,
-                    **self.kwargs,
-                )
+                self.restore_snapshot(snapshot)
                 logger.debug("state kept the same")
                 energy = prev_energy
                 accept = False
         elif self.testing:
             energy = 0
+        elif not passed_screening:
+            # failed, keep current state and revert slab back to original
+            self.restore_snapshot(snapshot)
+            logger.debug("state kept the same with screening")
+            energy = prev_energy
         else:
+            # the second stage of delayed acceptance corrects for the screening energy difference
+            energy_shift = screening_diff if use_screening else 0.0
+
+            # draw the Metropolis threshold first to stop relaxations that can't be accepted
+            use_early_rejection = (
+                self.kwargs.get("early_rejection", False) and self.relax
+            )
+            energy_kwargs = {}
+            if use_early_rejection:
+                u, energy_kwargs["energy_ceiling"] = self.get_energy_ceiling(
+                    prev_active_energy if use_active_region else prev_energy,
+                    delta_pot=energy_shift,
+                )
+
             # use relaxation only to get lowest energy
             # but don't update adsorption positions
-            results = slab_energy(
-                self.slab, relax=self.relax, folder_name=self.run_folder, **self.kwargs
-            )
-            curr_energy = results[0]
-            self.per_atom_energies = results[-1]
+            if use_active_region:
+                results = self.compute_active_energy(
+                    [site1_idx, site2_idx], **energy_kwargs
+                )
+                curr_energy = prev_energy + results[0] - prev_active_energy
+            else:
+                results = self.compute_energy(**energy_kwargs)
+                curr_energy = results[0]
+                self.per_atom_energies = results[-1]
             logger.debug(f"prev energy is {prev_energy}")
             logger.debug(f"curr energy is {curr_energy}")
 
@@ -748,39 +1490,25 @@ class MCMC:
             if np.abs(energy_diff) > ENERGY_DIFF_LIMIT:
                 base_prob = 0.0
             else:
-                base_prob = np.exp(-energy_diff / self.temp)
+                base_prob = np.exp(-(energy_diff - energy_shift) / self.temp)
             logger.debug(f"base probability is {base_prob}")
 
-            if np.random.rand() < base_prob:
+            if not use_early_rejection:
+                u = np.random.rand()
+            if u < base_prob:
                 # succeeds! keep already changed slab
                 # state = state.copy()
                 logger.debug("state changed!")
                 energy = curr_energy
                 accept = True
+
+                if use_screening:
+                    self.screening_energy = screening_energy
+                if use_active_region:
+                    energy = self.check_local_energy_drift(energy)
             else:
                 # failed, keep current state and revert slab back to original
-                self.slab, self.state, _, _, _ = change_site(
-                    self.slab,
-                    self.state,
-                    self.pot,
-                    self.adsorbates,
-                    self.ads_coords,
-                    site1_idx,
-                    start_ads=site2_ads,
-                    end_ads=site1_ads,
-                    **self.kwargs,
-                )
-                self.slab, self.state, _, _, _ = change_site(
-                    self.slab,
-                    self.state,
-                    self.pot,
-                    self.adsorbates,
-                    self.ads_coords,
-                    site2_idx,
-                    start_ads=site1_ads,
-                    end_ads=site2_ads,
-                    **self.kwargs,
-                )
+                self.restore_snapshot(snapshot)
 
                 # state, slab = add_to_slab(slab, state, adsorbate, coords, site1_idx)
                 # state, slab = remove_from_slab(slab, state, site2_idx)
@@ -789,6 +1517,15 @@ class MCMC:
                 energy = prev_energy
                 accept = False
 
+        if accept:
+            # None unless the whole accepted slab was evaluated, e.g. not for local energies
+            self.accept_results()
+            self.discard_proposals()
+        if accept and self.warm_start:
+            self.accept_relaxed_positions()
+        if accept and self.site_sampler is not None:
+            self.site_sampler.update(self.slab, self.state, [site1_idx, site2_idx])
+
         return energy, accept
 
     def change_site(self, prev_energy: float = 0, iter: int = 1, site_idx: int = None):
@@ -811,7 +1548,12 @@ class MCMC:
         accepted or not.
 
         """
-        if not site_idx:
+        end_ads = None
+        if site_idx is None and self.use_batch_proposals():
+            if not self.pending_proposals:
+                self.prefetch_proposals(iter)
+            site_idx, end_ads = self.pending_proposals.pop(0)
+        elif site_idx is None:
             site_idx = get_random_idx(self.connectivity)
         rand_site = self.ads_coords[site_idx]
 
@@ -827,11 +1569,33 @@ class MCMC:
         delta_N = 0
 
         if not prev_energy and not self.testing:
-            results = slab_energy(
-                self.slab, relax=self.relax, folder_name=self.run_folder, **self.kwargs
-            )
+            results = self.compute_energy()
             prev_energy = results[0]
             self.per_atom_energies = results[-1]
+
+        # only evaluate the region around the site
+        use_local_energy = (
+            self.local_energy_radius
+            and not self.testing
+            and not self.kwargs.get("filter_distance", None)
+        )
+        # only relax the atoms around the site
+        use_active_region = (
+            self.active_region_radius
+            and self.relax
+            and not use_local_energy
+            and not self.testing
+            and not self.kwargs.get("filter_distance", None)
+        )
+        if use_local_energy:
+            prev_local_energy = self.compute_local_energy(site_idx)[0]
+        elif use_active_region:
+            # the previous energy is relaxed with the same frozen atoms to be consistent
+            prev_local_energy = self.compute_active_energy([site_idx])[0]
+
+        # record the current slab so that a rejected move can be undone
+        snapshot = self.get_snapshot()
+        self.proposed_results = None
         self.slab, self.state, delta_pot, start_ads, end_ads = change_site(
             self.slab,
             self.state,
@@ -840,61 +1604,98 @@ class MCMC:
             self.ads_coords,
             site_idx,
             start_ads=None,
-            end_ads=None,
+            end_ads=end_ads,
+            slots=self.slots,
+            reference_energies=self.reference_energies,
+            composition=self.composition,
             **self.kwargs,
         )
+        if self.warm_start:
+            self.reset_relaxed_positions([site_idx])
 
         logger.debug("after proposed state is")
         logger.debug(self.state)
 
         if self.kwargs.get("save_cif", False):
-            if not os.path.exists(self.run_folder):
-                os.makedirs(self.run_folder)
-            write(f"{self.run_folder}/proposed_slab_iter_{iter:03}.cif", self.slab)
+            self.save_proposal(iter)
+
+        # first stage of delayed acceptance with the cheap screening energy
+        use_screening = (
+            self.screening
+            and not self.testing
+            and not self.kwargs.get("filter_distance", None)
+        )
+        passed_screening = True
+        if use_screening:
+            passed_screening, screening_energy, screening_diff = self.screen_proposal(
+                delta_pot=delta_pot
+            )
 
         # to test, always accept
         accept = False
         if self.kwargs.get("filter_distance", None):
-            filter_distance = self.kwargs["filter_distance"]
             energy = 0
 
-            if filter_distances(
-                self.slab, ads=self.adsorbates, cutoff_distance=filter_distance
+            if filter_site_distances(
+                self.state,
+                self.site_conflicts,
+                [site_idx],
+                substrate_blocked=self.substrate_blocked,
             ):
                 # succeeds! keep already changed slab
                 logger.debug("state changed with filtering!")
                 accept = True
             else:
                 # failed, keep current state and revert slab back to original
-                self.slab, self.state, _, _, _ = change_site(
-                    self.slab,
-                    self.state,
-                    self.pot,
-                    self.adsorbates,
-                    self.ads_coords,
-                    site_idx,
-                    start_ads=end_ads,
-                    end_ads=start_ads,
-                    **self.kwargs,
-                )
+                self.restore_snapshot(snapshot)
                 logger.debug("state kept the same with filtering")
 
         elif self.testing:
             energy = 0
             accept = True
 
+        elif not passed_screening:
+            # failed, keep current state and revert slab back to original
+            self.restore_snapshot(snapshot)
+            logger.debug("state kept the same with screening")
+            energy = prev_energy
+
         else:
+            # the second stage of delayed acceptance corrects for the screening energy difference,
+            # which already includes the chemical potential change
+            energy_shift = screening_diff if use_screening else delta_pot
+
+            # draw the Metropolis threshold first to stop relaxations that can't be accepted
+            use_early_rejection = (
+                self.kwargs.get("early_rejection", False) and self.relax
+            )
+            energy_kwargs = {}
+            if use_early_rejection:
+                u, energy_kwargs["energy_ceiling"] = self.get_energy_ceiling(
+                    (
+                        prev_local_energy
+                        if use_local_energy or use_active_region
+                        else prev_energy
+                    ),
+                    delta_pot=energy_shift,
+                )
+
             # use relaxation only to get lowest energy
             # but don't update adsorption positions
-            results = slab_energy(
-                self.slab,
-                relax=self.relax,
-                folder_name=self.run_folder,
-                iter=iter,
-                **self.kwargs,
-            )
-            curr_energy = results[0]
-            self.per_atom_energies = results[-1]
+            if use_local_energy:
+                results = self.compute_local_energy(
+                    site_idx, iter=iter, **energy_kwargs
+                )
+                curr_energy = prev_energy + results[0] - prev_local_energy
+            elif use_active_region:
+                results = self.compute_active_energy(
+                    [site_idx], iter=iter, **energy_kwargs
+                )
+                curr_energy = prev_energy + results[0] - prev_local_energy
+            else:
+                results = self.compute_energy(iter=iter, **energy_kwargs)
+                curr_energy = results[0]
+                self.per_atom_energies = results[-1]
 
             logger.debug(f"prev energy is {prev_energy}")
             logger.debug(f"curr energy is {curr_energy}")
@@ -913,34 +1714,39 @@ class MCMC:
             if np.abs(energy_diff) > ENERGY_DIFF_LIMIT or results[2] > MAX_FORCE_LIMIT:
                 base_prob = 0.0
             else:
-                base_prob = np.exp(-(energy_diff - delta_pot) / self.temp)
+                base_prob = np.exp(-(energy_diff - energy_shift) / self.temp)
 
             logger.debug(f"base probability is {base_prob}")
-            if np.random.rand() < base_prob:
+            if not use_early_rejection:
+                u = np.random.rand()
+            if u < base_prob:
                 # succeeds! keep already changed slab
                 # state = state.copy()
                 logger.debug("state changed!")
                 energy = curr_energy
                 accept = True
+
+                if use_screening:
+                    self.screening_energy = screening_energy
+                if use_local_energy or use_active_region:
+                    energy = self.check_local_energy_drift(energy)
             else:
                 # failed, keep current state and revert slab back to original
-                self.slab, self.state, _, _, _ = change_site(
-                    self.slab,
-                    self.state,
-                    self.pot,
-                    self.adsorbates,
-                    self.ads_coords,
-                    site_idx,
-                    start_ads=end_ads,
-                    end_ads=start_ads,
-                    **self.kwargs,
-                )
+                self.restore_snapshot(snapshot)
 
                 logger.debug("state kept the same")
                 energy = prev_energy
                 accept = False
 
             # logger.debug(f"energy after accept/reject {slab_energy(slab, relax=relax, folder_name=folder_name, iter=iter, **kwargs)}")
+        if accept:
+            # None unless the whole accepted slab was evaluated, e.g. not for local energies
+            self.accept_results()
+            self.discard_proposals()
+        if accept and self.warm_start:
+            self.accept_relaxed_positions()
+        if accept and self.site_sampler is not None:
+            self.site_sampler.update(self.slab, self.state, [site_idx])
         return energy, accept
 
     def mcmc_sweep(self, i: int = 0):
@@ -969,43 +1775,88 @@ class MCMC:
                 )
             num_accept += accept
 
-        # end of sweep, append to history
-        if self.relax:
-            history_slab, _ = optimize_slab(
-                self.slab,
-                kim_potential=self.kwargs.get("kim_potential", None),
-                relax_steps=self.kwargs.get("relax_steps", 20),
-                optimizer=self.kwargs.get("optimizer", None),
-                folder_name=self.run_folder,
-            )
-            history_slab.calc = None
-            history_slab = history_slab.copy()
-        # elif type(self.slab) is AtomsBatch:
-        #     history_slab = copy.deepcopy(self.slab)
-        #     history_slab.calc = None
-        else:
-            history_slab = self.slab.copy()
-        # breakpoint()
-        # save space, don't copy neighbor li
-        self.history.append(history_slab)
-        # TODO can save some compute here
+            if self.trajectory_store is not None:
+                self.write_output(
+                    self.trajectory_store.append,
+                    "moves",
+                    iteration=run_idx,
+                    energy=self.curr_energy,
+                    accept=accept,
+                    temp=self.temp,
+                )
+
+        frac_accept = num_accept / self.sweep_size
+        self.frac_accept_hist[i] = frac_accept
 
         final_energy = self.save_structures(i=i, testing=self.testing, **self.kwargs)
+        if self.trajectory_store is not None:
+            # the moves of the sweep are written at once
+            self.write_output(self.trajectory_store.flush)
 
         # append values
         self.energy_hist[i] = final_energy
 
         ads_counts = count_adsorption_sites(self.slab, self.state, self.connectivity)
         for key in set(self.site_types):
-            if ads_counts[key]:
+            if self.compact_history:
+                self.adsorption_count_hist[key][i] = ads_counts[key]
+            elif ads_counts[key]:
                 self.adsorption_count_hist[key].append(ads_counts[key])
             else:
                 self.adsorption_count_hist[key].append(0)
 
-        frac_accept = num_accept / self.sweep_size
-        self.frac_accept_hist[i] = frac_accept
+        # end of sweep, append to history
+        if self.compact_history:
+            relaxed_positions = None
+            if self.last_relaxed_slab is not None:
+                relaxed_positions = self.last_relaxed_slab.get_positions()
+            self.history.append(
+                self.slab,
+                self.state,
+                positions=relaxed_positions,
+                sweep=i + 1,
+                energy=final_energy,
+                frac_accept=frac_accept,
+                temp=self.temp,
+            )
+        else:
+            if self.last_relaxed_slab is not None:
+                # the relaxed slab that the energy of the sweep was calculated for
+                history_slab = self.last_relaxed_slab.copy()
+                history_slab.calc = None
+            elif self.relax:
+                history_slab, _ = optimize_slab(
+                    self.slab,
+                    kim_potential=self.kwargs.get("kim_potential", None),
+                    relax_steps=self.kwargs.get("relax_steps", 20),
+                    optimizer=self.kwargs.get("optimizer", None),
+                    folder_name=self.run_folder,
+                )
+                history_slab.calc = None
+                history_slab = history_slab.copy()
+            # elif type(self.slab) is AtomsBatch:
+            #     history_slab = copy.deepcopy(self.slab)
+            #     history_slab.calc = None
+            else:
+                history_slab = self.slab.copy()
+            if self.fixed_capacity:
+                history_slab = remove_ghost_slots(history_slab)
+            # breakpoint()
+            # save space, don't copy neighbor li
+            self.history.append(history_slab)
+
+        if self.energy_cache is not None:
+            logger.info(f"energy cache: {self.energy_cache}")
+        if self.neighbor_list is not None:
+            logger.debug(
+                f"neighbor list built {self.neighbor_list.num_builds} and patched {self.neighbor_list.num_patches} times so far"
+            )
+        if self.screening:
+            logger.info(
+                f"{self.num_screened_out} proposals rejected by screening so far"
+            )
 
-    def mcmc_run(
+    def prepare_run(
         self,
         peak_scale: float = 1 / 2,
         ramp_up_sweeps: int = 10,
@@ -1017,39 +1868,15 @@ class MCMC:
         slab: ase.atoms.Atoms or catkit.gratoms.Gratoms or AtomsBatch = None,
         state: list or np.ndarray = None,
         num_pristine_atoms: int = 0,
-        perform_annealing=False,
-        anneal_schedule: list = None,
         run_folder: str = None,
-        starting_iteration: list = 0,
         sweep_size: int = 300,
         even_adsorption_sites: bool = False,
+        checkpoint: dict = None,
     ):
-        """This function runs an MC simulation for a given number of sweeps and temperature, and
-        returns the history of the simulation along with summary statistics.
-
-        Parameters
-        ----------
-        num_sweeps : int, optional
-            The number of MCMC sweeps to perform.
-        temp : float, optional
-            The temperature parameter is used in the Metropolis-Hastings algorithm for MC simulations.
-            It controls the probability of accepting a proposed move during the simulation. A higher temperature
-            leads to a higher probability of accepting a move, while a lower temperature leads to a lower probability
-            of accepting a move.
-        pot : float or list, optional
-            The chemical potential used in the simulation. The chemical potential can be a single value for one adsorbate or a list
-            of values for each adsorbate type.
-        alpha : float, optional
-            The alpha parameter is a value between 0 and 1 that determines the annealing rate. A higher
-            alpha results in a slower annealing rate, while a lower alpha results in a faster annealing rate.
-        slab : ase.atoms.Atoms or catkit.gratoms.Gratoms or AtomsBatch, optional
-            The `slab` is the starting surface structure on which the MC simulation is
-            being performed.
-
-        Returns
-        -------
-            a tuple containing `self.history`, `self.energy_hist`, `self.frac_accept_hist`,
-        `self.adsorption_count_hist`, and `self.run_folder`.
+        """This function sets up the run folder, slab, adsorption sites, state and initial energy
+        so that sweeps can be performed with `mcmc_sweep`. The parameters are the same as for
+        `mcmc_run`. If a `checkpoint` is given, the chain continues from it instead of calculating the
+        initial energy and preparing the canonical slab.
 
         """
         if run_folder:
@@ -1079,6 +1906,19 @@ class MCMC:
 
         self.setup_folders()
 
+        if self.kwargs.get("async_output", False):
+            self.close_output()
+            self.writer = AsyncWriter(
+                max_queue_size=self.kwargs.get("output_queue_size", 16)
+            )
+
+        if self.kwargs.get("trajectory_store", False):
+            # a resumed run continues the store of the original run
+            self.trajectory_store = TrajectoryStore(
+                os.path.join(self.run_folder, TRAJECTORY_FILE),
+                mode="w" if checkpoint is None else "a",
+            )
+
         self.prepare_slab()
 
         self.set_adsorbates()
@@ -1087,18 +1927,68 @@ class MCMC:
 
         self.initialize_state()
 
-        self.curr_energy = self.get_initial_energy()
+        if self.fixed_capacity:
+            self.state, self.slab, self.slots = add_ghost_slots(
+                self.slab, self.state, self.ads_coords
+            )
+
+        if self.compact_history:
+            self.history = CompactHistory(
+                self.slab[: self.num_pristine_atoms],
+                self.ads_coords,
+                capacity=self.total_sweeps,
+            )
+            self.adsorption_count_hist = {
+                key: np.zeros(self.total_sweeps, dtype=np.int32)
+                for key in self.site_types
+            }
+
+        if self.kwargs.get("use_site_sampler", False):
+            self.site_sampler = SiteSampler(self.slab, self.state, self.adsorbates)
+
+        if self.local_energy_radius:
+            region_radius = self.local_energy_radius + self.kwargs.get(
+                "local_energy_buffer", 4.0
+            )
+            if region_radius > np.min(self.slab.cell.lengths()[:2]) / 2:
+                logger.warning(
+                    "local energy region is larger than half the cell, local energy differences will be inaccurate"
+                )
+
+        if self.kwargs.get("early_rejection", False) and "LAMMPS" in str(
+            self.kwargs.get("optimizer", "")
+        ):
+            logger.warning("early rejection is not supported with LAMMPS relaxations")
+
+        if self.kwargs.get("offset_data", None):
+            self.reference_energies = load_reference_energies(
+                self.kwargs["offset_data"]
+            )
+            self.composition = self.reference_energies.get_composition(self.slab)
+
+        if self.warm_start:
+            self.slab.new_array("relaxed_positions", self.slab.get_positions())
 
         if self.reference_structure:
             self.reference_structure_embeddings = self.get_structure_embeddings(
                 self.reference_structure
             )
-            relaxed_slab, _ = optimize_slab(
-                self.slab, folder_name=self.run_folder, **self.kwargs
-            )
-            self.curr_similarity = self.get_cosine_similarity(relaxed_slab)
 
-        self.prepare_canonical(even_adsorption_sites=even_adsorption_sites)
+        if checkpoint is not None:
+            self.restore_checkpoint(checkpoint)
+        else:
+            self.curr_energy = self.get_initial_energy()
+
+            if self.screening:
+                self.screening_energy = self.compute_screening_energy()
+
+            if self.reference_structure:
+                relaxed_slab, _ = optimize_slab(
+                    self.slab, folder_name=self.run_folder, **self.kwargs
+                )
+                self.curr_similarity = self.get_cosine_similarity(relaxed_slab)
+
+            self.prepare_canonical(even_adsorption_sites=even_adsorption_sites)
 
         # sweep over # sites
         # self.sweep_size = len(self.ads_coords)
@@ -1107,6 +1997,272 @@ class MCMC:
         logger.info(
             f"running for {self.sweep_size} iterations per run over a total of {self.total_sweeps} runs"
         )
+
+    def get_snapshot(self):
+        """This function records the current slab, state and composition, so that a rejected move can be
+        undone with `restore_snapshot`."""
+        snapshot = get_slab_snapshot(self.slab, self.state)
+        if self.composition is not None:
+            snapshot["composition"] = self.composition.copy()
+        return snapshot
+
+    def restore_snapshot(self, snapshot: dict):
+        """This function restores the slab, state and composition recorded with `get_snapshot`."""
+        self.state, self.slab = restore_slab_snapshot(self.slab, snapshot)
+        if "composition" in snapshot:
+            self.composition = snapshot["composition"]
+
+    def write_output(self, func, *args, **kwargs):
+        """This function runs an output task, e.g. a file write or a plot, in the background writer if
+        `async_output` is set, or right away otherwise. The arguments must not be changed afterwards."""
+        write_output(self.writer, func, *args, **kwargs)
+
+    def close_output(self):
+        """This function finishes the pending output tasks and closes the background writer, the
+        trajectory store and the persistent LAMMPS sessions."""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.trajectory_store is not None:
+            self.trajectory_store.close()
+        if self.kwargs.get("persistent_lammps", False):
+            close_lammps_sessions()
+
+    def get_saved_slab(self):
+        """This function returns the current slab for saving, without the empty slots of a fixed capacity slab."""
+        if self.fixed_capacity:
+            return remove_ghost_slots(self.slab)
+        return self.slab
+
+    def get_pot_energy(self, pot: float or list = None):
+        """This function returns the chemical potential contribution, sum_i pot_i * N_i, of the adsorbates
+        currently on the slab. With `offset_data`, N_i is the excess of each element relative to the
+        reference element, as in the acceptance criterion of the moves.
+
+        Parameters
+        ----------
+        pot : float or list, optional
+            Chemical potential(s) of the adsorbates, by default the ones of the current run.
+
+        Returns
+        -------
+            the chemical potential energy of the current configuration.
+
+        """
+        if pot is None:
+            pot = self.pot
+        if not isinstance(pot, (list, np.ndarray)):
+            pot = [pot]
+        ads_pot_dict = dict(zip(self.adsorbates, pot))
+        if self.reference_energies is not None:
+            return self.reference_energies.get_pot_energy(
+                self.composition, ads_pot_dict
+            )
+
+        ads_count = Counter(
+            self.slab[int(idx)].symbol for idx in self.state[self.state > 0]
+        )
+        return sum(ads_pot_dict[ele] * num for ele, num in ads_count.items())
+
+    def get_configuration(self):
+        """This function returns a copy of the current configuration that can be sent to another chain.
+
+        Returns
+        -------
+            a dict with the slab (without calculator), state and current energy.
+
+        """
+        # don't copy the calculator along with the slab
+        calc = self.slab.calc
+        self.slab.calc = None
+        slab = copy.deepcopy(self.slab)
+        self.slab.calc = calc
+        return {
+            "slab": slab,
+            "state": np.array(self.state).copy(),
+            "curr_energy": self.curr_energy,
+            "per_atom_energies": self.per_atom_energies,
+        }
+
+    def set_configuration(self, configuration: dict):
+        """This function replaces the current configuration, e.g. after a replica exchange.
+
+        Parameters
+        ----------
+        configuration : dict
+            Configuration as returned by `get_configuration`.
+
+        """
+        self.slab = configuration["slab"]
+        self.slab.calc = self.calc
+        self.state = configuration["state"]
+        self.curr_energy = configuration["curr_energy"]
+        self.per_atom_energies = configuration["per_atom_energies"]
+        self.accepted_results = None
+        self.discard_proposals()
+        if self.site_sampler is not None:
+            self.site_sampler = SiteSampler(self.slab, self.state, self.adsorbates)
+        if self.reference_energies is not None:
+            self.composition = self.reference_energies.get_composition(self.slab)
+        if self.screening:
+            self.screening_energy = self.compute_screening_energy()
+
+    def save_checkpoint(self, sweep: int, temp_list: list):
+        """This function saves everything needed to continue the chain exactly to the checkpoint file of
+        the run folder. The file is replaced atomically, so a run that is killed while saving keeps the
+        previous checkpoint.
+
+        Parameters
+        ----------
+        sweep : int
+            The index of the next sweep to perform.
+        temp_list : list
+            The temperature of every sweep.
+
+        """
+        if self.writer is not None:
+            # the checkpoint must not be ahead of the output, e.g. the trajectory store
+            self.writer.flush()
+        checkpoint = self.get_configuration()
+        checkpoint.update(
+            {
+                "sweep": sweep,
+                "temp_list": np.array(temp_list),
+                "run_folder": self.run_folder,
+                "history": self.history,
+                "energy_hist": self.energy_hist,
+                "frac_accept_hist": self.frac_accept_hist,
+                "adsorption_count_hist": dict(self.adsorption_count_hist),
+                "curr_similarity": getattr(self, "curr_similarity", None),
+                "num_local_accepts": self.num_local_accepts,
+                "num_screened_out": self.num_screened_out,
+                "energy_cache": self.energy_cache,
+                "store_lengths": (
+                    self.trajectory_store.get_lengths()
+                    if self.trajectory_store is not None
+                    else None
+                ),
+                "random_state": random.getstate(),
+                "np_random_state": np.random.get_state(),
+            }
+        )
+
+        path = os.path.join(self.run_folder, CHECKPOINT_FILE)
+        with open(f"{path}.tmp", "wb") as f:
+            pkl.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
+        logger.debug(f"saved checkpoint before sweep {sweep + 1}")
+
+    def restore_checkpoint(self, checkpoint: dict):
+        """This function continues the chain from a checkpoint written by `save_checkpoint`.
+
+        Parameters
+        ----------
+        checkpoint : dict
+            The checkpoint, e.g. from `load_checkpoint`.
+
+        """
+        self.set_configuration(checkpoint)
+        self.history = checkpoint["history"]
+        self.energy_hist = checkpoint["energy_hist"]
+        self.frac_accept_hist = checkpoint["frac_accept_hist"]
+        self.adsorption_count_hist = defaultdict(
+            list, checkpoint["adsorption_count_hist"]
+        )
+        self.curr_similarity = checkpoint["curr_similarity"]
+        self.num_local_accepts = checkpoint["num_local_accepts"]
+        self.num_screened_out = checkpoint["num_screened_out"]
+        self.energy_cache = checkpoint["energy_cache"]
+        if self.trajectory_store is not None:
+            # drop what was stored after the checkpoint
+            self.trajectory_store.truncate(checkpoint["store_lengths"] or {})
+        random.setstate(checkpoint["random_state"])
+        np.random.set_state(checkpoint["np_random_state"])
+        logger.info(f"resuming from checkpoint before sweep {checkpoint['sweep'] + 1}")
+
+    def mcmc_run(
+        self,
+        peak_scale: float = 1 / 2,
+        ramp_up_sweeps: int = 10,
+        ramp_down_sweeps: int = 200,
+        total_sweeps: int = 800,
+        start_temp: float = 1.0,
+        pot: float or list = 1.0,
+        alpha: float = 0.9,
+        slab: ase.atoms.Atoms or catkit.gratoms.Gratoms or AtomsBatch = None,
+        state: list or np.ndarray = None,
+        num_pristine_atoms: int = 0,
+        perform_annealing=False,
+        anneal_schedule: list = None,
+        run_folder: str = None,
+        starting_iteration: list = 0,
+        sweep_size: int = 300,
+        even_adsorption_sites: bool = False,
+        resume_from: str = None,
+        wall_time: float = None,
+    ):
+        """This function runs an MC simulation for a given number of sweeps and temperature, and
+        returns the history of the simulation along with summary statistics.
+
+        Parameters
+        ----------
+        num_sweeps : int, optional
+            The number of MCMC sweeps to perform.
+        temp : float, optional
+            The temperature parameter is used in the Metropolis-Hastings algorithm for MC simulations.
+            It controls the probability of accepting a proposed move during the simulation. A higher temperature
+            leads to a higher probability of accepting a move, while a lower temperature leads to a lower probability
+            of accepting a move.
+        pot : float or list, optional
+            The chemical potential used in the simulation. The chemical potential can be a single value for one adsorbate or a list
+            of values for each adsorbate type.
+        alpha : float, optional
+            The alpha parameter is a value between 0 and 1 that determines the annealing rate. A higher
+            alpha results in a slower annealing rate, while a lower alpha results in a faster annealing rate.
+        slab : ase.atoms.Atoms or catkit.gratoms.Gratoms or AtomsBatch, optional
+            The `slab` is the starting surface structure on which the MC simulation is
+            being performed.
+        resume_from : str, optional
+            Checkpoint file, or run folder with a checkpoint, to continue the chain from. The other
+            parameters should be the same as for the original run. Checkpoints are saved every
+            `checkpoint_every` sweeps if that keyword is given to `MCMC`.
+        wall_time : float, optional
+            Time budget (s) of the run. The run saves a checkpoint and stops before a sweep that
+            might not finish within the budget, judged by the longest sweep so far.
+
+        Returns
+        -------
+            a tuple containing `self.history`, `self.energy_hist`, `self.frac_accept_hist`,
+        `self.adsorption_count_hist`, and `self.run_folder`.
+
+        """
+        start_time = time.perf_counter()
+
+        checkpoint = None
+        if resume_from:
+            checkpoint = load_checkpoint(resume_from)
+            if not run_folder:
+                run_folder = checkpoint["run_folder"]
+
+        self.prepare_run(
+            peak_scale=peak_scale,
+            ramp_up_sweeps=ramp_up_sweeps,
+            ramp_down_sweeps=ramp_down_sweeps,
+            total_sweeps=total_sweeps,
+            start_temp=start_temp,
+            pot=pot,
+            alpha=alpha,
+            slab=slab,
+            state=state,
+            num_pristine_atoms=num_pristine_atoms,
+            run_folder=run_folder,
+            sweep_size=sweep_size,
+            even_adsorption_sites=even_adsorption_sites,
+            checkpoint=checkpoint,
+        )
+
         # new parameters
         # self.start_temp
         # self.peak_scale
@@ -1121,21 +2277,52 @@ class MCMC:
             temp_list = np.repeat(
                 self.start_temp, self.total_sweeps
             )  # constant temperature
+        if checkpoint is not None:
+            temp_list = checkpoint["temp_list"]
+            starting_iteration = checkpoint["sweep"]
         logger.info(f"starting with iteration {starting_iteration}")
         print(f"temp list is:")
         print(temp_list)
-        for i in range(starting_iteration, self.total_sweeps):
-            self.temp = temp_list[i]
-            self.mcmc_sweep(i=i)
 
-        # plot and save the results
-        plot_summary_stats(
-            self.energy_hist,
-            self.frac_accept_hist,
-            self.adsorption_count_hist,
-            self.total_sweeps,
-            self.run_folder,
-        )
+        checkpoint_every = self.kwargs.get("checkpoint_every", 0)
+        max_sweep_time = 0.0
+        finished = True
+        try:
+            for i in range(starting_iteration, self.total_sweeps):
+                if (
+                    wall_time is not None
+                    and time.perf_counter() - start_time + max_sweep_time > wall_time
+                ):
+                    self.save_checkpoint(i, temp_list)
+                    logger.info(
+                        f"stopping before sweep {i + 1} to stay within the wall time, resume from {self.run_folder}"
+                    )
+                    finished = False
+                    break
+
+                sweep_start_time = time.perf_counter()
+                self.temp = temp_list[i]
+                self.mcmc_sweep(i=i)
+                max_sweep_time = max(
+                    max_sweep_time, time.perf_counter() - sweep_start_time
+                )
+
+                if checkpoint_every and (i + 1) % checkpoint_every == 0:
+                    self.save_checkpoint(i + 1, temp_list)
+
+            if finished:
+                # plot and save the results
+                self.write_output(
+                    plot_summary_stats,
+                    self.energy_hist,
+                    self.frac_accept_hist,
+                    self.adsorption_count_hist,
+                    self.total_sweeps,
+                    self.run_folder,
+                )
+        finally:
+            # also write the pending output of an interrupted run
+            self.close_output()
 
         return (
             self.history,
@@ -0,0 +1,328 @@
+"""Replica-exchange (parallel tempering) sampling with one MCMC chain per worker process"""
+
+import logging
+import multiprocessing as mp
+import os
+import random
+import traceback
+from datetime import datetime
+
+import numpy as np
+import torch
+
+from .plot import plot_summary_stats
+
+logger = logging.getLogger(__name__)
+
+
+def get_temperature_ladder(min_temp: float, max_temp: float, num_replicas: int):
+    """Get a geometric ladder of temperatures.
+
+    Parameters
+    ----------
+    min_temp : float
+        Lowest temperature in terms of kbT (eV)
+    max_temp : float
+        Highest temperature in terms of kbT (eV)
+    num_replicas : int
+        Number of replicas
+
+    Returns
+    -------
+    np.ndarray
+        Temperatures from lowest to highest
+    """
+    return np.geomspace(min_temp, max_temp, num_replicas)
+
+
+def get_swap_log_prob(energies, temps, pot_energies, i, j):
+    """Log-probability for exchanging the configurations of replicas i and j.
+
+    The configuration x_k of replica k is distributed as exp(-(E(x_k) - P_k(x_k)) / T_k),
+    where P_k is the chemical potential energy with the chemical potentials of replica k.
+
+    Parameters
+    ----------
+    energies : list
+        Energy of the configuration of each replica
+    temps : list
+        Temperature of each replica
+    pot_energies : np.ndarray
+        pot_energies[k, m] is the chemical potential energy of the configuration of replica k
+        with the chemical potentials of replica m
+    i, j : int
+        Replicas to exchange
+
+    Returns
+    -------
+    float
+        Log of the acceptance probability (before taking the minimum with 0)
+    """
+    curr = (energies[i] - pot_energies[i, i]) / temps[i] + (
+        energies[j] - pot_energies[j, j]
+    ) / temps[j]
+    swapped = (energies[j] - pot_energies[j, i]) / temps[i] + (
+        energies[i] - pot_energies[i, j]
+    ) / temps[j]
+    return curr - swapped
+
+
+def run_replica(conn, mcmc, seed, pots, run_kwargs):
+    """Worker loop that owns one MCMC chain and answers commands from the driver."""
+    # forked workers inherit the same random state, so reseed them
+    random.seed(seed)
+    np.random.seed(seed)
+    try:
+        mcmc.prepare_run(**run_kwargs)
+        conn.send(("ready", (mcmc.curr_energy, [mcmc.get_pot_energy(p) for p in pots])))
+
+        while True:
+            command, args = conn.recv()
+            if command == "sweep":
+                i, temp = args
+                mcmc.temp = temp
+                mcmc.mcmc_sweep(i=i)
+                conn.send(
+                    (
+                        "done",
+                        (mcmc.curr_energy, [mcmc.get_pot_energy(p) for p in pots]),
+                    )
+                )
+            elif command == "get_configuration":
+                conn.send(("configuration", mcmc.get_configuration()))
+            elif command == "set_configuration":
+                mcmc.set_configuration(args)
+                conn.send(("done", None))
+            elif command == "finish":
+                mcmc.write_output(
+                    plot_summary_stats,
+                    mcmc.energy_hist,
+                    mcmc.frac_accept_hist,
+                    mcmc.adsorption_count_hist,
+                    mcmc.total_sweeps,
+                    mcmc.run_folder,
+                )
+                mcmc.close_output()
+                conn.send(
+                    (
+                        "results",
+                        {
+                            "energy_hist": mcmc.energy_hist,
+                            "frac_accept_hist": mcmc.frac_accept_hist,
+                            "adsorption_count_hist": dict(mcmc.adsorption_count_hist),
+                            "run_folder": mcmc.run_folder,
+                        },
+                    )
+                )
+                break
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+class ReplicaExchange:
+    """Replica-exchange driver that runs one MCMC chain per temperature (and optionally chemical
+    potential) in its own worker process and exchanges configurations at sweep boundaries.
+
+    The workers are forked from the driver process with a copy of the MCMC object. CUDA can't be used
+    in forked processes, so NFF calculators have to be on the CPU and CUDA must not be initialized
+    in the driver before `run`.
+    """
+
+    def __init__(
+        self,
+        mcmc,
+        temps: list,
+        pots: list = None,
+        exchange_every: int = 1,
+        seed: int = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        mcmc : MCMC
+            Configured MCMC object that is copied into every worker process.
+        temps : list
+            Temperature (kbT in eV) of each replica.
+        pots : list, optional
+            Chemical potential(s) of each replica. If not given, all replicas use the `pot` passed to `run`.
+        exchange_every : int, optional
+            Attempt exchanges after every `exchange_every` sweeps, by default 1.
+        seed : int, optional
+            Seed for the exchange and worker random number generators.
+        """
+        self.mcmc = mcmc
+        self.temps = list(temps)
+        self.num_replicas = len(self.temps)
+        self.pots = pots
+        self.exchange_every = exchange_every
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.rng = np.random.default_rng(self.seed_sequence)
+
+        self.num_swap_attempts = np.zeros(self.num_replicas - 1, dtype=int)
+        self.num_swap_accepts = np.zeros(self.num_replicas - 1, dtype=int)
+        self.run_folder = ""
+        self.conns = []
+        self.processes = []
+
+    def send(self, k: int, command: str, args=None):
+        self.conns[k].send((command, args))
+
+    def recv(self, k: int):
+        status, result = self.conns[k].recv()
+        if status == "error":
+            self.terminate()
+            raise RuntimeError(f"replica {k} failed:\n{result}")
+        return result
+
+    def start(self, **run_kwargs):
+        """Start one worker process per replica and prepare its chain."""
+        # fork so that calculators don't have to be pickled
+        if torch.cuda.is_initialized():
+            raise RuntimeError(
+                "CUDA is initialized in this process and can't be used in the forked replicas, "
+                "run replica exchange with the calculators on the CPU"
+            )
+        ctx = mp.get_context("fork")
+        seeds = self.seed_sequence.spawn(self.num_replicas)
+
+        for k in range(self.num_replicas):
+            replica_kwargs = dict(run_kwargs)
+            replica_kwargs["start_temp"] = self.temps[k]
+            replica_kwargs["pot"] = self.pots[k]
+            replica_kwargs["run_folder"] = os.path.join(
+                self.run_folder, f"replica_{k:02}_temp{self.temps[k]:.4f}"
+            )
+
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(
+                target=run_replica,
+                args=(
+                    child_conn,
+                    self.mcmc,
+                    int(seeds[k].generate_state(1)[0]),
+                    self.pots,
+                    replica_kwargs,
+                ),
+                daemon=True,
+            )
+            process.start()
+            self.conns.append(parent_conn)
+            self.processes.append(process)
+
+        energies = np.zeros(self.num_replicas)
+        pot_energies = np.zeros((self.num_replicas, self.num_replicas))
+        for k in range(self.num_replicas):
+            energies[k], pot_energies[k] = self.recv(k)
+        return energies, pot_energies
+
+    def exchange(self, energies, pot_energies, offset: int = 0):
+        """Attempt exchanges between neighboring replicas (k, k + 1) for k = offset, offset + 2, ...
+
+        Returns
+        -------
+            the energies and chemical potential energies after the exchanges.
+        """
+        for k in range(offset, self.num_replicas - 1, 2):
+            log_prob = get_swap_log_prob(energies, self.temps, pot_energies, k, k + 1)
+            self.num_swap_attempts[k] += 1
+            if np.log(self.rng.random()) < log_prob:
+                self.num_swap_accepts[k] += 1
+                self.send(k, "get_configuration")
+                self.send(k + 1, "get_configuration")
+                config_k = self.recv(k)
+                config_k1 = self.recv(k + 1)
+                self.send(k, "set_configuration", config_k1)
+                self.send(k + 1, "set_configuration", config_k)
+                self.recv(k)
+                self.recv(k + 1)
+
+                energies[[k, k + 1]] = energies[[k + 1, k]]
+                pot_energies[[k, k + 1]] = pot_energies[[k + 1, k]]
+                logger.debug(f"exchanged replicas {k} and {k + 1}")
+        return energies, pot_energies
+
+    def run(
+        self,
+        total_sweeps: int = 800,
+        sweep_size: int = 300,
+        pot: float or list = 1.0,
+        slab=None,
+        run_folder: str = None,
+        **run_kwargs,
+    ):
+        """This function runs replica-exchange MC for a given number of sweeps.
+
+        Parameters
+        ----------
+        total_sweeps : int, optional
+            The number of MCMC sweeps to perform per replica.
+        sweep_size : int, optional
+            The number of MC steps per sweep.
+        pot : float or list, optional
+            The chemical potential(s) of all replicas if `pots` was not given.
+        slab : ase.atoms.Atoms or catkit.gratoms.Gratoms or AtomsBatch, optional
+            The starting surface structure of every replica.
+        run_folder : str, optional
+            Folder for the replica subfolders.
+        run_kwargs
+            Other parameters passed to `MCMC.prepare_run`.
+
+        Returns
+        -------
+            a list with the `energy_hist`, `frac_accept_hist`, `adsorption_count_hist` and `run_folder`
+        of every replica, from lowest to highest temperature.
+
+        """
+        if self.pots is None:
+            self.pots = [pot] * self.num_replicas
+
+        if run_folder:
+            self.run_folder = run_folder
+        else:
+            start_timestamp = datetime.now().strftime("%Y%m%d-%H%M%S.%f")
+            self.run_folder = os.path.join(
+                os.getcwd(),
+                f"replica_exchange_{self.num_replicas}replicas_runs{total_sweeps}_{start_timestamp}",
+            )
+        os.makedirs(self.run_folder, exist_ok=True)
+
+        energies, pot_energies = self.start(
+            total_sweeps=total_sweeps, sweep_size=sweep_size, slab=slab, **run_kwargs
+        )
+        logger.info(
+            f"running {self.num_replicas} replicas at temperatures {self.temps}"
+        )
+
+        for i in range(total_sweeps):
+            for k in range(self.num_replicas):
+                self.send(k, "sweep", (i, self.temps[k]))
+            for k in range(self.num_replicas):
+                energies[k], pot_energies[k] = self.recv(k)
+
+            if (i + 1) % self.exchange_every == 0:
+                # alternate between even and odd pairs
+                offset = ((i + 1) // self.exchange_every) % 2
+                energies, pot_energies = self.exchange(
+                    energies, pot_energies, offset=offset
+                )
+
+        swap_rates = self.num_swap_accepts / np.maximum(self.num_swap_attempts, 1)
+        logger.info(f"exchange acceptance rates between neighbors are {swap_rates}")
+
+        results = []
+        for k in range(self.num_replicas):
+            self.send(k, "finish")
+        for k in range(self.num_replicas):
+            results.append(self.recv(k))
+        for process in self.processes:
+            process.join()
+
+        return results
+
+    def terminate(self):
+        """Stop all worker processes."""
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
@@ -1,17 +1,26 @@
+import hashlib
 import itertools
 import json
 import logging
+import os
 import random
 from collections import Counter
 
 import catkit
+import networkx as nx
 import numpy as np
+import spglib
+from ase import Atoms
 from ase.build import bulk
+from ase.data import atomic_numbers
+from ase.geometry import wrap_positions
 from ase.io import write
+from scipy.sparse import csr_matrix, issparse
+from scipy.spatial import cKDTree
 from scipy.special import softmax
 
-from mcmc.energy import run_lammps_energy
-from mcmc.utils import plot_specific_weights
+from mcmc.energy import load_reference_energies, run_lammps_energy
+from mcmc.utils import SumTree, plot_specific_weights, write_output
 
 logger = logging.getLogger(__name__)
 
@@ -53,12 +62,15 @@ def initialize_slab(
     return catkit_slab
 
 
-def get_random_idx(connectivity, type=None):
-    """Get random site index"""
+def get_random_idx(connectivity, type=None, sites_by_type=None):
+    """Get random site index. The sites of each connectivity can be precomputed with
+    `get_sites_by_type`."""
     connectivities = {"top": 1, "bridge": 2, "hollow": 4}  # defaults to hollow
 
     # top should have connectivity 1, bridge should be 2 and hollow more like 4
-    if type:
+    if type and sites_by_type is not None:
+        site_idx = random.choice(sites_by_type[connectivities[type]])
+    elif type:
         site_idx = random.choice(
             np.argwhere(connectivity == connectivities[type]).flatten()
         )
@@ -69,10 +81,138 @@ def get_random_idx(connectivity, type=None):
     return site_idx
 
 
+def get_sites_by_type(connectivity):
+    """Get the site indices of each connectivity, e.g. for `get_random_idx`."""
+    connectivity = np.asarray(connectivity)
+    return {
+        site_type: np.flatnonzero(connectivity == site_type)
+        for site_type in np.unique(connectivity)
+    }
+
+
+class SiteSampler:
+    """Samplers of the sites holding each adsorbate (and "None" for empty sites), which are updated
+    only for the sites changed by accepted moves instead of regrouping all sites on every step."""
+
+    def __init__(self, slab, state, adsorbates):
+        """
+        Parameters
+        ----------
+        slab : ase.Atoms
+            the slab
+        state : list
+            a list of integers, where each integer represents the slab index of the adsorbate on that site. If the
+        site is empty, the integer is 0.
+        adsorbates : list
+            the adsorbate species
+        """
+        self.num_sites = len(state)
+        self.site_species = np.array(
+            [slab[int(idx)].symbol if idx > 0 else "None" for idx in state],
+            dtype=object,
+        )
+        self.trees = {}
+        for species in ["None"] + list(adsorbates):
+            self.trees[species] = SumTree(self.site_species == species)
+        for species in set(self.site_species) - set(self.trees):
+            self.trees[species] = SumTree(self.site_species == species)
+
+    def update(self, slab, state, sites):
+        """Update the samplers for the sites changed by an accepted move."""
+        for site in sites:
+            species = slab[int(state[site])].symbol if state[site] > 0 else "None"
+            if species == self.site_species[site]:
+                continue
+            if species not in self.trees:
+                self.trees[species] = SumTree(np.zeros(self.num_sites))
+            self.trees[self.site_species[site]].update(site, 0.0)
+            self.trees[species].update(site, 1.0)
+            self.site_species[site] = species
+
+    def sample(self, species):
+        """Get a random site holding the species."""
+        return self.trees[species].sample(random.random())
+
+    def get_complementary_idx(self, distance_weight_matrix=None):
+        """Get two sites of different species like `get_complementary_idx` with uniform weights.
+
+        Parameters
+        ----------
+        distance_weight_matrix : np.ndarray or scipy.sparse.csr_matrix, optional
+            If given, the second site is weighted by its distance decay weight from the first site.
+
+        Returns
+        -------
+            the two site indices and their species.
+        """
+        # empty sites are always a choice, like in `get_complementary_idx`
+        present = [
+            species
+            for species, tree in self.trees.items()
+            if species == "None" or tree.total > 0
+        ]
+        type1, type2 = random.sample(present, 2)
+        site1_idx = self.sample(type1)
+
+        if distance_weight_matrix is None:
+            site2_idx = self.sample(type2)
+            return site1_idx, site2_idx, type1, type2
+
+        if issparse(distance_weight_matrix):
+            row = slice(
+                distance_weight_matrix.indptr[site1_idx],
+                distance_weight_matrix.indptr[site1_idx + 1],
+            )
+            sites = distance_weight_matrix.indices[row]
+            weights = (
+                distance_weight_matrix.data[row] * self.trees[type2].weights[sites]
+            )
+        else:
+            sites = np.arange(self.num_sites)
+            weights = distance_weight_matrix[site1_idx] * self.trees[type2].weights
+
+        if np.any(weights > 0):
+            cum_weights = np.cumsum(weights)
+            pos = np.searchsorted(
+                cum_weights, random.random() * cum_weights[-1], "right"
+            )
+            site2_idx = int(sites[min(pos, len(sites) - 1)])
+        else:
+            # no sites of type 2 within the cutoff
+            site2_idx = self.sample(type2)
+        return site1_idx, site2_idx, type1, type2
+
+
 def get_complementary_idx(
     state, slab, require_per_atom_energies=False, require_distance_decay=False, **kwargs
 ):
-    """Get two indices, site1 and site2 of different elemental identities."""
+    """Get two indices, site1 and site2 of different elemental identities. If a `SiteSampler` is passed
+    as `site_sampler`, the sites are sampled from it unless per atom energies are required. Weight
+    plots are made by the `AsyncWriter` passed as `writer`, if any."""
+    site_sampler = kwargs.get("site_sampler", None)
+    if site_sampler is not None and not require_per_atom_energies:
+        distance_weight_matrix = (
+            kwargs.get("distance_weight_matrix", None)
+            if require_distance_decay
+            else None
+        )
+        sites = site_sampler.get_complementary_idx(distance_weight_matrix)
+        if distance_weight_matrix is not None and kwargs.get("plot_weights", False):
+            logger.debug(f"plotting weights")
+            specific_distance_weights = distance_weight_matrix[sites[0]]
+            if issparse(specific_distance_weights):
+                specific_distance_weights = specific_distance_weights.toarray().ravel()
+            write_output(
+                kwargs.get("writer", None),
+                plot_specific_weights,
+                kwargs.get("ads_coords", None),
+                specific_distance_weights,
+                sites[0],
+                save_folder=kwargs.get("run_folder", "."),
+                run_iter=kwargs.get("run_iter", 0),
+            )
+        return sites
+
     adsorbed_idx = np.argwhere(state != 0).flatten()
 
     # TODO use per_site energies
@@ -145,27 +285,67 @@ def get_complementary_idx(
         ]  # even weights
 
         ads_coords = kwargs.get("ads_coords", None)
-        specific_distance_weights = distance_weight_matrix[
-            site1_idx
-        ]  # get the weights for the second type
-        logger.debug(f"specific weights shape is {specific_distance_weights.shape}")
-        if kwargs.get("plot_weights", False):
-            logger.debug(f"plotting weights")
-            plot_specific_weights(
-                ads_coords,
-                specific_distance_weights,
-                site1_idx,
-                save_folder=kwargs.get("run_folder", "."),
-                run_iter=kwargs.get("run_iter", 0),
+        if issparse(distance_weight_matrix):
+            # sample from the neighbors of site 1 only
+            row = slice(
+                distance_weight_matrix.indptr[site1_idx],
+                distance_weight_matrix.indptr[site1_idx + 1],
             )
-        combined_type2_weights = (
-            weights2 * specific_distance_weights[curr_ads[type2]]
-        )  # energy based weights * distance decay weights
-        site2_idx = random.choices(
-            curr_ads[type2], weights=combined_type2_weights, k=1
-        )[
-            0
-        ]  # weighted by distance decay
+            neighbors = distance_weight_matrix.indices[row]
+            neighbor_weights = distance_weight_matrix.data[row]
+
+            # the sites of each type are sorted
+            type2_sites = np.asarray(curr_ads[type2])
+            pos = np.searchsorted(type2_sites, neighbors).clip(max=len(type2_sites) - 1)
+            is_type2 = type2_sites[pos] == neighbors
+            type2_neighbors = neighbors[is_type2]
+            combined_type2_weights = (
+                weights2[pos[is_type2]] * neighbor_weights[is_type2]
+            )  # energy based weights * distance decay weights
+
+            if kwargs.get("plot_weights", False):
+                logger.debug(f"plotting weights")
+                write_output(
+                    kwargs.get("writer", None),
+                    plot_specific_weights,
+                    ads_coords,
+                    distance_weight_matrix[site1_idx].toarray().ravel(),
+                    site1_idx,
+                    save_folder=kwargs.get("run_folder", "."),
+                    run_iter=kwargs.get("run_iter", 0),
+                )
+            if not np.any(combined_type2_weights > 0):
+                # no sites of type 2 within the cutoff
+                type2_neighbors, combined_type2_weights = type2_sites, weights2
+            site2_idx = random.choices(
+                type2_neighbors, weights=combined_type2_weights, k=1
+            )[
+                0
+            ]  # weighted by distance decay
+        else:
+            specific_distance_weights = distance_weight_matrix[
+                site1_idx
+            ]  # get the weights for the second type
+            logger.debug(f"specific weights shape is {specific_distance_weights.shape}")
+            if kwargs.get("plot_weights", False):
+                logger.debug(f"plotting weights")
+                write_output(
+                    kwargs.get("writer", None),
+                    plot_specific_weights,
+                    ads_coords,
+                    specific_distance_weights,
+                    site1_idx,
+                    save_folder=kwargs.get("run_folder", "."),
+                    run_iter=kwargs.get("run_iter", 0),
+                )
+            combined_type2_weights = (
+                weights2 * specific_distance_weights[curr_ads[type2]]
+            )  # energy based weights * distance decay weights
+            site2_idx = random.choices(
+                curr_ads[type2], weights=combined_type2_weights, k=1
+            )[
+                0
+            ]  # weighted by distance decay
     else:
         # get random idx belonging to those types
         site1_idx, site2_idx = [
@@ -191,6 +371,9 @@ def change_site(
     site_idx,
     start_ads=None,
     end_ads=None,
+    slots=None,
+    reference_energies=None,
+    composition=None,
     **kwargs,
 ):
     """The `change_site` function takes in various parameters related to a surface slab and adsorbates, and
@@ -223,6 +406,15 @@ def change_site(
     end_ads
         The `end_ads` parameter is used to specify the adsorbate that will be adsorbed on the chosen site.
     If `end_ads` is not provided, a random adsorbate will be chosen from the available options.
+    slots
+        The `slots` parameter holds the slab indices of the ghost slots of a fixed capacity slab, see
+    `add_ghost_slots`. If given, the number of atoms in the slab does not change.
+    reference_energies
+        The `reference_energies` parameter is a `ReferenceEnergies` object used to compute `delta_pot`
+    relative to the reference element. It is loaded from `offset_data` in the kwargs if not given.
+    composition
+        The `composition` parameter is the composition vector of the slab for `reference_energies`. It is
+    updated in place, and computed from the slab if not given.
 
     Returns
     -------
@@ -233,7 +425,16 @@ def change_site(
     ads_pot_dict = dict(zip(adsorbates, pots))
     chosen_ads = None
 
-    old_ads_count = Counter(slab.get_chemical_symbols())
+    if reference_energies is None and kwargs.get("offset_data", None):
+        reference_energies = load_reference_energies(kwargs["offset_data"])
+    if reference_energies is not None:
+        if composition is None:
+            composition = reference_energies.get_composition(slab)
+        # only elements in the current slab are counted
+        present = composition > 0
+        old_pot = reference_energies.get_pot_energy(
+            composition, ads_pot_dict, present=present
+        )
 
     if state[site_idx] == 0:  # empty list, no ads
         logger.debug(f"chosen site is empty")
@@ -254,7 +455,9 @@ def change_site(
         # modularize
         logger.debug(f"current slab has {len(slab)} atoms")
 
-        state, slab = add_to_slab(slab, state, chosen_ads, coords, site_idx)
+        state, slab = add_to_slab(
+            slab, state, chosen_ads, coords, site_idx, slots=slots
+        )
 
         logger.debug(f"proposed slab has {len(slab)} atoms")
 
@@ -280,7 +483,7 @@ def change_site(
         logger.debug(f"current slab has {len(slab)} atoms")
 
         # desorb first, regardless of next chosen state
-        state, slab = remove_from_slab(slab, state, site_idx)
+        state, slab = remove_from_slab(slab, state, site_idx, slots=slots)
 
         # adsorb
         if "None" not in chosen_ads:
@@ -288,7 +491,9 @@ def change_site(
 
             logger.debug(f"replacing {start_ads} with {chosen_ads}")
 
-            state, slab = add_to_slab(slab, state, chosen_ads, coords, site_idx)
+            state, slab = add_to_slab(
+                slab, state, chosen_ads, coords, site_idx, slots=slots
+            )
 
             delta_pot = chosen_pot - prev_pot
         else:
@@ -299,33 +504,17 @@ def change_site(
 
     end_ads = chosen_ads
 
-    new_ads_count = Counter(slab.get_chemical_symbols())
-
-    if kwargs.get("offset_data", None):
-        with open(kwargs["offset_data"]) as f:
-            offset_data = json.load(f)
-        stoics = offset_data["stoics"]
-        ref_element = offset_data["ref_element"]
-
-        old_pot = 0
-        new_pot = 0
-        for ele, _ in old_ads_count.items():
-            if ele != ref_element:
-                old_pot += (
-                    old_ads_count[ele]
-                    - stoics[ele] / stoics[ref_element] * old_ads_count[ref_element]
-                ) * ads_pot_dict[ele]
-                new_pot += (
-                    new_ads_count[ele]
-                    - stoics[ele] / stoics[ref_element] * new_ads_count[ref_element]
-                ) * ads_pot_dict[ele]
-
+    if reference_energies is not None:
+        reference_energies.update_composition(composition, start_ads, end_ads)
+        new_pot = reference_energies.get_pot_energy(
+            composition, ads_pot_dict, present=present
+        )
         delta_pot = new_pot - old_pot
 
     return slab, state, delta_pot, start_ads, end_ads
 
 
-def add_to_slab(slab, state, adsorbate, coords, site_idx):
+def add_to_slab(slab, state, adsorbate, coords, site_idx, slots=None):
     """It adds an adsorbate to a slab, and updates the state to reflect the new adsorbate
 
     Parameters
@@ -341,11 +530,20 @@ def add_to_slab(slab, state, adsorbate, coords, site_idx):
         the coordinates of the sites on the surface
     site_idx : int
         the index of the site on the slab where the adsorbate will be placed
+    slots : list, optional
+        the slab indices of the ghost slots of a fixed capacity slab, see `add_ghost_slots`. If given, the
+    slot of the site is filled instead of appending an atom.
 
     Returns
     -------
         The state and slab are being returned.
     """
+    if slots is not None:
+        adsorbate_idx = int(slots[site_idx])
+        state[site_idx] = adsorbate_idx
+        slab.numbers[adsorbate_idx] = atomic_numbers[adsorbate]
+        slab.positions[adsorbate_idx] = coords[site_idx]
+        return state, slab
 
     adsorbate_idx = len(slab)
     state[site_idx] = adsorbate_idx
@@ -354,7 +552,7 @@ def add_to_slab(slab, state, adsorbate, coords, site_idx):
     return state, slab
 
 
-def remove_from_slab(slab, state, site_idx):
+def remove_from_slab(slab, state, site_idx, slots=None):
     """Remove the adsorbate from the slab and update the state
 
     Parameters
@@ -366,15 +564,32 @@ def remove_from_slab(slab, state, site_idx):
     site is empty, the integer is 0.
     site_idx : int
         the index of the site to remove the adsorbate from
+    slots : list, optional
+        the slab indices of the ghost slots of a fixed capacity slab, see `add_ghost_slots`. If given, the
+    slot of the site is emptied instead of deleting the atom.
 
     Returns
     -------
         The state and slab are being returned.
     """
+    if slots is not None:
+        # indices of the other adsorbates don't shift
+        slab.numbers[state[site_idx]] = 0
+        state[site_idx] = 0
+        return state, slab
+
     adsorbate_idx = state[site_idx]
     assert len(np.argwhere(state == adsorbate_idx)) <= 1, "more than 1 site found"
     assert len(np.argwhere(state == adsorbate_idx)) == 1, "no sites found"
 
+    graph = getattr(slab, "_graph", None)
+    if graph is not None and "deleted_nodes" in graph.graph:
+        # catkit Gratoms relabel their graph in place, record the deleted node and its edges so that
+        # restore_slab_snapshot can undo it
+        node = int(adsorbate_idx)
+        graph.graph["deleted_nodes"].append(
+            (graph, node, dict(graph.nodes[node]), dict(graph.adj[node]))
+        )
     del slab[int(adsorbate_idx)]
 
     # lower the index for higher index items
@@ -387,9 +602,254 @@ def remove_from_slab(slab, state, site_idx):
     return state, slab
 
 
-def get_adsorption_coords(slab, atom, connectivity, debug=False):
-    """Takes a slab, an atom, and a list of site indices, and returns the actual coordinates of the
-    adsorbed atoms
+def get_slab_snapshot(slab, state):
+    """Record the parts of the slab and state that `change_site` can modify, so that a rejected move
+    can be undone with `restore_slab_snapshot` instead of applying `change_site` in reverse.
+
+    Parameters
+    ----------
+    slab : ase.Atoms
+        the slab before the proposed move
+    state : list
+        a list of integers, where each integer represents the slab index of the adsorbate on that site. If the
+    site is empty, the integer is 0.
+
+    Returns
+    -------
+    dict
+        The snapshot of the slab and state.
+    """
+    # adding and removing atoms replace the per-atom arrays instead of modifying them, so keeping
+    # references is enough. positions can be wrapped in place when updating neighbor lists, and
+    # ghost slots of fixed capacity slabs are filled in place
+    arrays = dict(slab.arrays)
+    arrays["positions"] = slab.arrays["positions"].copy()
+    arrays["numbers"] = slab.arrays["numbers"].copy()
+    snapshot = {
+        "arrays": arrays,
+        "constraints": list(slab.constraints),
+        "state": np.array(state, copy=True),
+    }
+    # catkit Gratoms get a new graph when atoms are added, but relabel it in place when atoms are
+    # deleted. instead of copying the graph, remove_from_slab records the deleted nodes and edges
+    graph = getattr(slab, "_graph", None)
+    if graph is not None and len(graph) > 0:
+        graph.graph["deleted_nodes"] = []
+        snapshot["graph"] = graph
+    return snapshot
+
+
+def restore_slab_snapshot(slab, snapshot):
+    """Restore the slab and state recorded with `get_slab_snapshot`.
+
+    Parameters
+    ----------
+    slab : ase.Atoms
+        the slab after the rejected move
+    snapshot : dict
+        the snapshot from before the move
+
+    Returns
+    -------
+        The state and slab are being returned.
+    """
+    slab.arrays = snapshot["arrays"]
+    slab.set_constraint(snapshot["constraints"])
+    if "graph" in snapshot:
+        slab._graph = restore_graph(snapshot["graph"])
+    return snapshot["state"], slab
+
+
+def restore_graph(graph):
+    """Undo the node deletions that `remove_from_slab` recorded for a Gratoms graph since the last
+    `get_slab_snapshot`. The graph is only rebuilt if nodes were deleted from it.
+
+    Parameters
+    ----------
+    graph : networkx.Graph
+        the graph of the slab when the snapshot was taken
+
+    Returns
+    -------
+        The graph with the deleted nodes and their edges added back.
+    """
+    # graphs of slabs with added atoms share the record, only the deletions from this graph are undone
+    deletions = [
+        deletion for deletion in graph.graph["deleted_nodes"] if deletion[0] is graph
+    ]
+    for _, node, node_data, adj in reversed(deletions):
+        restored = graph.__class__()
+        restored.graph.update(graph.graph)
+        # shift the later nodes back, keeping the nodes in the order of the atoms
+        nodes = [(n + (n >= node), data) for n, data in graph.nodes(data=True)]
+        restored.add_nodes_from(sorted(nodes + [(node, node_data)], key=lambda n: n[0]))
+        if graph.is_multigraph():
+            restored.add_edges_from(
+                (u + (u >= node), v + (v >= node), key, data)
+                for u, v, key, data in graph.edges(keys=True, data=True)
+            )
+            restored.add_edges_from(
+                (node, neighbor, key, data)
+                for neighbor, edges in adj.items()
+                for key, data in edges.items()
+            )
+        else:
+            restored.add_edges_from(
+                (u + (u >= node), v + (v >= node), data)
+                for u, v, data in graph.edges(data=True)
+            )
+            restored.add_edges_from(
+                (node, neighbor, data) for neighbor, data in adj.items()
+            )
+        graph = restored
+    graph.graph["deleted_nodes"] = []
+    return graph
+
+
+def add_ghost_slots(slab, state, coords):
+    """Convert a slab into a fixed capacity slab, where every adsorption site has its own atom slot.
+    Empty slots hold ghost atoms (symbol X, atomic number 0), so that adsorbing and desorbing only change
+    the atomic number of the slot and the number and order of atoms in the slab stays the same.
+
+    Parameters
+    ----------
+    slab : ase.Atoms
+        the slab, possibly with adsorbates that are tracked in `state`
+    state : list
+        a list of integers, where each integer represents the slab index of the adsorbate on that site. If the
+    site is empty, the integer is 0.
+    coords : list
+        the coordinates of the sites on the surface
+
+    Returns
+    -------
+        The state, the slab and the slab indices of the slots of each site.
+    """
+    state = np.array(state)
+    occupied = state > 0
+    ads_numbers = slab.numbers[state[occupied]]
+    ads_positions = slab.positions[state[occupied]]
+
+    # move the adsorbates into the slots of their sites
+    if np.any(occupied):
+        del slab[state[occupied].tolist()]
+    slots = np.arange(len(slab), len(slab) + len(coords))
+    slab.extend(Atoms(numbers=np.zeros(len(coords), dtype=int), positions=coords))
+    slab.numbers[slots[occupied]] = ads_numbers
+    slab.positions[slots[occupied]] = ads_positions
+
+    state = np.where(occupied, slots, 0)
+    logger.info(f"added {len(slots)} ghost slots to the slab")
+    return state, slab, slots
+
+
+def remove_ghost_slots(slab):
+    """Get a copy of the slab without the empty ghost slots, e.g. for saving.
+
+    Parameters
+    ----------
+    slab : ase.Atoms
+        the fixed capacity slab
+
+    Returns
+    -------
+        The slab with the occupied atoms only.
+    """
+    return slab[slab.numbers > 0]
+
+
+def trilaterate_sites(centers, r, zvectors):
+    """Vectorized `catkit.gen.utils.trilaterate` for sites with the same number of centers.
+
+    Parameters
+    ----------
+    centers : np.ndarray
+        the positions of the atoms of each site, with shape (num_sites, num_centers, 3)
+    r : np.ndarray
+        the bond lengths to the atoms of each site, with shape (num_sites, num_centers)
+    zvectors : np.ndarray
+        the adsorption vector of each site, with shape (num_sites, 3)
+
+    Returns
+    -------
+        The positions of the adsorbates on the sites.
+    """
+    num_centers = centers.shape[1]
+    if num_centers == 1:
+        return centers[:, 0] + r[:, :1] * zvectors
+    if num_centers > 3:
+        return centers.mean(axis=1) + r.mean(axis=1)[:, None] / 2 * zvectors
+
+    vec1 = centers[:, 1] - centers[:, 0]
+    d = np.linalg.norm(vec1, axis=1)
+    uvec1 = vec1 / d[:, None]
+    # spheres that don't intersect give nan heights, which catkit replaces with 0.01
+    with np.errstate(invalid="ignore"):
+        if num_centers == 2:
+            x0 = d**2 - r[:, 0] ** 2 + r[:, 1] ** 2
+            x = d - x0 / (2 * d)
+            z = 0.5 * (1 / d) * np.sqrt(4 * d**2 * r[:, 1] ** 2 - x0**2)
+            z = np.where(np.isnan(z), 0.01, z)
+            return centers[:, 0] + uvec1 * x[:, None] + z[:, None] * zvectors
+
+        vec2 = centers[:, 2] - centers[:, 0]
+        i = np.sum(uvec1 * vec2, axis=1)
+        vec2 = vec2 - i[:, None] * uvec1
+        uvec2 = vec2 / np.linalg.norm(vec2, axis=1)[:, None]
+        uvec3 = np.cross(uvec1, uvec2)
+        j = np.sum(uvec2 * vec2, axis=1)
+
+        x = (r[:, 0] ** 2 - r[:, 1] ** 2 + d**2) / (2 * d)
+        y = (r[:, 0] ** 2 - r[:, 2] ** 2 - 2 * i * x + i**2 + j**2) / (2 * j)
+        z = np.sqrt(r[:, 0] ** 2 - x**2 - y**2)
+        z = np.where(np.isnan(z), 0.01, z)
+    return centers[:, 0] + x[:, None] * uvec1 + y[:, None] * uvec2 + z[:, None] * uvec3
+
+
+def generate_adsorption_sites(slab, atom):
+    """Get the coordinates and connectivity of all adsorption sites of a slab, without symmetry
+    reduction. The coordinates are the positions of `atom` on each site as placed by catkit's
+    `Builder._single_adsorption`, but the adsorption site network is built only once and the positions
+    are trilaterated for all sites with the same number of surface atoms at once.
+
+    Parameters
+    ----------
+    slab : catkit.gratoms.Gratoms
+        the pristine slab with surface atoms
+    atom : ase.Atoms
+        the adsorbate, bonded by its first atom
+
+    Returns
+    -------
+        The positions of the adsorbate atoms on every site, wrapped into the cell, and the number of
+    surface atoms of every site.
+    """
+    sites = catkit.gen.adsorption.AdsorptionSites(slab)
+    site_idx = sites.get_periodic_sites()
+    vectors = sites.get_adsorption_vectors(unique=False)
+    connectivity = sites.connectivity[site_idx]
+    top_sites = sites.coordinates[sites.connectivity == 1]
+    bond_radius = catkit.gen.adsorption.radii[atom.numbers[0]]
+
+    topology = [np.asarray(sites.r1_topology[i], dtype=int) for i in site_idx]
+    num_centers = np.array([len(u) for u in topology])
+    base_positions = np.zeros((len(site_idx), 3))
+    for k in np.unique(num_centers):
+        group = np.nonzero(num_centers == k)[0]
+        u = np.stack([topology[i] for i in group])
+        r = catkit.gen.adsorption.radii[slab.numbers[sites.index[u]]] + bond_radius
+        base_positions[group] = trilaterate_sites(top_sites[u], r, vectors[group])
+
+    # the adsorbate is translated so that its bonded atom is on the site
+    ads_positions = atom.positions - atom.positions[0]
+    positions = (base_positions[:, None] + ads_positions[None]).reshape(-1, 3)
+    positions = wrap_positions(positions, slab.cell, pbc=slab.pbc)
+    return positions, connectivity
+
+
+def get_adsorption_coords(slab, atom, connectivity=None, debug=False):
+    """Takes a slab and an atom, and returns the actual coordinates of the adsorbed atoms. This is a
+    thin wrapper of `generate_adsorption_sites`, which also returns the connectivity of the sites.
 
     Parameters
     ----------
@@ -397,9 +857,11 @@ def get_adsorption_coords(slab, atom, connectivity, debug=False):
         the original slab
     atom : ase.Atoms
         the atom you want to adsorb
-    connectivity : list
-        list of lists of integers, each list is a list of the indices of the atoms that are connected to
-    the atom at the index of the list.
+    connectivity : list, optional
+        connectivity of the sites, e.g. from catkit's `get_adsorption_sites`. It is only used to keep
+    the coordinates of the first `len(connectivity)` sites, by default all sites are kept.
+    debug : bool, optional
+        write the slab with an adsorbate on every site to a cif file
 
     Returns
     -------
@@ -407,33 +869,132 @@ def get_adsorption_coords(slab, atom, connectivity, debug=False):
 
     """
     logger.debug(f"getting actual adsorption site coordinates")
-    new_slab = slab.copy()
-
-    proposed_slab_builder = catkit.gen.adsorption.Builder(new_slab)
-
-    # add multiple adsorbates
-    site_indices = list(range(len(connectivity)))
-
-    # use proposed_slab_builder._single_adsorption multiple times
-    for i, index in enumerate(site_indices):
-        new_slab = proposed_slab_builder._single_adsorption(
-            atom,
-            bond=0,
-            slab=new_slab,
-            site_index=site_indices[i],
-            auto_construct=False,
-            symmetric=False,
-        )
+    coords, site_connectivity = generate_adsorption_sites(slab, atom)
+    if connectivity is None:
+        connectivity = site_connectivity
+    coords = coords[: len(connectivity) * len(atom)]
 
     if debug:
+        new_slab = Atoms(
+            numbers=np.concatenate(
+                [slab.numbers, np.tile(atom.numbers, len(connectivity))]
+            ),
+            positions=np.concatenate([slab.positions, coords]),
+            cell=slab.cell,
+            pbc=slab.pbc,
+        )
         write(f"ads_{str(atom.symbols)}_all_adsorbed_slab.cif", new_slab)
 
-    # store the actual positions of the sides
-    logger.debug(
-        f"new slab has {len(new_slab)} atoms and original slab has {len(slab)} atoms."
-    )
+    return coords
 
-    return new_slab.get_positions(wrap=True)[len(slab) :]
+
+def get_array_hash(*arrays, **settings) -> str:
+    """Hash arrays and JSON serializable settings, e.g. to key cached data of a slab."""
+    digest = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(str((array.dtype.str, array.shape)).encode())
+        digest.update(array.tobytes())
+    digest.update(json.dumps(settings, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+class SiteCache:
+    """On-disk cache of the adsorption sites of a pristine slab and of the tables derived from them,
+    such as distance weights and site conflicts, so that runs on the same slab skip the site
+    generation. Every table is stored in its own .npz file, named after the table and a hash of the
+    slab, the adsorbate and the settings of the table, so runs with other settings don't read it.
+    """
+
+    VERSION = 1
+
+    def __init__(self, folder: str, slab, element: str):
+        """
+        Parameters
+        ----------
+        folder : str
+            Folder of the cache files, which can be shared by several runs
+        slab : ase.Atoms
+            The pristine slab
+        element : str
+            The adsorbate whose positions on the sites are cached
+        """
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.slab_key = get_array_hash(
+            slab.get_cell(),
+            slab.get_pbc(),
+            *(slab.arrays[name] for name in sorted(slab.arrays)),
+            arrays=sorted(slab.arrays),
+            element=element,
+            version=self.VERSION,
+        )
+
+    def get_path(self, name: str, **settings) -> str:
+        key = get_array_hash(slab=self.slab_key, name=name, **settings)
+        return os.path.join(self.folder, f"{name}_{key}.npz")
+
+    def load(self, path: str):
+        with np.load(path) as data:
+            values = []
+            for i in range(int(data["num_values"])):
+                if f"{i}_indptr" in data:
+                    values.append(
+                        csr_matrix(
+                            (
+                                data[f"{i}_data"],
+                                data[f"{i}_indices"],
+                                data[f"{i}_indptr"],
+                            ),
+                            shape=tuple(data[f"{i}_shape"]),
+                        )
+                    )
+                else:
+                    values.append(data[str(i)])
+        return tuple(values)
+
+    def save(self, path: str, values: tuple):
+        arrays = {"num_values": len(values)}
+        for i, value in enumerate(values):
+            if issparse(value):
+                value = value.tocsr()
+                arrays[f"{i}_data"] = value.data
+                arrays[f"{i}_indices"] = value.indices
+                arrays[f"{i}_indptr"] = value.indptr
+                arrays[f"{i}_shape"] = value.shape
+            else:
+                arrays[str(i)] = np.asarray(value)
+        # write to a temporary file first so that other runs never read a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    def get(self, name: str, compute, **settings) -> tuple:
+        """Load a table from the cache, or compute and store it.
+
+        Parameters
+        ----------
+        name : str
+            Name of the table, e.g. "sites" or "distance_weights"
+        compute : callable
+            Function without arguments that returns the table as a tuple of arrays or sparse matrices
+        settings
+            Everything besides the slab and adsorbate that the table depends on, e.g. the site
+            coordinates and the decay factor of distance weights
+
+        Returns
+        -------
+        tuple
+            The arrays and sparse matrices of the table
+        """
+        path = self.get_path(name, **settings)
+        if os.path.exists(path):
+            logger.info(f"loading {name} from {path}")
+            return self.load(path)
+        values = tuple(compute())
+        self.save(path, values)
+        return values
 
 
 def count_adsorption_sites(slab, state, connectivity):
@@ -457,3 +1018,81 @@ def count_adsorption_sites(slab, state, connectivity):
     """
     occ_idx = state > 0
     return Counter(connectivity[occ_idx])
+
+
+def get_site_occupancy(slab, state):
+    """Get the species at each adsorption site, independent of the atom indices in the slab
+
+    Parameters
+    ----------
+    slab : ase.Atoms
+        the slab object
+    state : np.ndarray
+        slab index of the adsorbate on each site, 0 if the site is empty
+
+    Returns
+    -------
+        An array with the atomic number of the adsorbate at each site, 0 for empty sites.
+    """
+    state = np.asarray(state)
+    occupancy = np.zeros(len(state), dtype=np.uint8)
+    occupied = state > 0
+    occupancy[occupied] = slab.get_atomic_numbers()[state[occupied]]
+    return occupancy
+
+
+def wrap_scaled_positions(scaled_positions):
+    """Wrap scaled positions into [0, 1), which `% 1.0` alone does not guarantee for tiny negative values."""
+    scaled_positions = scaled_positions % 1.0
+    scaled_positions[scaled_positions >= 1.0] = 0.0
+    return scaled_positions
+
+
+def get_site_permutations(slab, coords, symprec=1e-3, tol=0.1):
+    """Get the permutations of the adsorption sites under the surface symmetry operations of the slab.
+    Only operations that keep the surface normal fixed (rotations about and mirror planes containing
+    the z-axis, combined with in-plane translations) are considered.
+
+    Parameters
+    ----------
+    slab : ase.Atoms
+        the pristine slab
+    coords : np.ndarray
+        the coordinates of the sites on the surface
+    symprec : float
+        symmetry tolerance passed to spglib, in angstroms
+    tol : float
+        tolerance for matching the image of a site to a site, in angstroms
+
+    Returns
+    -------
+        An array of shape (num_ops, num_sites) where row k gives the index of the image of each
+    site under symmetry operation k.
+    """
+    cell = slab.get_cell()
+    symmetry = spglib.get_symmetry(
+        (cell[:], slab.get_scaled_positions(), slab.get_atomic_numbers()),
+        symprec=symprec,
+    )
+
+    scaled_coords = wrap_scaled_positions(cell.scaled_positions(coords))
+    tree = cKDTree(scaled_coords, boxsize=1.0)
+    frac_tol = tol / np.max(cell.lengths())
+
+    permutations = []
+    for rotation, translation in zip(symmetry["rotations"], symmetry["translations"]):
+        # keep the surface normal and the surface itself fixed
+        if not (
+            np.all(rotation[2] == [0, 0, 1])
+            and np.all(rotation[:, 2] == [0, 0, 1])
+            and np.isclose(translation[2] - np.round(translation[2]), 0, atol=symprec)
+        ):
+            continue
+        images = wrap_scaled_positions(scaled_coords @ rotation.T + translation)
+        dists, perm = tree.query(images, distance_upper_bound=frac_tol)
+        # the sites have to map onto each other
+        if np.all(np.isfinite(dists)) and len(set(perm)) == len(coords):
+            permutations.append(perm)
+
+    logger.info(f"found {len(permutations)} surface symmetry operations for the sites")
+    return np.array(permutations)
@@ -0,0 +1,304 @@
+"""Compact storage for the structures and statistics of a run, on disk and in memory"""
+
+import logging
+
+import ase
+import h5py
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# compression of all datasets
+COMPRESSION = {"compression": "gzip", "compression_opts": 4, "shuffle": True}
+ATOMS_CHUNK_SIZE = 4096
+FRAMES_CHUNK_SIZE = 256
+
+
+class TrajectoryStore:
+    """Append-only store with one group of chunked, compressed datasets per kind of record, e.g.
+    `sweeps` for the structure at the end of every sweep or `moves` for the acceptance data of every
+    proposal.
+
+    Structures of different sizes are stored back to back in the `positions` and `numbers` datasets,
+    with the number of atoms of each frame in `natoms`. Scalars such as energies are stored in one
+    dataset per name, which is created when the name is first appended.
+
+    Records with only scalars, e.g. the `moves` of every proposal, are buffered in memory and written
+    together by `flush`, which also flushes the file. MCMC flushes the store at the end of every sweep.
+    """
+
+    def __init__(self, path: str, mode: str = "a"):
+        self.path = path
+        self.file = h5py.File(path, mode)
+        # scalar records of each kind that are not written yet
+        self.buffers = {}
+
+    def get_group(self, kind: str):
+        if kind not in self.file:
+            self.file.create_group(kind)
+        return self.file[kind]
+
+    def append_dataset(self, group, name: str, values: np.ndarray):
+        """Append values along the first axis of a dataset, creating it if needed."""
+        values = np.asarray(values)
+        if name not in group:
+            chunk_size = ATOMS_CHUNK_SIZE if name in ("positions", "numbers") else None
+            group.create_dataset(
+                name,
+                shape=(0,) + values.shape[1:],
+                maxshape=(None,) + values.shape[1:],
+                dtype=values.dtype,
+                chunks=(chunk_size or FRAMES_CHUNK_SIZE,) + values.shape[1:],
+                **COMPRESSION,
+            )
+        dataset = group[name]
+        size = len(dataset)
+        dataset.resize(size + len(values), axis=0)
+        dataset[size:] = values
+
+    def append(self, kind: str, atoms=None, state=None, **scalars):
+        """Append a record.
+
+        Parameters
+        ----------
+        kind : str
+            Name of the group, e.g. `sweeps`, `relaxed`, `proposals` or `moves`
+        atoms : ase.Atoms, optional
+            Structure of the record
+        state : np.ndarray, optional
+            Site occupancy state of the record
+        scalars
+            Scalar values of the record, e.g. the energy or whether a move was accepted
+        """
+        if atoms is None and state is None:
+            self.buffers.setdefault(kind, []).append(scalars)
+            return
+
+        # keep the order of the records of this kind
+        self.write_buffer(kind)
+        group = self.get_group(kind)
+        if atoms is not None:
+            self.append_dataset(group, "positions", atoms.get_positions())
+            self.append_dataset(
+                group, "numbers", atoms.get_atomic_numbers().astype(np.int32)
+            )
+            self.append_dataset(group, "natoms", [len(atoms)])
+            self.append_dataset(group, "cells", [np.array(atoms.get_cell())])
+            self.append_dataset(group, "pbc", [atoms.get_pbc()])
+        if state is not None:
+            self.append_dataset(group, "states", [np.asarray(state, dtype=np.int32)])
+        for name, value in scalars.items():
+            self.append_dataset(group, name, [value])
+
+    def write_buffer(self, kind: str):
+        """Write the buffered scalar records of a kind, one dataset append per name."""
+        records = self.buffers.pop(kind, [])
+        if not records:
+            return
+        group = self.get_group(kind)
+        for name in records[0]:
+            self.append_dataset(group, name, [record[name] for record in records])
+
+    def flush(self):
+        """Write all buffered records and flush the file."""
+        for kind in list(self.buffers):
+            self.write_buffer(kind)
+        self.file.flush()
+
+    def get_lengths(self) -> dict:
+        """Get the length of every dataset, e.g. to truncate the store back to a checkpoint."""
+        self.flush()
+        return {
+            f"{kind}/{name}": len(dataset)
+            for kind, group in self.file.items()
+            for name, dataset in group.items()
+        }
+
+    def truncate(self, lengths: dict):
+        """Drop everything that was appended after the lengths were recorded with `get_lengths`."""
+        self.buffers = {}
+        for kind, group in self.file.items():
+            for name, dataset in group.items():
+                dataset.resize(lengths.get(f"{kind}/{name}", 0), axis=0)
+        self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.flush()
+            self.file.close()
+
+
+def read_trajectory(path: str, kind: str = "sweeps", start: int = 0, stop: int = None):
+    """Stream the frames of a `TrajectoryStore` one at a time.
+
+    Parameters
+    ----------
+    path : str
+        Path of the store
+    kind : str, optional
+        Group to read, by default "sweeps"
+    start : int, optional
+        First frame, by default 0
+    stop : int, optional
+        Stop before this frame, by default the last frame
+
+    Yields
+    ------
+    ase.Atoms
+        Structure of each frame, with the state and scalars of the frame in `atoms.info`
+    """
+    with h5py.File(path, "r") as f:
+        group = f[kind]
+        natoms = group["natoms"][:]
+        offsets = np.concatenate([[0], np.cumsum(natoms)])
+        scalar_names = [
+            name
+            for name, dataset in group.items()
+            if dataset.ndim == 1 and name not in ("numbers", "natoms")
+        ]
+
+        for i in range(start, len(natoms) if stop is None else stop):
+            atoms = ase.Atoms(
+                numbers=group["numbers"][offsets[i] : offsets[i + 1]],
+                positions=group["positions"][offsets[i] : offsets[i + 1]],
+                cell=group["cells"][i],
+                pbc=group["pbc"][i],
+            )
+            if "states" in group:
+                atoms.info["state"] = group["states"][i]
+            for name in scalar_names:
+                atoms.info[name] = group[name][i].item()
+            yield atoms
+
+
+def read_scalars(path: str, kind: str = "moves") -> dict:
+    """Read the scalar datasets of a group of a `TrajectoryStore`, e.g. the acceptance data of every
+    proposal.
+
+    Parameters
+    ----------
+    path : str
+        Path of the store
+    kind : str, optional
+        Group to read, by default "moves"
+
+    Returns
+    -------
+    dict
+        Array of values for every scalar name
+    """
+    with h5py.File(path, "r") as f:
+        return {
+            name: dataset[:]
+            for name, dataset in f[kind].items()
+            if dataset.ndim == 1 and name not in ("numbers", "natoms")
+        }
+
+
+class CompactHistory:
+    """In-memory history of the slab at the end of every sweep that stores the substrate once and,
+    per sweep, only the site occupancy, the atomic number and relaxed displacement of the adsorbate on
+    every site and a few scalars in fixed-dtype arrays. The full structure of a sweep is rebuilt
+    when it is accessed, so the history can be indexed and iterated like a list of slabs.
+
+    The substrate is always rebuilt at its initial positions; the relaxed structures of the whole
+    slab can be kept with the trajectory store.
+    """
+
+    def __init__(self, substrate: ase.Atoms, ads_coords: np.ndarray, capacity: int = 1):
+        self.substrate = ase.Atoms(
+            numbers=substrate.get_atomic_numbers(),
+            positions=substrate.get_positions(),
+            tags=substrate.get_tags(),
+            cell=substrate.get_cell(),
+            pbc=substrate.get_pbc(),
+        )
+        self.ads_coords = np.array(ads_coords, dtype=float)
+        self.length = 0
+
+        num_sites = len(self.ads_coords)
+        capacity = max(capacity, 1)
+        self.states = np.zeros((capacity, num_sites), dtype=np.int32)
+        self.numbers = np.zeros((capacity, num_sites), dtype=np.uint8)
+        self.displacements = np.zeros((capacity, num_sites, 3), dtype=np.float32)
+        self.scalars = {}
+
+    def grow(self):
+        """Double the capacity of the per sweep arrays."""
+        self.states = np.concatenate([self.states, np.zeros_like(self.states)])
+        self.numbers = np.concatenate([self.numbers, np.zeros_like(self.numbers)])
+        self.displacements = np.concatenate(
+            [self.displacements, np.zeros_like(self.displacements)]
+        )
+        for name, values in self.scalars.items():
+            self.scalars[name] = np.concatenate([values, np.full_like(values, np.nan)])
+
+    def append(self, slab: ase.Atoms, state: np.ndarray, positions=None, **scalars):
+        """Append the slab at the end of a sweep.
+
+        Parameters
+        ----------
+        slab : ase.Atoms
+            Slab with the adsorbates at the slab indices given by the state
+        state : np.ndarray
+            Site occupancy state, the slab index of the adsorbate on each site or 0 if empty
+        positions : np.ndarray, optional
+            Relaxed positions of the slab, by default the positions of the slab
+        scalars
+            Scalar values of the sweep, e.g. the energy or the fraction of accepted moves
+        """
+        if self.length == len(self.states):
+            self.grow()
+        if positions is None:
+            positions = slab.positions
+
+        state = np.asarray(state, dtype=np.int32)
+        occupied = np.nonzero(state)[0]
+        ads_indices = state[occupied]
+
+        i = self.length
+        self.states[i] = state
+        self.numbers[i] = 0
+        self.numbers[i, occupied] = slab.numbers[ads_indices]
+        self.displacements[i] = 0.0
+        self.displacements[i, occupied] = (
+            positions[ads_indices] - self.ads_coords[occupied]
+        )
+        for name, value in scalars.items():
+            if name not in self.scalars:
+                self.scalars[name] = np.full(len(self.states), np.nan)
+            self.scalars[name][i] = value
+        self.length += 1
+
+    def get_atoms(self, i: int) -> ase.Atoms:
+        """Rebuild the slab of a sweep, with the adsorbates in the order of their slab indices and the
+        state and scalars of the sweep in `atoms.info`."""
+        state = self.states[i]
+        occupied = np.nonzero(state)[0]
+        occupied = occupied[np.argsort(state[occupied], kind="stable")]
+
+        atoms = self.substrate.copy()
+        atoms += ase.Atoms(
+            numbers=self.numbers[i, occupied],
+            positions=self.ads_coords[occupied] + self.displacements[i, occupied],
+        )
+        atoms.info["state"] = state.copy()
+        for name, values in self.scalars.items():
+            atoms.info[name] = values[i].item()
+        return atoms
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.get_atoms(i) for i in range(*index.indices(self.length))]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("history index out of range")
+        return self.get_atoms(index)
+
+    def __iter__(self):
+        for i in range(self.length):
+            yield self.get_atoms(i)
@@ -1,11 +1,21 @@
+import logging
+import os
+import queue
+import threading
+
 import matplotlib.pyplot as plt
 import numpy as np
 from ase.atoms import Atoms
+from ase.geometry import get_distances
+from ase.neighborlist import primitive_neighbor_list
 from nff.io.ase import AtomsBatch
 from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.sparse import csr_matrix, issparse
 from scipy.spatial import distance
 from scipy.special import softmax
 
+logger = logging.getLogger(__name__)
+
 
 def get_atoms_batch(slab: Atoms, neighbor_cutoff: float, nff_calc, device: str):
     return AtomsBatch(
@@ -55,6 +65,242 @@ def filter_distances(slab, ads=["O"], cutoff_distance: float = 1.5):
     return True
 
 
+def get_site_conflicts(
+    slab, ads_coords, ads=["O"], cutoff_distance: float = 1.5, num_substrate_atoms=None
+):
+    """This function precomputes which adsorption sites are too close to each other to be occupied at
+    the same time, so that `filter_site_distances` only has to check the neighbors of changed sites
+    instead of all distances in the slab as in `filter_distances`.
+
+    Parameters
+    ----------
+    slab : ase.atoms.Atoms or catkit.gratoms.Gratoms or AtomsBatch
+        The `slab` is the surface structure
+    ads_coords
+        The coordinates of the adsorption sites.
+    ads
+        The chemical symbols of the adsorbates. Substrate atoms of these elements also block nearby sites.
+    cutoff_distance
+        The minimum distance allowed between any two adsorbate atoms.
+    num_substrate_atoms
+        The number of substrate atoms at the start of the slab, by default all atoms.
+
+    Returns
+    -------
+        a sparse boolean matrix in CSR format, where row i holds the sites within the cutoff distance of
+    site i, and a boolean array of the sites within the cutoff distance of a substrate atom of an
+    adsorbate element.
+
+    """
+    ads_coords = np.asarray(ads_coords, dtype=float)
+    num_sites = len(ads_coords)
+
+    # minimum image distances between all sites within the cutoff
+    site_i, site_j, dists = primitive_neighbor_list(
+        "ijd",
+        slab.pbc,
+        slab.cell,
+        ads_coords,
+        cutoff_distance + 1e-6,
+        self_interaction=False,
+    )
+    close = (dists > 0) & (dists <= cutoff_distance)
+    site_conflicts = csr_matrix(
+        (np.ones(np.count_nonzero(close), dtype=bool), (site_i[close], site_j[close])),
+        shape=(num_sites, num_sites),
+    )
+    site_conflicts.sum_duplicates()
+
+    # sites too close to substrate atoms that are counted as adsorbates
+    substrate = slab[:num_substrate_atoms]
+    substrate_ads = np.isin(substrate.get_chemical_symbols(), ads)
+    substrate_blocked = np.zeros(num_sites, dtype=bool)
+    if np.any(substrate_ads):
+        _, dists = get_distances(
+            ads_coords,
+            substrate.positions[substrate_ads],
+            cell=slab.cell,
+            pbc=slab.pbc,
+        )
+        substrate_blocked = np.any((dists > 0) & (dists <= cutoff_distance), axis=1)
+
+    return site_conflicts, substrate_blocked
+
+
+def filter_site_distances(state, site_conflicts, changed_sites, substrate_blocked=None):
+    """This function checks that the adsorbates on the changed sites are not too close to any other
+    adsorbate, using the site conflicts from `get_site_conflicts`. If the state before the change
+    passed the check, this gives the same result as `filter_distances` on the whole slab.
+
+    Parameters
+    ----------
+    state
+        The slab index of the adsorbate on each site, 0 for empty sites.
+    site_conflicts
+        The sparse matrix of sites too close to each other from `get_site_conflicts`.
+    changed_sites
+        The sites that were changed by the proposed move.
+    substrate_blocked
+        The sites too close to a substrate atom of an adsorbate element from `get_site_conflicts`.
+
+    Returns
+    -------
+        a boolean value. It returns True if none of the changed sites conflicts with another occupied site
+    or the substrate, and False otherwise.
+
+    """
+    for site in changed_sites:
+        if state[site] == 0:
+            continue
+        if substrate_blocked is not None and substrate_blocked[site]:
+            return False  # fail because atoms are too close
+        neighbors = site_conflicts.indices[
+            site_conflicts.indptr[site] : site_conflicts.indptr[site + 1]
+        ]
+        if np.any(state[neighbors] > 0):
+            return False  # fail because atoms are too close
+    return True
+
+
+class SumTree:
+    """Binary tree of partial sums over non-negative weights, which supports updating a weight and
+    sampling an index with probability proportional to its weight in O(log n)."""
+
+    def __init__(self, weights):
+        """
+        Parameters
+        ----------
+        weights : np.ndarray
+            Initial non-negative weight of each index
+        """
+        self.size = len(weights)
+        self.capacity = 1 << max(self.size - 1, 0).bit_length()
+        self.tree = np.zeros(2 * self.capacity)
+        self.tree[self.capacity : self.capacity + self.size] = weights
+
+        # fill the tree level by level from the leaves
+        start = self.capacity
+        while start > 1:
+            self.tree[start // 2 : start] = (
+                self.tree[start : 2 * start : 2] + self.tree[start + 1 : 2 * start : 2]
+            )
+            start //= 2
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, idx):
+        return self.tree[self.capacity + idx]
+
+    @property
+    def total(self):
+        return self.tree[1]
+
+    @property
+    def weights(self):
+        return self.tree[self.capacity : self.capacity + self.size]
+
+    def update(self, idx: int, weight: float):
+        """Set the weight of an index."""
+        i = self.capacity + idx
+        self.tree[i] = weight
+        i //= 2
+        while i >= 1:
+            # recompute instead of adding the difference to avoid round-off drift
+            self.tree[i] = self.tree[2 * i] + self.tree[2 * i + 1]
+            i //= 2
+
+    def sample(self, u: float):
+        """Get the index at which the cumulative weight first exceeds u times the total weight.
+
+        Parameters
+        ----------
+        u : float
+            Uniform random number in [0, 1)
+
+        Returns
+        -------
+        int
+            Sampled index
+        """
+        if self.total <= 0:
+            raise ValueError("cannot sample from a SumTree with zero total weight")
+        value = u * self.total
+        i = 1
+        while i < self.capacity:
+            left = 2 * i
+            # never descend into a subtree with zero weight because of round-off
+            if value < self.tree[left] or self.tree[left + 1] <= 0:
+                i = left
+            else:
+                value -= self.tree[left]
+                i = left + 1
+        return i - self.capacity
+
+
+class AsyncWriter:
+    """Background thread that runs output tasks, e.g. file writes and plots, in the order they were
+    submitted so that they don't block sampling. The queue of pending tasks is bounded, so `submit`
+    waits for the thread to catch up when output is produced faster than it can be written.
+
+    The arguments of a task must not be changed after it is submitted, so pass copies of objects that
+    are still being modified. An error in a task is raised by the next `submit` or `flush`.
+    """
+
+    def __init__(self, max_queue_size: int = 16):
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                self.queue.task_done()
+                return
+            func, args, kwargs = task
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                logger.exception(f"output task {func.__name__} failed")
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError("an output task failed") from error
+
+    def submit(self, func, *args, **kwargs):
+        """Queue a call of `func` with the given arguments, waiting while the queue is full."""
+        self.raise_error()
+        if not self.thread.is_alive():
+            raise RuntimeError("the writer is closed")
+        self.queue.put((func, args, kwargs))
+
+    def flush(self):
+        """Wait until all submitted tasks are done."""
+        self.queue.join()
+        self.raise_error()
+
+    def close(self):
+        """Finish all submitted tasks and stop the thread."""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.raise_error()
+
+
+def write_output(writer, func, *args, **kwargs):
+    """Run an output task in the background with an `AsyncWriter`, or right away if `writer` is None."""
+    if writer is not None:
+        writer.submit(func, *args, **kwargs)
+    else:
+        func(*args, **kwargs)
+
+
 def get_cluster_centers(points: np.ndarray, n_clusters: int):
     """
     This function performs hierarchical clustering on a set of points and returns the centers of the resulting clusters.
@@ -195,6 +441,91 @@ def compute_distance_weight_matrix(ads_coords, distance_decay_factor):
     return distance_weight_matrix
 
 
+def compute_sparse_distance_weights(
+    slab,
+    ads_coords,
+    distance_decay_factor,
+    cutoff: float = None,
+    dtype=np.float64,
+    memmap_folder: str = None,
+):
+    """This function computes the distance decay weights of `compute_distance_weight_matrix` as a
+    sparse matrix, using minimum image distances and only the sites within a cutoff distance, so that
+    memory scales with the number of sites times the number of neighbors.
+
+    Parameters
+    ----------
+    slab : ase.atoms.Atoms or catkit.gratoms.Gratoms or AtomsBatch
+        The `slab` is the surface structure, used for the cell and periodic boundary conditions
+    ads_coords
+        The coordinates of the adsorption sites.
+    distance_decay_factor
+        The length scale of the exponential decay of the weights.
+    cutoff
+        The distance beyond which the weights are zero, by default 5 times the decay factor.
+    dtype
+        The data type of the weights, e.g. np.float32 to halve the memory.
+    memmap_folder
+        If given, the weights are stored in memory-mapped .npy files in this folder.
+
+    Returns
+    -------
+        a sparse matrix in CSR format, where each row holds the normalized weights of the sites around
+    that site.
+
+    """
+    if cutoff is None:
+        cutoff = 5 * distance_decay_factor
+    ads_coords = np.asarray(ads_coords, dtype=float)
+    num_sites = len(ads_coords)
+
+    site_i, site_j, dists = primitive_neighbor_list(
+        "ijd", slab.pbc, slab.cell, ads_coords, cutoff, self_interaction=False
+    )
+    # each site is also a neighbor of itself
+    site_i = np.concatenate([site_i, np.arange(num_sites)])
+    site_j = np.concatenate([site_j, np.arange(num_sites)])
+    dists = np.concatenate([dists, np.zeros(num_sites)])
+
+    # keep the minimum image of each pair, ordered by row and column
+    order = np.lexsort((dists, site_j, site_i))
+    site_i, site_j, dists = site_i[order], site_j[order], dists[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (site_i[1:] != site_i[:-1]) | (site_j[1:] != site_j[:-1])
+    site_i, site_j, dists = site_i[first], site_j[first], dists[first]
+
+    # softmax over the neighbors of each row, the site itself has the largest weight
+    weights = np.exp(-dists / distance_decay_factor)
+    weights /= np.bincount(site_i, weights=weights, minlength=num_sites)[site_i]
+
+    # scipy copies the index arrays unless they have the same data type
+    index_dtype = np.int32 if len(site_j) < np.iinfo(np.int32).max else np.int64
+    indptr = np.zeros(num_sites + 1, dtype=index_dtype)
+    indptr[1:] = np.cumsum(np.bincount(site_i, minlength=num_sites))
+    arrays = {
+        "data": weights.astype(dtype),
+        "indices": site_j.astype(index_dtype),
+        "indptr": indptr,
+    }
+    if memmap_folder:
+        os.makedirs(memmap_folder, exist_ok=True)
+        for name, arr in arrays.items():
+            mmap = np.lib.format.open_memmap(
+                os.path.join(memmap_folder, f"distance_weights_{name}.npy"),
+                mode="w+",
+                dtype=arr.dtype,
+                shape=arr.shape,
+            )
+            mmap[:] = arr
+            arrays[name] = mmap
+
+    return csr_matrix(
+        (arrays["data"], arrays["indices"], arrays["indptr"]),
+        shape=(num_sites, num_sites),
+        copy=False,
+    )
+
+
 def plot_distance_weight_matrix(distance_weight_matrix, save_folder="."):
     # Define colors
     colors = ["b", "g", "r", "c", "m", "y", "k"]
@@ -202,11 +533,15 @@ def plot_distance_weight_matrix(distance_weight_matrix, save_folder="."):
     # Create a larger plot
     plt.figure(figsize=(10, 7))
 
-    # Display the distance weight matrix as an image
-    plt.imshow(distance_weight_matrix, cmap="hot", interpolation="nearest")
+    if issparse(distance_weight_matrix):
+        # only show the nonzero weights to avoid a dense copy
+        plt.spy(distance_weight_matrix, markersize=1)
+    else:
+        # Display the distance weight matrix as an image
+        plt.imshow(distance_weight_matrix, cmap="hot", interpolation="nearest")
 
-    # Add a colorbar to the figure to show how colors correspond to values
-    plt.colorbar()
+        # Add a colorbar to the figure to show how colors correspond to values
+        plt.colorbar()
 
     plt.xlabel("Dimension 1", fontsize=14)
     plt.ylabel("Dimension 2", fontsize=14)
@@ -0,0 +1,76 @@
+import random
+
+import numpy as np
+import pytest
+from ase.build import fcc100
+from ase.calculators.emt import EMT
+
+from mcmc import MCMC
+
+# lateral offsets of the adsorption sites from the top layer atoms of a Cu(100) slab
+SITE_OFFSETS = {"top": [0.0, 0.0], "hollow": [1.276, 1.276]}
+
+
+@pytest.fixture
+def cu_surface():
+    """Factory of Cu(100) slabs and the adsorption sites above their top layer atoms."""
+
+    def make_surface(size=(2, 2, 2), site="hollow", height=1.6):
+        slab = fcc100("Cu", size=size, vacuum=10.0)
+        top_layer = slab.positions[:, 2] > slab.positions[:, 2].max() - 0.1
+        coords = slab.positions[top_layer] + [*SITE_OFFSETS[site], height]
+        return slab, coords
+
+    return make_surface
+
+
+@pytest.fixture
+def cu_adatom_slab(cu_surface):
+    """Factory of Cu(100) slabs with a Cu adatom on one of the adsorption sites."""
+
+    def make_adatom_slab(size=(3, 3, 2), site_idx=0, site="hollow", height=1.6):
+        slab, coords = cu_surface(size=size, site=site, height=height)
+        slab.append("Cu")
+        slab.positions[-1] = coords[site_idx]
+        return slab
+
+    return make_adatom_slab
+
+
+@pytest.fixture
+def cu_mcmc(cu_surface, tmp_path):
+    """Factory of seeded MCMC chains of adsorbates on a Cu(100) slab with EMT. It returns the chain
+    and the arguments of `prepare_run` or `mcmc_run`, by default three sweeps of four moves in
+    `tmp_path`, which are updated with `run_kwargs`."""
+
+    def make_mcmc(
+        size=(2, 2, 2),
+        site="hollow",
+        height=1.6,
+        adsorbates=("Cu",),
+        calc=None,
+        run_kwargs=None,
+        **kwargs,
+    ):
+        random.seed(0)
+        np.random.seed(0)
+        slab, coords = cu_surface(size=size, site=site, height=height)
+        mcmc = MCMC(
+            calc=calc if calc is not None else EMT(),
+            element="Cu",
+            adsorbates=list(adsorbates),
+            ads_coords=coords,
+            **kwargs,
+        )
+        run_kwargs = {
+            "total_sweeps": 3,
+            "sweep_size": 4,
+            "start_temp": 1.0,
+            "pot": [-3.0],
+            "slab": slab,
+            "run_folder": str(tmp_path),
+            **(run_kwargs or {}),
+        }
+        return mcmc, run_kwargs
+
+    return make_mcmc
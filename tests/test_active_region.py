@@ -0,0 +1,31 @@
+import numpy as np
+from ase.calculators.emt import EMT
+
+from mcmc.energy import get_active_region_commands, optimize_slab
+
+
+def test_active_region_commands():
+    active_mask = np.array([False, False, False, True, False, True, True, False])
+    commands, undo_commands = get_active_region_commands(active_mask)
+
+    assert commands[0] == "group mc_frozen id 1:3 5 8"
+    assert commands[1].startswith("fix mc_frozen mc_frozen setforce")
+    assert undo_commands == ["unfix mc_frozen", "group mc_frozen delete"]
+    assert get_active_region_commands(np.ones(3, dtype=bool)) == ([], [])
+
+
+def test_active_region_relaxation(cu_adatom_slab):
+    slab = cu_adatom_slab(size=(6, 6, 3), site="top", height=1.8)
+    site = slab.positions[-1].copy()
+    slab.calc = EMT()
+
+    relaxed_slab, _ = optimize_slab(
+        slab, active_centers=[site], active_region_radius=4.0, relax_steps=5
+    )
+
+    moved = np.linalg.norm(relaxed_slab.positions - slab.positions, axis=1) > 1e-8
+    dists = slab.get_distances(len(slab) - 1, range(len(slab)), mic=True)
+    assert np.any(moved)
+    # the site is at a cell corner, so the region wraps around the cell
+    assert np.all(dists[moved] <= 4.0)
+    assert np.all(~moved[dists > 4.0])
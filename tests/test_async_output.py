@@ -0,0 +1,76 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from mcmc.store import read_trajectory
+from mcmc.utils import AsyncWriter
+
+
+def test_async_writer():
+    writer = AsyncWriter(max_queue_size=1)
+    started = threading.Event()
+    release = threading.Event()
+    done = []
+
+    def task(i):
+        started.set()
+        release.wait()
+        done.append(i)
+
+    writer.submit(task, 0)
+    started.wait()
+    writer.submit(task, 1)
+    # the queue is full, so a third task waits for the writer
+    blocked = threading.Thread(target=writer.submit, args=(task, 2))
+    blocked.start()
+    blocked.join(timeout=0.1)
+    assert blocked.is_alive()
+
+    release.set()
+    blocked.join()
+    writer.flush()
+    assert done == [0, 1, 2]
+
+    writer.submit(lambda: 1 / 0)
+    with pytest.raises(RuntimeError):
+        writer.flush()
+    writer.close()
+    with pytest.raises(RuntimeError):
+        writer.submit(task, 3)
+
+
+def run_chain(cu_mcmc, run_folder, **kwargs):
+    mcmc, run_kwargs = cu_mcmc(
+        save_cif=True, run_kwargs={"run_folder": str(run_folder)}, **kwargs
+    )
+    mcmc.mcmc_run(**run_kwargs)
+    return mcmc
+
+
+@pytest.mark.parametrize("trajectory_store", [False, True])
+def test_async_output(cu_mcmc, trajectory_store, tmp_path):
+    run_chain(cu_mcmc, tmp_path / "sync", trajectory_store=trajectory_store)
+    mcmc = run_chain(
+        cu_mcmc,
+        tmp_path / "async",
+        trajectory_store=trajectory_store,
+        async_output=True,
+        output_queue_size=2,
+    )
+    assert mcmc.writer is None
+
+    assert sorted(os.listdir(tmp_path / "async")) == sorted(
+        os.listdir(tmp_path / "sync")
+    )
+    if trajectory_store:
+        for kind in ("sweeps", "proposals"):
+            sync_frames = read_trajectory(tmp_path / "sync" / "trajectory.h5", kind)
+            async_frames = read_trajectory(tmp_path / "async" / "trajectory.h5", kind)
+            for sync_atoms, async_atoms in zip(sync_frames, async_frames):
+                assert np.allclose(async_atoms.positions, sync_atoms.positions)
+                assert np.array_equal(
+                    async_atoms.info.pop("state"), sync_atoms.info.pop("state")
+                )
+                assert async_atoms.info == pytest.approx(sync_atoms.info)
@@ -0,0 +1,89 @@
+import logging
+
+import numpy as np
+import pytest
+import torch
+from nff.io.ase import AtomsBatch, EnsembleNFF, NeuralFF
+
+from mcmc.energy import slab_energy, slab_energy_batch
+
+
+class PairModel(torch.nn.Module):
+    """Pair potential with the interface of an NFF model, energies in kcal/mol."""
+
+    def __init__(self, strength=1.0):
+        super().__init__()
+        self.strength = strength
+        self.num_calls = 0
+
+    def forward(self, batch, scale=1.0, **kwargs):
+        self.num_calls += 1
+        xyz = batch["nxyz"][:, 1:].clone().requires_grad_(True)
+        nbr_list = batch["nbr_list"]
+        offsets = batch["offsets"]
+        if offsets.is_sparse:
+            offsets = offsets.to_dense()
+        r = (xyz[nbr_list[:, 1]] - xyz[nbr_list[:, 0]] + offsets).norm(dim=1)
+        pair_energy = scale * self.strength * torch.exp(-r)
+        atom_energy = torch.zeros(len(xyz)).index_add(0, nbr_list[:, 0], pair_energy)
+        energy = torch.stack(
+            [e.sum() for e in atom_energy.split(batch["num_atoms"].tolist())]
+        )
+        energy_grad = torch.autograd.grad(energy.sum(), xyz)[0]
+        return {"energy": energy.detach(), "energy_grad": energy_grad}
+
+
+@pytest.fixture
+def adatom_slabs(cu_adatom_slab):
+    slabs = []
+    for size, site_idx in [((2, 2, 2), 0), ((2, 2, 2), 2), ((3, 3, 2), 4)]:
+        slab = cu_adatom_slab(size=size, site_idx=site_idx)
+        slab.pbc = True
+        slabs.append(AtomsBatch(slab, cutoff=5.0, device="cpu"))
+    return slabs
+
+
+@pytest.mark.parametrize(
+    "calc",
+    [
+        NeuralFF(PairModel(), device="cpu", model_kwargs={"scale": 2.0}),
+        EnsembleNFF([PairModel(1.0), PairModel(1.5)], device="cpu"),
+    ],
+)
+def test_slab_energy_batch(adatom_slabs, calc):
+    expected = []
+    for slab in adatom_slabs:
+        slab.calc = calc
+        expected.append(slab_energy(slab)[:4])
+
+    results = slab_energy_batch(adatom_slabs)
+    for k, slab_results in enumerate(expected):
+        assert [r[k] for r in results] == pytest.approx(list(slab_results))
+
+
+@pytest.mark.parametrize("canonical", [False, True])
+def test_mcmc_batch_proposals(cu_mcmc, caplog, canonical):
+    caplog.set_level(logging.DEBUG, logger="mcmc.mcmc")
+    model = PairModel()
+    mcmc, run_kwargs = cu_mcmc(
+        calc=NeuralFF(model, device="cpu"),
+        canonical=canonical,
+        num_ads_atoms=2 if canonical else 0,
+        batch_proposals=4,
+        run_kwargs={"sweep_size": 8, "start_temp": 0.1, "pot": [0.0]},
+    )
+    run_kwargs["slab"].pbc = True
+    run_kwargs["slab"] = AtomsBatch(run_kwargs["slab"], cutoff=5.0, device="cpu")
+    mcmc.mcmc_run(**run_kwargs)
+
+    # all proposals of the sweeps are evaluated in batches
+    num_prefetched = caplog.messages.count("using prefetched energy")
+    assert num_prefetched >= 3 * 8
+    if not canonical:
+        # swaps of symmetric sites are always accepted, which discards the rest of the batch
+        assert model.num_calls < num_prefetched
+    assert not mcmc.pending_proposals
+    # the accepted energies are those of the slabs they were accepted for
+    assert mcmc.curr_energy == pytest.approx(slab_energy(mcmc.slab)[0])
+    if canonical:
+        assert np.count_nonzero(mcmc.state) == 2
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from ase.calculators.emt import EMT
+from ase.constraints import FixAtoms
+from ase.optimize import FIRE
+
+from mcmc.energy import BatchedFIRE, get_energies_and_forces, optimize_slab_batch
+
+
+@pytest.fixture
+def adatom_slabs(cu_adatom_slab):
+    slabs = []
+    for size, site_idx in [((3, 3, 2), 0), ((3, 3, 2), 4), ((2, 2, 3), 1)]:
+        slab = cu_adatom_slab(size=size, site_idx=site_idx)
+        # freeze the bottom layer
+        slab.set_constraint(FixAtoms(mask=slab.positions[:, 2] < 10.1))
+        slab.calc = EMT()
+        slabs.append(slab)
+    return slabs
+
+
+def test_batched_fire(adatom_slabs):
+    expected_slabs = []
+    for slab in adatom_slabs:
+        expected_slab = slab.copy()
+        expected_slab.calc = EMT()
+        FIRE(expected_slab, logfile=None).run(fmax=0.01, steps=30)
+        expected_slabs.append(expected_slab)
+
+    num_calls = []
+
+    def energy_forces(slabs):
+        num_calls.append(len(slabs))
+        return get_energies_and_forces(slabs)
+
+    initial_positions = [slab.get_positions() for slab in adatom_slabs]
+    dyn = BatchedFIRE(adatom_slabs, energy_forces=energy_forces)
+    dyn.run(fmax=0.01, steps=30)
+
+    for slab, expected_slab, positions in zip(
+        adatom_slabs, expected_slabs, initial_positions
+    ):
+        assert np.allclose(slab.positions, expected_slab.positions)
+        assert slab.get_potential_energy() == pytest.approx(
+            expected_slab.get_potential_energy()
+        )
+        frozen = slab.constraints[0].index
+        assert np.allclose(slab.positions[frozen], positions[frozen])
+
+    # one call for all slabs per step
+    assert len(num_calls) == dyn.nsteps + 1
+    assert num_calls[0] == len(adatom_slabs)
+
+
+def test_optimize_slab_batch(adatom_slabs):
+    initial_positions = [slab.get_positions() for slab in adatom_slabs]
+    # only the adatom of the first slab is relaxed
+    frozen_mask = np.ones(len(adatom_slabs[0]), dtype=bool)
+    frozen_mask[-1] = False
+    relaxed_slabs, energies = optimize_slab_batch(
+        adatom_slabs,
+        relax_steps=100,
+        frozen_masks=[frozen_mask, None, None],
+    )
+
+    for slab, relaxed_slab, positions, energy in zip(
+        adatom_slabs, relaxed_slabs, initial_positions, energies
+    ):
+        assert np.allclose(slab.positions, positions)
+        assert energy == pytest.approx(relaxed_slab.get_potential_energy())
+        assert energy < slab.get_potential_energy()
+    moved = np.any(relaxed_slabs[0].positions != initial_positions[0], axis=1)
+    assert np.array_equal(moved, ~frozen_mask)
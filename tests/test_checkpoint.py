@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import pytest
+
+
+def run_chain(cu_mcmc, run_folder, preempt_sweep=None, **run_kwargs):
+    mcmc, run_kwargs = cu_mcmc(
+        checkpoint_every=1,
+        run_kwargs={
+            "total_sweeps": 4,
+            "sweep_size": 5,
+            "run_folder": str(run_folder),
+            **run_kwargs,
+        },
+    )
+    if preempt_sweep is not None:
+        mcmc_sweep = mcmc.mcmc_sweep
+
+        def preempted_sweep(i=0):
+            if i == preempt_sweep:
+                raise KeyboardInterrupt
+            mcmc_sweep(i=i)
+
+        mcmc.mcmc_sweep = preempted_sweep
+
+    results = mcmc.mcmc_run(**run_kwargs)
+    return mcmc, results
+
+
+def test_resume_from_checkpoint(cu_mcmc, tmp_path):
+    mcmc, results = run_chain(cu_mcmc, tmp_path / "full")
+    assert os.path.exists(tmp_path / "full" / "checkpoint.pkl")
+
+    # the chain is killed during the third sweep and continued in a new chain
+    with pytest.raises(KeyboardInterrupt):
+        run_chain(cu_mcmc, tmp_path / "resumed", preempt_sweep=2)
+    resumed_mcmc, resumed_results = run_chain(
+        cu_mcmc, tmp_path / "resumed", resume_from=str(tmp_path / "resumed")
+    )
+
+    assert np.array_equal(resumed_mcmc.state, mcmc.state)
+    assert resumed_results[1] == pytest.approx(results[1])
+    assert resumed_results[2] == pytest.approx(results[2])
+    assert len(resumed_results[0]) == len(results[0])
+
+
+def test_wall_time(cu_mcmc, tmp_path):
+    _, results = run_chain(cu_mcmc, tmp_path, wall_time=0.0)
+    assert len(results[0]) == 0
+    assert os.path.exists(tmp_path / "checkpoint.pkl")
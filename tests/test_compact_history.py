@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from mcmc.store import CompactHistory
+
+
+def run_chain(cu_mcmc, run_folder, **kwargs):
+    mcmc, run_kwargs = cu_mcmc(run_kwargs={"run_folder": str(run_folder)}, **kwargs)
+    return mcmc.mcmc_run(**run_kwargs)
+
+
+def test_compact_history_round_trip(cu_surface):
+    slab, coords = cu_surface(site="top", height=2.0)
+    history = CompactHistory(slab, coords)
+
+    adsorbed = slab.copy()
+    adsorbed.append("O")
+    adsorbed.positions[-1] = coords[2]
+    relaxed_positions = adsorbed.get_positions()
+    relaxed_positions[-1] += [0.1, -0.2, 0.3]
+    for _ in range(3):
+        history.append(adsorbed, [0, 0, len(slab), 0], positions=relaxed_positions)
+    history.append(slab, [0, 0, 0, 0], energy=-1.0)
+
+    assert len(history) == 4
+    atoms = history[0]
+    assert np.allclose(atoms.positions, relaxed_positions, atol=1e-6)
+    assert np.array_equal(atoms.numbers, adsorbed.numbers)
+    assert np.allclose(atoms.cell, slab.cell)
+    assert np.isnan(atoms.info["energy"])
+    assert len(history[-1]) == len(slab)
+    assert history[-1].info["energy"] == -1.0
+    assert len(history[1:]) == 3
+    with pytest.raises(IndexError):
+        history[4]
+
+
+def test_mcmc_compact_history(cu_mcmc, tmp_path):
+    history, energy_hist, _, ads_count_hist, _ = run_chain(cu_mcmc, tmp_path / "full")
+    compact_history, compact_energy_hist, _, compact_ads_count_hist, _ = run_chain(
+        cu_mcmc, tmp_path / "compact", compact_history=True
+    )
+
+    assert isinstance(compact_history, CompactHistory)
+    assert np.allclose(compact_energy_hist, energy_hist)
+    assert len(compact_history) == len(history)
+    for atoms, compact_atoms in zip(history, compact_history):
+        assert np.allclose(compact_atoms.positions, atoms.positions)
+        assert np.array_equal(compact_atoms.numbers, atoms.numbers)
+    for key, counts in ads_count_hist.items():
+        assert compact_ads_count_hist[key].tolist() == counts
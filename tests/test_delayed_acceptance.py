@@ -0,0 +1,23 @@
+import pytest
+
+
+@pytest.mark.parametrize("screening", ["unrelaxed", "eam"])
+def test_screening_energy(screening, cu_mcmc):
+    mcmc, run_kwargs = cu_mcmc(
+        screening=screening, run_kwargs={"total_sweeps": 1, "sweep_size": 1}
+    )
+    mcmc.prepare_run(**run_kwargs)
+    num_accept = 0
+    for i in range(20):
+        mcmc.curr_energy, accept = mcmc.change_site(
+            prev_energy=mcmc.curr_energy, iter=i + 1
+        )
+        num_accept += accept
+        # the screening energy follows the accepted state
+        assert mcmc.screening_energy == pytest.approx(mcmc.compute_screening_energy())
+        assert mcmc.curr_energy == pytest.approx(mcmc.compute_energy()[0])
+
+    if screening == "unrelaxed":
+        # without relaxation the screening energy is exact
+        assert num_accept > 0
+        assert mcmc.num_screened_out == 20 - num_accept
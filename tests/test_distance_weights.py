@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from ase import Atoms
+
+from mcmc.slab import get_complementary_idx
+from mcmc.utils import compute_distance_weight_matrix, compute_sparse_distance_weights
+
+
+@pytest.fixture
+def site_grid():
+    x, y = np.meshgrid(np.arange(5) * 2.0, np.arange(5) * 2.0)
+    coords = np.stack([x.ravel(), y.ravel(), np.full(25, 5.0)], axis=1)
+    slab = Atoms("Cu", positions=[[0.0, 0.0, 3.0]], cell=[10.0, 10.0, 20.0])
+    return slab, coords
+
+
+def test_matches_dense_without_pbc(site_grid):
+    slab, coords = site_grid
+    slab.pbc = False
+    weights = compute_sparse_distance_weights(slab, coords, 1.0, cutoff=20.0)
+    assert np.allclose(weights.toarray(), compute_distance_weight_matrix(coords, 1.0))
+
+
+def test_minimum_image_and_cutoff(site_grid, tmp_path):
+    slab, coords = site_grid
+    slab.pbc = [True, True, False]
+    weights = compute_sparse_distance_weights(
+        slab, coords, 1.0, cutoff=2.5, dtype=np.float32, memmap_folder=tmp_path
+    )
+    assert weights.dtype == np.float32
+    assert np.allclose(weights.sum(axis=1), 1.0)
+    # every site has itself and 4 neighbors, also across the cell edges
+    assert np.all(np.diff(weights.indptr) == 5)
+    assert weights[0, 4] == pytest.approx(weights[0, 1])
+    assert (tmp_path / "distance_weights_data.npy").exists()
+
+
+def test_sample_from_sparse_weights(site_grid):
+    slab, coords = site_grid
+    slab.pbc = [True, True, False]
+    weights = compute_sparse_distance_weights(slab, coords, 1.0, cutoff=2.5)
+
+    slab = slab.copy()
+    state = np.zeros(len(coords), dtype=int)
+    for site in (0, 12):
+        slab.append("O")
+        slab.positions[-1] = coords[site]
+        state[site] = len(slab) - 1
+
+    for _ in range(20):
+        site1_idx, site2_idx, type1, type2 = get_complementary_idx(
+            state,
+            slab,
+            require_distance_decay=True,
+            distance_weight_matrix=weights,
+        )
+        assert type1 != type2
+        assert (state[site1_idx] > 0) == (type1 != "None")
+        assert (state[site2_idx] > 0) == (type2 != "None")
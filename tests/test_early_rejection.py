@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from ase.calculators.emt import EMT
+
+from mcmc.energy import optimize_slab
+
+
+class CountingEMT(EMT):
+    """EMT calculator that counts its calculations, one per optimizer step."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.num_calls = 0
+
+    def calculate(self, *args, **kwargs):
+        self.num_calls += 1
+        super().calculate(*args, **kwargs)
+
+
+@pytest.fixture
+def adatom_slab(cu_adatom_slab):
+    slab = cu_adatom_slab()
+    slab.calc = CountingEMT()
+    return slab
+
+
+def test_energy_ceiling(adatom_slab):
+    relax_steps = 50
+    relaxed_slab, _ = optimize_slab(adatom_slab, relax_steps=relax_steps)
+    relaxed_energy = relaxed_slab.get_potential_energy()
+    num_steps = adatom_slab.calc.num_calls
+
+    # a ceiling above the relaxed energy doesn't cut the relaxation short
+    adatom_slab.calc.num_calls = 0
+    high_slab, _ = optimize_slab(
+        adatom_slab, relax_steps=relax_steps, energy_ceiling=relaxed_energy + 1.0
+    )
+    assert adatom_slab.calc.num_calls == num_steps
+    assert np.allclose(high_slab.positions, relaxed_slab.positions)
+
+    # a proposal that can't get below the ceiling is stopped early
+    adatom_slab.calc.num_calls = 0
+    low_slab, _ = optimize_slab(
+        adatom_slab, relax_steps=relax_steps, energy_ceiling=relaxed_energy - 1.0
+    )
+    assert adatom_slab.calc.num_calls < min(num_steps, relax_steps)
+    assert low_slab.get_potential_energy() > relaxed_energy - 1.0
+    assert not np.allclose(low_slab.positions, relaxed_slab.positions)
@@ -0,0 +1,40 @@
+import numpy as np
+
+from mcmc.energy import EnergyCache
+from mcmc.slab import get_site_permutations
+
+
+def test_lru_eviction():
+    cache = EnergyCache(maxsize=2)
+    keys = [cache.get_key(np.array(occ)) for occ in ([1, 0], [0, 1], [1, 1])]
+    cache.put(keys[0], (-1.0,))
+    cache.put(keys[1], (-2.0,))
+    assert cache.get(keys[0]) == (-1.0,)
+
+    # least recently used entry is evicted
+    cache.put(keys[2], (-3.0,))
+    assert len(cache) == 2
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == (-1.0,)
+    assert cache.hits == 2
+    assert cache.misses == 1
+
+
+def test_symmetric_occupancies_share_key(cu_surface):
+    slab, coords = cu_surface(size=(3, 3, 2), site="top", height=1.8)
+    perms = get_site_permutations(slab, coords)
+    assert perms.shape[1] == len(coords)
+
+    cache = EnergyCache(site_permutations=perms)
+    occ1 = np.zeros(len(coords), dtype=np.uint8)
+    occ2 = np.zeros(len(coords), dtype=np.uint8)
+    occ1[0] = 8
+    occ2[4] = 8
+    assert cache.get_key(occ1) == cache.get_key(occ2)
+
+    occ3 = occ1.copy()
+    occ3[1] = 8
+    assert cache.get_key(occ1) != cache.get_key(occ3)
+
+    # without symmetry only identical occupancies share a key
+    assert EnergyCache().get_key(occ1) != EnergyCache().get_key(occ2)
@@ -1,10 +1,11 @@
 import os
 import pickle as pkl
 
+import numpy as np
 import pytest
 from ase.io import read
 
-from mcmc.utils import filter_distances
+from mcmc.utils import filter_distances, filter_site_distances, get_site_conflicts
 
 current_dir = os.path.dirname(__file__)
 
@@ -15,6 +16,7 @@ element = "O"
 ase_bridge = [1.96777, 1.99250, 18.59954]
 ase_top1 = [5.90331, 0.14832, 19.49200]
 ase_top2 = [1.96777, 4.13332, 19.49200]
+ase_top1_shifted = [6.90331, 0.14832, 19.49200]
 
 
 # test_fixtures
@@ -76,3 +78,31 @@ def test_cell_distance_failed():
     )
 
     assert filter_distances(test_slab, ads=[element], cutoff_distance=1.5) == False
+
+
+@pytest.mark.parametrize(
+    "occupied_sites,expected",
+    [([0], False), ([1], True), ([1, 2], True), ([1, 0], False), ([1, 3], False)],
+)
+def test_site_conflicts(pristine_slab, occupied_sites, expected):
+    ads_coords = [ase_bridge, ase_top1, ase_top2, ase_top1_shifted]
+    site_conflicts, substrate_blocked = get_site_conflicts(
+        pristine_slab, ads_coords, ads=[element], cutoff_distance=1.5
+    )
+
+    test_slab = pristine_slab.copy()  # starting with a pristine slab
+    state = [0, 0, 0, 0]
+    for site in occupied_sites:
+        test_slab.append(element)
+        test_slab.positions[-1] = ads_coords[site]
+        state[site] = len(test_slab) - 1
+
+    # only the last adsorbed site changed
+    result = filter_site_distances(
+        np.array(state),
+        site_conflicts,
+        occupied_sites[-1:],
+        substrate_blocked=substrate_blocked,
+    )
+    assert result == expected
+    assert result == filter_distances(test_slab, ads=[element], cutoff_distance=1.5)
@@ -0,0 +1,78 @@
+import glob
+import os
+import pickle as pkl
+
+import numpy as np
+import pytest
+from ase.calculators.emt import EMT
+from ase.io import read
+
+from mcmc.energy import GhostSlotCalculator
+from mcmc.slab import add_ghost_slots, change_site, remove_ghost_slots
+
+
+@pytest.fixture
+def ghost_slab(cu_surface):
+    slab, coords = cu_surface(site="top", height=1.8)
+    state = np.zeros(len(coords), dtype=int)
+    slab, state, _, _, _ = change_site(
+        slab, state, [0.0], ["O"], coords, 1, end_ads="O"
+    )
+    state, slab, slots = add_ghost_slots(slab, state, coords)
+    return slab, state, slots, coords
+
+
+def test_add_ghost_slots(ghost_slab):
+    slab, state, slots, coords = ghost_slab
+    assert len(slab) == 8 + len(coords)
+    assert np.array_equal(state, [0, slots[1], 0, 0])
+    assert slab.get_chemical_symbols()[8:] == ["X", "O", "X", "X"]
+
+
+def test_change_site_keeps_atoms(ghost_slab):
+    slab, state, slots, coords = ghost_slab
+    slab, state, _, _, _ = change_site(
+        slab, state, [0.0], ["O"], coords, 1, end_ads="None", slots=slots
+    )
+    slab, state, _, _, _ = change_site(
+        slab, state, [0.0], ["O"], coords, 3, end_ads="O", slots=slots
+    )
+    assert len(slab) == 8 + len(coords)
+    assert np.array_equal(state, [0, 0, 0, slots[3]])
+    assert np.allclose(slab.positions[slots[3]], coords[3])
+    assert remove_ghost_slots(slab).get_chemical_formula() == "Cu8O"
+
+
+def test_ghost_slot_calculator(ghost_slab):
+    slab, _, slots, _ = ghost_slab
+    slab.calc = GhostSlotCalculator(EMT())
+    occupied_slab = remove_ghost_slots(slab)
+    occupied_slab.calc = EMT()
+
+    assert np.isclose(slab.get_potential_energy(), occupied_slab.get_potential_energy())
+    forces = slab.get_forces()
+    assert np.allclose(forces[slab.numbers > 0], occupied_slab.get_forces())
+    assert np.allclose(forces[slots[[0, 2, 3]]], 0.0)
+
+
+def test_mcmc_saved_slabs(cu_mcmc, tmp_path):
+    mcmc, run_kwargs = cu_mcmc(
+        fixed_capacity=True,
+        run_kwargs={"total_sweeps": 2, "sweep_size": 2, "pot": [0.0]},
+    )
+    slab = run_kwargs["slab"].copy()
+    mcmc.mcmc_run(**run_kwargs)
+    # some slots are still empty
+    assert np.any(mcmc.slab.numbers == 0)
+
+    paths = sorted(glob.glob(str(tmp_path / "final_slab_run_*")))
+    assert len(paths) == 2 * 2
+    for path in paths:
+        assert "X" not in os.path.basename(path)
+        if path.endswith(".pkl"):
+            with open(path, "rb") as f:
+                saved_slab = pkl.load(f)
+        else:
+            saved_slab = read(path)
+        assert np.all(saved_slab.numbers > 0)
+        assert len(saved_slab) == len(slab) + np.count_nonzero(mcmc.state)
@@ -0,0 +1,121 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from mcmc.energy import (
+    _lammps_sessions,
+    close_lammps_sessions,
+    get_lammps_session,
+    run_lammps_calc,
+)
+
+POTENTIAL_DIR = os.path.join(os.path.dirname(__file__), "..", "mcmc", "potentials")
+
+TEMPLATE = """clear
+atom_style atomic
+units metal
+boundary p p p
+atom_modify sort 0 0.0
+
+read_data {}
+
+group bulk id <= {}
+
+pair_style eam/fs
+pair_coeff * * {} {}
+mass 1 63.546
+
+reset_timestep 0
+fix 2 bulk setforce 0.0 0.0 0.0
+thermo_style custom step pe
+compute pe_per_atom all pe/atom
+"""
+ENERGY_RUN = """# no minimization, at most {} steps
+run 0
+
+write_data {}
+"""
+OPT_RUN = """min_style cg
+minimize 1e-8 1e-8 {} 10000
+
+write_data {}
+"""
+
+
+@pytest.fixture
+def lammps_dir(tmp_path, monkeypatch):
+    """Folder with a LAMMPS config and Cu EAM templates, which is the working directory."""
+    config = {
+        "potential_file": os.path.abspath(os.path.join(POTENTIAL_DIR, "Cu2.eam.fs")),
+        "atoms": ["Cu"],
+        "atomic_numbers_dict": {"1": 29},
+        "bulk_index": 8,
+    }
+    with open(tmp_path / "lammps_config.json", "w") as f:
+        json.dump(config, f)
+    (tmp_path / "energy_template.txt").write_text(TEMPLATE + ENERGY_RUN)
+    # "opt" in the template tells run_lammps_calc not to read per atom energies
+    (tmp_path / "opt_template.txt").write_text("# lammps opt\n" + TEMPLATE + OPT_RUN)
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    close_lammps_sessions()
+
+
+@pytest.fixture
+def adatom_slabs(cu_adatom_slab):
+    slabs = [cu_adatom_slab(size=(2, 2, 3), site_idx=site_idx) for site_idx in range(2)]
+    for slab in slabs:
+        slab.pbc = True
+    # one more atom, so the session has to replace all atoms
+    slabs[1].append("Cu")
+    slabs[1].positions[-1] = slabs[1].positions[-2] + [2.552, 0.0, 0.0]
+    return slabs
+
+
+@pytest.mark.parametrize("template", ["energy_template.txt", "opt_template.txt"])
+def test_session_matches_files(lammps_dir, adatom_slabs, template):
+    template = str(lammps_dir / template)
+    for slab in adatom_slabs:
+        energy, pe_per_atom, new_slab = run_lammps_calc(
+            slab, main_dir=str(lammps_dir), lammps_template=template, relax_steps=50
+        )
+        session_energy, session_pe_per_atom, session_slab = run_lammps_calc(
+            slab,
+            main_dir=str(lammps_dir),
+            lammps_template=template,
+            relax_steps=50,
+            persistent_lammps=True,
+        )
+
+        assert session_energy == pytest.approx(energy)
+        assert np.allclose(session_pe_per_atom, pe_per_atom)
+        assert np.array_equal(session_slab.numbers, new_slab.numbers)
+        assert np.allclose(
+            session_slab.get_positions(wrap=True),
+            new_slab.get_positions(wrap=True),
+            atol=1e-6,
+        )
+        if "opt" in template:
+            # the adatoms relax
+            assert not np.allclose(
+                new_slab.get_positions(wrap=True), slab.get_positions(wrap=True)
+            )
+    assert len(_lammps_sessions) == 1
+
+
+def test_session_key(lammps_dir):
+    template = str(lammps_dir / "energy_template.txt")
+    session = get_lammps_session(template, main_dir=str(lammps_dir))
+    assert get_lammps_session(template, main_dir=str(lammps_dir)) is session
+
+    # another potential in the same process gets its own session
+    with open(lammps_dir / "lammps_config.json") as f:
+        config = json.load(f)
+    config["bulk_index"] = 4
+    with open(lammps_dir / "lammps_config.json", "w") as f:
+        json.dump(config, f)
+    other_session = get_lammps_session(template, main_dir=str(lammps_dir))
+    assert other_session is not session
+    assert other_session.config["bulk_index"] == 4
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from ase.calculators.emt import EMT
+from ase.constraints import FixAtoms
+
+from mcmc.energy import get_local_region, local_slab_energy, slab_energy
+
+
+@pytest.fixture
+def slab_and_site(cu_surface):
+    slab, coords = cu_surface(size=(8, 8, 3), site="top", height=1.8)
+    slab.calc = EMT()
+    return slab, coords[0]
+
+
+def test_local_region(slab_and_site):
+    slab, site = slab_and_site
+    region, in_region = get_local_region(slab, site, 4.0, buffer=3.0)
+
+    assert len(region) == np.count_nonzero(in_region)
+    dists = np.linalg.norm(region.positions - region.cell.lengths() / 2, axis=1)
+    # the site is at a cell corner, so minimum images are needed
+    assert np.all(dists <= 7.0)
+    assert np.array_equal(region.constraints[0].index, np.flatnonzero(dists > 4.0))
+
+
+def test_local_region_keeps_fixed_atoms(slab_and_site):
+    slab, site = slab_and_site
+    bulk = slab.positions[:, 2] < slab.positions[:, 2].max() - 0.1
+    slab.set_constraint(FixAtoms(mask=bulk))
+    region, in_region = get_local_region(slab, site, 5.0, buffer=3.0)
+
+    dists = np.linalg.norm(region.positions - region.cell.lengths() / 2, axis=1)
+    fixed = np.flatnonzero((dists > 5.0) | bulk[in_region])
+    assert np.array_equal(region.constraints[0].index, fixed)
+    # some bulk atoms are within the radius
+    assert np.any(bulk[in_region] & (dists <= 5.0))
+
+
+def test_local_energy_difference(slab_and_site):
+    slab, site = slab_and_site
+    new_slab = slab.copy()
+    new_slab.append("Cu")
+    new_slab.positions[-1] = site
+    new_slab.calc = EMT()
+
+    full_diff = slab_energy(new_slab)[0] - slab_energy(slab)[0]
+    local_diff = (
+        local_slab_energy(new_slab, site, 4.0, buffer=6.0)[0]
+        - local_slab_energy(slab, site, 4.0, buffer=6.0)[0]
+    )
+    assert local_diff == pytest.approx(full_diff, abs=1e-4)
@@ -0,0 +1,49 @@
+import numpy as np
+from ase.build import fcc111
+from ase.neighborlist import primitive_neighbor_list
+from nff.io.ase import AtomsBatch
+
+from mcmc.energy import SkinNeighborList
+
+
+def get_pairs(slab, pairs, shifts, cutoff):
+    """Pairs of a neighbor list that are within the cutoff."""
+    vectors = (
+        slab.positions[pairs[:, 1]] - slab.positions[pairs[:, 0]] + shifts @ slab.cell
+    )
+    within = np.linalg.norm(vectors, axis=1) < cutoff
+    return {
+        (i, j, tuple(shift)) for (i, j), shift in zip(pairs[within], shifts[within])
+    }
+
+
+def test_skin_neighbor_list():
+    rng = np.random.default_rng(0)
+    cutoff = 5.0
+    pristine = fcc111("Cu", size=(3, 3, 3), vacuum=8.0, periodic=True)
+    slab = AtomsBatch(pristine, cutoff=cutoff, device="cpu")
+    neighbor_list = SkinNeighborList(skin=1.0)
+
+    for _ in range(50):
+        # add or remove adsorbates and jiggle the atoms like MC moves and relaxations
+        move = rng.integers(3)
+        if move == 0:
+            slab.append("Cu")
+            slab.positions[-1] = slab.positions[rng.integers(9)] + [0.0, 0.0, 2.1]
+        elif move == 1 and len(slab) > len(pristine):
+            del slab[int(rng.integers(len(pristine), len(slab)))]
+        else:
+            slab.positions += rng.normal(0.0, 0.05, slab.positions.shape)
+        neighbor_list.update(slab)
+
+        i, j, shifts = primitive_neighbor_list(
+            "ijS", slab.pbc, slab.cell, slab.positions, cutoff
+        )
+        expected = get_pairs(slab, np.stack([i, j], axis=1), shifts, cutoff)
+        assert (
+            get_pairs(slab, neighbor_list.pairs, neighbor_list.shifts, cutoff)
+            == expected
+        )
+        assert len(slab.nbr_list) == len(neighbor_list.pairs)
+
+    assert neighbor_list.num_patches > neighbor_list.num_builds
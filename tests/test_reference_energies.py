@@ -0,0 +1,128 @@
+import json
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from mcmc.energy import HARTREE_TO_EV, get_offset_energy, load_reference_energies
+from mcmc.slab import change_site
+
+offset_data = {
+    "bulk_energies": {"Cu": -0.1, "O": -0.3, "H": -0.02, "CuO": -0.5},
+    "stoidict": {"Cu": -0.2, "O": -0.35, "H": -0.01, "offset": 0.05},
+    "stoics": {"Cu": 1, "O": 1, "H": 2},
+    "ref_formula": "CuO",
+    "ref_element": "Cu",
+}
+
+
+@pytest.fixture
+def offset_data_path(tmp_path):
+    path = tmp_path / "offset_data.json"
+    path.write_text(json.dumps(offset_data))
+    return str(path)
+
+
+@pytest.fixture
+def sites(cu_surface):
+    return cu_surface(site="top", height=1.8)
+
+
+def get_pot(slab, ads_pot_dict, present):
+    # chemical potential energy as computed from the offset data directly
+    ad = Counter(slab.get_chemical_symbols())
+    stoics = offset_data["stoics"]
+    return sum(
+        (ad[ele] - stoics[ele] / stoics["Cu"] * ad["Cu"]) * ads_pot_dict[ele]
+        for ele in present
+        if ele != "Cu"
+    )
+
+
+def test_offset_energy(sites, offset_data_path):
+    slab, _ = sites
+    slab.append("H")
+    slab.append("O")
+
+    stoidict = offset_data["stoidict"]
+    bulk_energies = offset_data["bulk_energies"]
+    ad = Counter(slab.get_chemical_symbols())
+    ref_en = sum(num * stoidict[ele] for ele, num in ad.items()) + stoidict["offset"]
+    bulk_ref_en = ad["Cu"] * bulk_energies["CuO"]
+    bulk_ref_en += (ad["O"] - ad["Cu"]) * bulk_energies["O"]
+    bulk_ref_en += (ad["H"] - 2 * ad["Cu"]) * bulk_energies["H"]
+
+    assert get_offset_energy(slab, offset_data_path) == pytest.approx(
+        (ref_en - bulk_ref_en) * HARTREE_TO_EV
+    )
+
+
+def test_delta_pot_from_composition(sites, offset_data_path):
+    slab, coords = sites
+    adsorbates = ["O", "H"]
+    pots = [-0.5, 0.2]
+    ads_pot_dict = dict(zip(adsorbates, pots))
+    reference_energies = load_reference_energies(offset_data_path)
+    composition = reference_energies.get_composition(slab)
+    state = np.zeros(len(coords), dtype=int)
+
+    moves = [(0, "O"), (1, "H"), (0, "H"), (1, "None"), (2, "O")]
+    for site_idx, end_ads in moves:
+        present = set(slab.get_chemical_symbols())
+        old_pot = get_pot(slab, ads_pot_dict, present)
+        slab, state, delta_pot, _, _ = change_site(
+            slab,
+            state,
+            pots,
+            adsorbates,
+            coords,
+            site_idx,
+            end_ads=end_ads,
+            reference_energies=reference_energies,
+            composition=composition,
+        )
+        assert delta_pot == pytest.approx(
+            get_pot(slab, ads_pot_dict, present) - old_pot
+        )
+        assert np.array_equal(composition, reference_energies.get_composition(slab))
+
+
+def test_offset_energy_from_composition(sites, offset_data_path):
+    slab, _ = sites
+    reference_energies = load_reference_energies(offset_data_path)
+    composition = reference_energies.get_composition(slab)
+    slab.append("O")
+
+    # the composition passed by the caller is used instead of the one of the slab
+    assert get_offset_energy(
+        slab, offset_data_path, composition=composition
+    ) == pytest.approx(reference_energies.get_offset_energy(composition))
+    assert get_offset_energy(
+        slab, offset_data_path, composition=composition
+    ) != pytest.approx(get_offset_energy(slab, offset_data_path))
+
+
+@pytest.mark.parametrize("missing", ["stoidict", "stoics", "bulk_energies"])
+def test_missing_entries(sites, tmp_path, missing):
+    slab, _ = sites
+    path = tmp_path / "offset_data.json"
+    data = json.loads(json.dumps(offset_data))
+    del data[missing]["H"]
+    path.write_text(json.dumps(data))
+    reference_energies = load_reference_energies(str(path))
+
+    # elements that are not in the slab don't need entries
+    get_offset_energy(slab, str(path))
+    slab.append("H")
+    with pytest.raises(KeyError):
+        get_offset_energy(slab, str(path))
+    if missing == "stoics":
+        with pytest.raises(KeyError):
+            reference_energies.get_pot_energy(
+                reference_energies.get_composition(slab), {"H": 0.2}
+            )
+
+    # elements without any entry
+    slab.append("N")
+    with pytest.raises(KeyError):
+        reference_energies.get_composition(slab)
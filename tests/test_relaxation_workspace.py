@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from ase.calculators.emt import EMT
+
+from mcmc.energy import RelaxationWorkspace, optimize_slab
+
+
+@pytest.fixture
+def adatom_slabs(cu_adatom_slab):
+    slabs = [cu_adatom_slab(site_idx=site_idx) for site_idx in range(3)]
+    for slab in slabs:
+        slab.calc = EMT()
+    return slabs
+
+
+@pytest.mark.parametrize("optimizer", ["BFGS", "FIRE"])
+def test_workspace_relaxation(adatom_slabs, optimizer):
+    workspace = RelaxationWorkspace()
+    for slab in adatom_slabs * 2:
+        initial_positions = slab.get_positions()
+        relaxed_slab, _ = optimize_slab(slab, optimizer=optimizer, relax_steps=10)
+        workspace_slab, _ = optimize_slab(
+            slab, optimizer=optimizer, relax_steps=10, workspace=workspace
+        )
+        assert np.allclose(workspace_slab.positions, relaxed_slab.positions)
+        assert workspace_slab.get_potential_energy() == pytest.approx(
+            relaxed_slab.get_potential_energy()
+        )
+        assert np.allclose(slab.positions, initial_positions)
+
+    # one slab and one optimizer for all relaxations of the same size
+    assert workspace.num_allocations == 1
+    assert len(workspace.optimizers) == 1
+
+    detached_slab = workspace.detach(workspace_slab)
+    assert workspace.owns(workspace_slab) and not workspace.owns(detached_slab)
+    optimize_slab(adatom_slabs[0], optimizer=optimizer, workspace=workspace)
+    assert np.allclose(detached_slab.positions, relaxed_slab.positions)
+
+
+def test_mcmc_workspace(cu_mcmc, tmp_path):
+    energies = []
+    for relaxation_workspace in (False, True):
+        mcmc, run_kwargs = cu_mcmc(
+            relax=True,
+            relax_steps=5,
+            relaxation_workspace=relaxation_workspace,
+            run_kwargs={"run_folder": str(tmp_path / str(relaxation_workspace))},
+        )
+        _, energy_hist, _, _, _ = mcmc.mcmc_run(**run_kwargs)
+        energies.append(energy_hist)
+
+    assert energies[1] == pytest.approx(energies[0])
+    assert mcmc.workspace.num_allocations <= 3
+    # the slab reused at the end of the sweep is not overwritten by later relaxations
+    assert mcmc.accepted_results[1] is not None
+    assert not mcmc.workspace.owns(mcmc.accepted_results[1])
@@ -0,0 +1,218 @@
+import json
+
+import numpy as np
+import pytest
+import torch
+
+from mcmc.energy import load_reference_energies
+from mcmc.replica import ReplicaExchange, get_swap_log_prob
+from mcmc.slab import SiteSampler, change_site
+
+offset_data = {
+    "bulk_energies": {"Cu": -0.1, "O": -0.3, "CuO": -0.5},
+    "stoidict": {"Cu": -0.2, "O": -0.35, "offset": 0.05},
+    "stoics": {"Cu": 1, "O": 1},
+    "ref_formula": "CuO",
+    "ref_element": "Cu",
+}
+
+
+def get_pot_energies(num_ads, pots):
+    # chemical potential energy of the configuration of replica k with the potential of replica m
+    return np.outer(num_ads, pots)
+
+
+def test_swap_log_prob():
+    energies = [-1.0, -3.0, 0.5]
+    temps = [0.1, 0.3, 1.0]
+    pot_energies = get_pot_energies([2, 5, 1], [0.2, -0.1, 0.4])
+    for i, j in [(0, 1), (1, 2), (0, 2)]:
+        assert get_swap_log_prob(energies, temps, pot_energies, i, j) == pytest.approx(
+            get_swap_log_prob(energies, temps, pot_energies, j, i)
+        )
+
+    # replicas at the same temperature and chemical potential always exchange
+    pot_energies = get_pot_energies([2, 5, 1], [0.2, 0.2, 0.2])
+    assert get_swap_log_prob(energies, [0.5] * 3, pot_energies, 0, 1) == 0.0
+
+    # the lower energy goes to the lower temperature
+    assert get_swap_log_prob(energies, temps, pot_energies, 0, 1) > 0.0
+    assert get_swap_log_prob(energies, temps, pot_energies, 1, 2) < 0.0
+
+    # the configuration with more adsorbates goes to the higher chemical potential
+    pot_energies = get_pot_energies([4, 1], [0.1, 0.5])
+    assert get_swap_log_prob([0.0, 0.0], [1.0, 1.0], pot_energies, 0, 1) > 0.0
+    pot_energies = get_pot_energies([1, 4], [0.1, 0.5])
+    assert get_swap_log_prob([0.0, 0.0], [1.0, 1.0], pot_energies, 0, 1) < 0.0
+
+
+def test_replica_exchange_swaps(cu_mcmc, tmp_path):
+    mcmc, run_kwargs = cu_mcmc(size=(3, 3, 2))
+
+    # equal temperatures and chemical potentials, so every exchange is accepted
+    exchange = ReplicaExchange(mcmc, temps=[1.0, 1.0], pots=[[0.0], [0.0]], seed=0)
+    exchange.run_folder = str(tmp_path)
+    energies, pot_energies = exchange.start(
+        total_sweeps=1, sweep_size=4, slab=run_kwargs["slab"]
+    )
+    try:
+        for k in range(2):
+            exchange.send(k, "sweep", (0, 1.0))
+        for k in range(2):
+            energies[k], pot_energies[k] = exchange.recv(k)
+
+        configurations = []
+        for k in range(2):
+            exchange.send(k, "get_configuration")
+            configurations.append(exchange.recv(k))
+        assert not np.array_equal(
+            configurations[0]["state"], configurations[1]["state"]
+        )
+
+        energies, _ = exchange.exchange(energies.copy(), pot_energies.copy())
+        assert exchange.num_swap_accepts[0] == exchange.num_swap_attempts[0] == 1
+        for k in range(2):
+            exchange.send(k, "get_configuration")
+            swapped = exchange.recv(k)
+            expected = configurations[1 - k]
+            assert np.array_equal(swapped["state"], expected["state"])
+            assert np.allclose(swapped["slab"].positions, expected["slab"].positions)
+            assert swapped["curr_energy"] == expected["curr_energy"] == energies[k]
+
+        for k in range(2):
+            exchange.send(k, "finish")
+        for k in range(2):
+            exchange.recv(k)
+    finally:
+        exchange.terminate()
+
+
+def test_set_configuration(cu_mcmc, tmp_path):
+    offset_data_path = tmp_path / "offset_data.json"
+    offset_data_path.write_text(json.dumps(offset_data))
+
+    chains = []
+    for pot in [-5.0, 5.0]:
+        # O hollow sites at the height where the unrelaxed forces are small
+        mcmc, run_kwargs = cu_mcmc(
+            height=1.3,
+            adsorbates=["O"],
+            screening="unrelaxed",
+            use_site_sampler=True,
+            offset_data=str(offset_data_path),
+            run_kwargs={
+                "total_sweeps": 2,
+                "sweep_size": 8,
+                "start_temp": 0.5,
+                "pot": [pot],
+                "run_folder": str(tmp_path / str(pot)),
+            },
+        )
+        mcmc.prepare_run(**run_kwargs)
+        mcmc.mcmc_sweep(i=0)
+        chains.append(mcmc)
+    configurations = [mcmc.get_configuration() for mcmc in chains]
+    screening_energies = [mcmc.screening_energy for mcmc in chains]
+    assert np.count_nonzero(chains[0].state) < np.count_nonzero(chains[1].state)
+
+    for k, mcmc in enumerate(chains):
+        mcmc.set_configuration(configurations[1 - k])
+        expected = configurations[1 - k]
+        assert np.array_equal(mcmc.state, expected["state"])
+        assert mcmc.slab.calc is mcmc.calc
+        assert np.array_equal(
+            mcmc.composition, mcmc.reference_energies.get_composition(mcmc.slab)
+        )
+        assert mcmc.screening_energy == pytest.approx(screening_energies[1 - k])
+        fresh_sampler = SiteSampler(mcmc.slab, mcmc.state, mcmc.adsorbates)
+        assert np.array_equal(
+            mcmc.site_sampler.site_species, fresh_sampler.site_species
+        )
+
+        # the chain continues from the new configuration
+        mcmc.mcmc_sweep(i=1)
+        assert mcmc.curr_energy == pytest.approx(mcmc.compute_energy()[0])
+
+
+def test_pot_energy_with_offset_data(cu_mcmc, tmp_path):
+    offset_data_path = tmp_path / "offset_data.json"
+    offset_data_path.write_text(json.dumps(offset_data))
+    pot = [-0.5]
+    mcmc, run_kwargs = cu_mcmc(
+        height=1.3,
+        adsorbates=["O"],
+        offset_data=str(offset_data_path),
+        run_kwargs={"pot": pot},
+    )
+    mcmc.prepare_run(**run_kwargs)
+
+    # once O is in the slab, the chain moves by differences of the excess relative to Cu
+    moves = [(0, "O"), (1, "O"), (0, "None"), (2, "O"), (1, "None")]
+    for k, (site_idx, end_ads) in enumerate(moves):
+        pot_energy = mcmc.get_pot_energy()
+        mcmc.slab, mcmc.state, delta_pot, _, _ = change_site(
+            mcmc.slab,
+            mcmc.state,
+            pot,
+            mcmc.adsorbates,
+            mcmc.ads_coords,
+            site_idx,
+            end_ads=end_ads,
+            reference_energies=mcmc.reference_energies,
+            composition=mcmc.composition,
+        )
+        if k > 0:
+            assert mcmc.get_pot_energy() - pot_energy == pytest.approx(delta_pot)
+
+    num_O = np.count_nonzero(mcmc.state)
+    assert mcmc.get_pot_energy() == pytest.approx(pot[0] * (num_O - 8))
+
+
+def test_replica_exchange_offset_pot_energies(cu_mcmc, tmp_path):
+    offset_data_path = tmp_path / "offset_data.json"
+    offset_data_path.write_text(json.dumps(offset_data))
+    mcmc, run_kwargs = cu_mcmc(
+        height=1.3,
+        adsorbates=["O"],
+        screening="unrelaxed",
+        offset_data=str(offset_data_path),
+    )
+
+    pots = [[-5.0], [5.0]]
+    exchange = ReplicaExchange(mcmc, temps=[0.5, 1.0], pots=pots, seed=0)
+    exchange.run_folder = str(tmp_path)
+    energies, pot_energies = exchange.start(
+        total_sweeps=1, sweep_size=8, slab=run_kwargs["slab"]
+    )
+    try:
+        for k in range(2):
+            exchange.send(k, "sweep", (0, exchange.temps[k]))
+        for k in range(2):
+            energies[k], pot_energies[k] = exchange.recv(k)
+
+        # the swap criterion uses the chemical potential energies the chains sample with
+        reference_energies = load_reference_energies(str(offset_data_path))
+        for k in range(2):
+            exchange.send(k, "get_configuration")
+            composition = reference_energies.get_composition(exchange.recv(k)["slab"])
+            for m in range(2):
+                assert pot_energies[k, m] == pytest.approx(
+                    reference_energies.get_pot_energy(composition, {"O": pots[m][0]})
+                )
+        assert pot_energies[1, 1] != 0.0
+
+        for k in range(2):
+            exchange.send(k, "finish")
+        for k in range(2):
+            exchange.recv(k)
+    finally:
+        exchange.terminate()
+
+
+def test_no_fork_with_cuda(cu_mcmc, monkeypatch):
+    monkeypatch.setattr(torch.cuda, "is_initialized", lambda: True)
+    mcmc, run_kwargs = cu_mcmc()
+    exchange = ReplicaExchange(mcmc, temps=[1.0, 1.0], pots=[[0.0], [0.0]])
+    with pytest.raises(RuntimeError):
+        exchange.start(total_sweeps=1, sweep_size=4, slab=run_kwargs["slab"])
+    assert not exchange.processes
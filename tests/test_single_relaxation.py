@@ -0,0 +1,43 @@
+import numpy as np
+from ase.calculators.calculator import all_changes
+from ase.calculators.emt import EMT
+from nff.io.ase import AtomsBatch
+
+from mcmc.energy import evaluate_slab
+
+
+class CountingEMT(EMT):
+    """EMT that counts its calculations and stores the results on the atoms like NeuralFF."""
+
+    def __init__(self):
+        super().__init__()
+        self.num_calculations = 0
+
+    def calculate(self, atoms=None, properties=None, system_changes=all_changes):
+        super().calculate(atoms, ["energy", "forces"], system_changes)
+        self.num_calculations += 1
+        atoms.results = {
+            "energy": self.results["energy"],
+            "forces": self.results["forces"],
+            "energy_std": 0.0,
+            "forces_std": np.zeros_like(self.results["forces"]),
+        }
+
+
+def test_one_calculation_per_step(cu_adatom_slab):
+    batch = AtomsBatch(cu_adatom_slab(), cutoff=5.0, device="cpu")
+    batch.calc = CountingEMT()
+
+    relax_steps = 3
+    results, relaxed_slab = evaluate_slab(
+        batch, relax=True, relax_steps=relax_steps, optimizer="BFGS"
+    )
+
+    # the unrelaxed check seeds the first optimizer step, and the last step gives the results
+    assert batch.calc.num_calculations == relax_steps + 1
+    assert not np.allclose(relaxed_slab.positions, batch.positions)
+
+    reference = relaxed_slab.copy()
+    reference.calc = EMT()
+    assert np.isclose(results[0], reference.get_potential_energy())
+    assert np.isclose(results[2], np.abs(reference.get_forces()).max())
@@ -0,0 +1,110 @@
+import logging
+import os
+
+import numpy as np
+import pytest
+from ase.build import fcc100
+from ase.calculators.emt import EMT
+from catkit.gen.utils import trilaterate
+from scipy.sparse import csr_matrix, issparse
+
+import mcmc.mcmc as mcmc_module
+from mcmc import MCMC
+from mcmc.slab import SiteCache, trilaterate_sites
+
+
+@pytest.mark.parametrize("num_centers", [1, 2, 3, 4])
+def test_trilaterate_sites(num_centers):
+    rng = np.random.default_rng(0)
+    centers = rng.uniform(0, 3, size=(20, num_centers, 3))
+    centers[..., 2] = 0.0
+    r = rng.uniform(1.5, 2.5, size=(20, num_centers))
+    zvectors = rng.normal(size=(20, 3))
+    zvectors /= np.linalg.norm(zvectors, axis=1)[:, None]
+
+    positions = trilaterate_sites(centers, r, zvectors)
+    with np.errstate(invalid="ignore"):
+        expected = [trilaterate(c, d, z) for c, d, z in zip(centers, r, zvectors)]
+    assert np.allclose(positions, expected)
+
+
+def test_site_cache(tmp_path):
+    slab = fcc100("Cu", size=(2, 2, 2), vacuum=10.0)
+    cache = SiteCache(str(tmp_path), slab, "O")
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return np.eye(3), csr_matrix(np.eye(3, dtype=bool))
+
+    dense, sparse = cache.get("table", compute, cutoff=1.0)
+    cached_dense, cached_sparse = cache.get("table", compute, cutoff=1.0)
+    assert len(calls) == 1
+    assert np.array_equal(cached_dense, dense)
+    assert issparse(cached_sparse)
+    assert np.array_equal(cached_sparse.toarray(), sparse.toarray())
+
+    # other settings, adsorbates and slabs have their own entries
+    cache.get("table", compute, cutoff=2.0)
+    SiteCache(str(tmp_path), slab, "N").get("table", compute, cutoff=1.0)
+    slab.positions[0, 2] += 0.1
+    SiteCache(str(tmp_path), slab, "O").get("table", compute, cutoff=1.0)
+    assert len(calls) == 4
+
+
+def test_mcmc_site_cache(cu_mcmc, tmp_path, caplog):
+    caplog.set_level(logging.INFO, logger="mcmc.slab")
+    cache_folder = str(tmp_path / "sites")
+
+    tables = []
+    for run in range(2):
+        mcmc, run_kwargs = cu_mcmc(
+            require_distance_decay=True,
+            filter_distance=3.0,
+            site_cache=cache_folder,
+            run_kwargs={"run_folder": str(tmp_path / str(run))},
+        )
+        mcmc.prepare_run(**run_kwargs)
+        tables.append(
+            (
+                mcmc.distance_weight_matrix,
+                mcmc.site_conflicts.toarray(),
+                mcmc.substrate_blocked,
+            )
+        )
+        if run == 0:
+            files = sorted(os.listdir(cache_folder))
+
+    # the second run loads the tables of the first run
+    assert len(files) == 2
+    assert sum("loading" in message for message in caplog.messages) == 2
+    assert sorted(os.listdir(cache_folder)) == files
+    for table, cached_table in zip(*tables):
+        assert np.array_equal(table, cached_table)
+    assert tables[0][1].any()
+
+
+@pytest.mark.parametrize("site_cache", [False, True])
+def test_mcmc_generates_sites_once(cu_surface, tmp_path, monkeypatch, site_cache):
+    slab, coords = cu_surface()
+    calls = []
+
+    def generate_adsorption_sites(slab, atom):
+        calls.append(1)
+        return coords, np.full(len(coords), 4)
+
+    monkeypatch.setattr(
+        mcmc_module, "generate_adsorption_sites", generate_adsorption_sites
+    )
+    mcmc = MCMC(
+        calc=EMT(),
+        element="Cu",
+        adsorbates=["Cu"],
+        site_cache=str(tmp_path / "sites") if site_cache else None,
+    )
+    mcmc.slab = slab
+    mcmc.get_adsorption_coords()
+
+    assert len(calls) == 1
+    assert np.array_equal(mcmc.ads_coords, coords)
+    assert np.array_equal(mcmc.connectivity, np.full(len(coords), 4))
@@ -0,0 +1,98 @@
+import random
+
+import numpy as np
+from ase.build import fcc100
+
+import mcmc.slab as slab_module
+from mcmc.slab import (
+    SiteSampler,
+    change_site,
+    get_complementary_idx,
+    get_random_idx,
+    get_sites_by_type,
+)
+from mcmc.utils import SumTree
+
+
+def test_sum_tree():
+    tree = SumTree(np.array([1.0, 0.0, 3.0, 0.0, 4.0]))
+    assert tree.total == 8.0
+    assert [tree.sample(u) for u in (0.0, 0.124, 0.126, 0.49, 0.51, 0.999)] == [
+        0,
+        0,
+        2,
+        2,
+        4,
+        4,
+    ]
+
+    tree.update(4, 0.0)
+    tree.update(1, 2.0)
+    assert tree.total == 6.0
+    assert np.allclose(tree.weights, [1.0, 2.0, 3.0, 0.0, 0.0])
+    assert tree.sample(0.9999999) == 2
+
+
+def test_site_sampler_follows_state(cu_surface):
+    random.seed(0)
+    slab, coords = cu_surface(size=(3, 3, 2), site="top", height=1.8)
+    state = np.zeros(len(coords), dtype=int)
+    sampler = SiteSampler(slab, state, ["O", "H"])
+
+    for _ in range(30):
+        site_idx = random.randrange(len(coords))
+        slab, state, _, _, _ = change_site(
+            slab, state, [0.0, 0.0], ["O", "H"], coords, site_idx
+        )
+        sampler.update(slab, state, [site_idx])
+
+    for species in ("None", "O", "H"):
+        if species == "None":
+            sites = np.flatnonzero(state == 0)
+        else:
+            sites = [
+                i for i, idx in enumerate(state) if idx and slab[idx].symbol == species
+            ]
+        assert np.flatnonzero(sampler.trees[species].weights).tolist() == list(sites)
+
+    site1_idx, site2_idx, type1, type2 = sampler.get_complementary_idx()
+    assert type1 != type2
+    assert sampler.site_species[site1_idx] == type1
+    assert sampler.site_species[site2_idx] == type2
+
+
+def test_random_idx_by_type():
+    random.seed(0)
+    connectivity = np.array([1, 2, 4, 2, 1, 4, 4])
+    sites_by_type = get_sites_by_type(connectivity)
+    for site_type, num_neighbors in [("top", 1), ("bridge", 2), ("hollow", 4)]:
+        sites = {
+            get_random_idx(connectivity, type=site_type, sites_by_type=sites_by_type)
+            for _ in range(20)
+        }
+        assert sites == set(np.flatnonzero(connectivity == num_neighbors))
+
+
+def test_sampler_plots_weights(monkeypatch):
+    plots = []
+    monkeypatch.setattr(
+        slab_module,
+        "plot_specific_weights",
+        lambda coords, weights, site_idx, **kwargs: plots.append((weights, site_idx)),
+    )
+    slab = fcc100("Cu", size=(2, 2, 2), vacuum=10.0)
+    state = np.array([8, 0, 0, 0])
+    slab.append("O")
+    distance_weight_matrix = np.random.default_rng(0).uniform(size=(4, 4))
+
+    site1_idx, _, _, _ = get_complementary_idx(
+        state,
+        slab,
+        require_distance_decay=True,
+        site_sampler=SiteSampler(slab, state, ["O"]),
+        distance_weight_matrix=distance_weight_matrix,
+        plot_weights=True,
+    )
+    assert len(plots) == 1
+    assert plots[0][1] == site1_idx
+    assert np.array_equal(plots[0][0], distance_weight_matrix[site1_idx])
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from catkit.gratoms import Gratoms
+
+from mcmc.slab import change_site, get_slab_snapshot, restore_slab_snapshot
+
+
+@pytest.fixture
+def slab_with_ads(cu_surface):
+    slab, coords = cu_surface(site="top", height=1.8)
+    slab = Gratoms(slab)
+    state = np.zeros(len(coords), dtype=int)
+    for site_idx in (0, 2):
+        slab, state, _, _, _ = change_site(
+            slab, state, [0.0], ["O"], coords, site_idx, end_ads="O"
+        )
+    # bonds of the adsorbates and of the surface atoms after them
+    slab.graph.add_edges_from(
+        [(state[0], 4), (state[2], 6), (state[0], state[2]), (5, 6)], bonds=1
+    )
+    return slab, state, coords
+
+
+def get_graph(slab):
+    nodes = list(slab.graph.nodes)
+    edges = sorted(
+        (min(u, v), max(u, v), d["bonds"]) for u, v, d in slab.graph.edges(data=True)
+    )
+    return nodes, edges
+
+
+@pytest.mark.parametrize(
+    "moves",
+    [
+        [(0, "None")],
+        [(1, "O")],
+        # swap of an adsorbate and an empty site, like a canonical move
+        [(0, "None"), (1, "O")],
+        [(2, "None"), (0, "None")],
+    ],
+)
+def test_restore_after_change_site(slab_with_ads, moves):
+    slab, state, coords = slab_with_ads
+    positions = slab.get_positions()
+    numbers = slab.get_atomic_numbers()
+    graph = slab.graph
+    nodes, edges = get_graph(slab)
+    snapshot = get_slab_snapshot(slab, state)
+
+    new_state = state
+    for site_idx, end_ads in moves:
+        slab, new_state, _, _, _ = change_site(
+            slab, new_state, [0.0], ["O"], coords, site_idx, end_ads=end_ads
+        )
+    assert not np.array_equal(new_state, snapshot["state"])
+
+    new_state, slab = restore_slab_snapshot(slab, snapshot)
+    assert np.array_equal(new_state, [len(numbers) - 2, 0, len(numbers) - 1, 0])
+    assert np.allclose(slab.get_positions(), positions)
+    assert np.array_equal(slab.get_atomic_numbers(), numbers)
+    assert get_graph(slab) == (nodes, edges)
+    if all(end_ads != "None" for _, end_ads in moves):
+        # the graph is not copied when nothing was deleted from it
+        assert slab.graph is graph
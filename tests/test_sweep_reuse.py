@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+import mcmc.mcmc
+from mcmc.energy import optimize_slab
+
+
+@pytest.fixture
+def counted_calls(monkeypatch):
+    calls = {"evaluate_slab": 0, "optimize_slab": 0}
+
+    def counted(name, func):
+        def wrapper(*args, **kwargs):
+            calls[name] += 1
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    for name in calls:
+        monkeypatch.setattr(mcmc.mcmc, name, counted(name, getattr(mcmc.mcmc, name)))
+    return calls
+
+
+def test_sweep_reuses_accepted_results(counted_calls, cu_mcmc):
+    chain, run_kwargs = cu_mcmc(relax=True, optimizer="BFGS", relax_steps=10)
+    chain.prepare_run(**run_kwargs)
+
+    # the end of a sweep doesn't calculate anything, only the proposals are evaluated
+    counted_calls["evaluate_slab"] = 0
+    chain.mcmc_sweep(i=0)
+    assert counted_calls == {"evaluate_slab": 4, "optimize_slab": 0}
+    assert chain.energy_hist[0] == chain.curr_energy
+
+    relaxed_slab, _ = optimize_slab(chain.slab, relax_steps=10, optimizer="BFGS")
+    assert np.allclose(chain.history[0].positions, relaxed_slab.positions)
+
+    # after a new configuration, the end of the sweep evaluates the slab once
+    chain.set_configuration(chain.get_configuration())
+    energy = chain.save_structures(i=1)
+    assert chain.save_structures(i=2) == energy
+    assert counted_calls == {"evaluate_slab": 5, "optimize_slab": 0}
+    assert energy == pytest.approx(chain.energy_hist[0])
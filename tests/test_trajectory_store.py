@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+from ase.build import fcc100
+
+from mcmc.store import TrajectoryStore, read_scalars, read_trajectory
+
+
+def test_store_round_trip(tmp_path):
+    path = str(tmp_path / "trajectory.h5")
+    slabs = [fcc100("Cu", size=(2, 2, n), vacuum=10.0) for n in (2, 3, 4)]
+
+    store = TrajectoryStore(path)
+    for i, slab in enumerate(slabs):
+        store.append("sweeps", slab, state=[i, 0], energy=-float(i))
+    lengths = store.get_lengths()
+    store.append("sweeps", slabs[0], state=[0, 0], energy=1.0)
+    store.truncate(lengths)
+    store.close()
+
+    frames = list(read_trajectory(path))
+    assert len(frames) == len(slabs)
+    for i, (frame, slab) in enumerate(zip(frames, slabs)):
+        assert np.allclose(frame.positions, slab.positions)
+        assert np.array_equal(frame.numbers, slab.numbers)
+        assert np.allclose(frame.cell, slab.cell)
+        assert np.array_equal(frame.info["state"], [i, 0])
+        assert frame.info["energy"] == -i
+
+    assert len(list(read_trajectory(path, start=1, stop=2))) == 1
+
+
+def test_store_buffers_scalar_records(tmp_path):
+    path = str(tmp_path / "trajectory.h5")
+    store = TrajectoryStore(path)
+    for i in range(3):
+        store.append("moves", iteration=i, accept=bool(i % 2))
+    # scalar records are written by the next flush
+    assert "moves" not in store.file
+    store.flush()
+    assert store.file["moves/iteration"][:].tolist() == [0, 1, 2]
+
+    # the lengths of a checkpoint include buffered records, and later ones are dropped
+    store.append("moves", iteration=3, accept=True)
+    lengths = store.get_lengths()
+    assert lengths["moves/iteration"] == 4
+    store.append("moves", iteration=4, accept=False)
+    store.truncate(lengths)
+    store.close()
+
+    moves = read_scalars(path)
+    assert moves["iteration"].tolist() == [0, 1, 2, 3]
+    assert moves["accept"].tolist() == [False, True, False, True]
+
+
+def test_mcmc_trajectory_store(cu_mcmc, tmp_path):
+    mcmc, run_kwargs = cu_mcmc(trajectory_store=True, save_cif=True)
+    _, energy_hist, frac_accept_hist, _, run_folder = mcmc.mcmc_run(**run_kwargs)
+
+    assert not any(name.endswith((".pkl", ".traj")) for name in os.listdir(tmp_path))
+    path = os.path.join(run_folder, "trajectory.h5")
+    sweeps = list(read_trajectory(path))
+    assert [frame.info["energy"] for frame in sweeps] == list(energy_hist)
+    assert [frame.info["frac_accept"] for frame in sweeps] == list(frac_accept_hist)
+    assert len(list(read_trajectory(path, kind="proposals"))) == 12
+
+    moves = read_scalars(path)
+    assert len(moves["accept"]) == 12
+    assert np.mean(moves["accept"]) == np.mean(frac_accept_hist)
@@ -0,0 +1,57 @@
+import numpy as np
+from ase.calculators.emt import EMT
+
+import mcmc.mcmc as mcmc_module
+from mcmc.energy import evaluate_slab
+
+
+def test_evaluate_slab_returns_relaxed_slab(cu_adatom_slab):
+    slab = cu_adatom_slab(size=(2, 2, 2), site_idx=3, site="top", height=2.5)
+    slab.calc = EMT()
+
+    results, relaxed_slab = evaluate_slab(slab, relax=True, relax_steps=5)
+    assert results[0] == relaxed_slab.get_potential_energy()
+    assert not np.allclose(relaxed_slab.positions, slab.positions)
+
+
+def test_warm_start_positions(cu_mcmc, monkeypatch):
+    mcmc, run_kwargs = cu_mcmc(
+        size=(3, 3, 2),
+        site="top",
+        height=1.8,
+        relax=True,
+        relax_steps=5,
+        warm_start=True,
+        run_kwargs={"total_sweeps": 1, "pot": [0.0]},
+    )
+    mcmc.prepare_run(**run_kwargs)
+    coords = mcmc.ads_coords
+
+    # positions the relaxations start from
+    start_positions = []
+
+    def record_evaluate_slab(slab, **kwargs):
+        start_positions.append(slab.get_positions())
+        return evaluate_slab(slab, **kwargs)
+
+    monkeypatch.setattr(mcmc_module, "evaluate_slab", record_evaluate_slab)
+
+    # shifted starting positions, which the ideal sites of the slab can't give
+    num_atoms = len(mcmc.slab)
+    warm_positions = mcmc.slab.get_positions() + [0.0, 0.0, 0.05]
+    mcmc.slab.arrays["relaxed_positions"] = warm_positions.copy()
+    mcmc.change_site(prev_energy=mcmc.curr_energy, site_idx=1)
+
+    assert len(start_positions[0]) == num_atoms + 1
+    assert np.allclose(start_positions[0][:num_atoms], warm_positions)
+    # the new adsorbate starts at its site
+    assert np.allclose(start_positions[0][num_atoms], coords[1])
+
+    for site_idx in range(len(coords)):
+        mcmc.change_site(prev_energy=mcmc.curr_energy, site_idx=site_idx)
+
+        relaxed_positions = mcmc.slab.arrays["relaxed_positions"]
+        assert relaxed_positions.shape == mcmc.slab.positions.shape
+        # the slab itself keeps the adsorbates on their ideal sites
+        occupied = mcmc.state[mcmc.state.nonzero()]
+        assert np.allclose(mcmc.slab.positions[occupied], coords[mcmc.state > 0])